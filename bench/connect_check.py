@@ -0,0 +1,47 @@
+"""Exercise the real ``db.mongo.init_mongo()`` path, which the benches skip.
+
+    python -m bench.connect_check
+    MONGO_URI=mongodb+srv://... python -m bench.connect_check
+
+The other benches install an in-memory client first, so ``init_mongo`` is a
+no-op there. Without MONGO_URI this points at a closed local port with a short
+server-selection timeout: building the client from ``client_options()`` must
+work, the first command must fail with ServerSelectionTimeoutError, and the
+client must be reset so a later call retries. With a real MONGO_URI it
+connects and creates the indexes.
+"""
+import asyncio
+import os
+import sys
+
+_LOCAL = "mongodb://127.0.0.1:9/?directConnection=true"
+os.environ.setdefault("MONGO_URI", _LOCAL)
+os.environ.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", "500")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from pymongo.errors import ServerSelectionTimeoutError  # noqa: E402
+
+from db import mongo  # noqa: E402
+
+
+async def main() -> int:
+    if os.environ["MONGO_URI"] != _LOCAL:
+        await mongo.init_mongo()
+        print(f"connected; indexes ensured on {mongo.MONGO_DB}")
+        return 0
+    try:
+        await mongo.init_mongo()
+    except ServerSelectionTimeoutError:
+        pass
+    else:
+        print("FAIL: init_mongo() connected to a closed port")
+        return 1
+    if mongo.client is not None:
+        print("FAIL: client left set after a failed init_mongo()")
+        return 1
+    print("ok: client built, server selection timed out, client reset for retry")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
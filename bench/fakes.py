@@ -0,0 +1,379 @@
+"""Fake Discord objects for driving the real command callbacks offline.
+
+Channels, threads and members subclass the discord.py types (without calling
+their constructors) so the handlers' ``isinstance`` checks pass. Every REST-like
+call goes through ``SimulatedREST``, which adds latency and enforces simple
+per-route rate-limit buckets (and optionally a global one) so contention
+shows up in the numbers.
+"""
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+
+import discord
+
+_ids = itertools.count(10_000_000)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class SimulatedREST:
+    """Latency plus a ``limit`` calls per ``window`` seconds bucket per route.
+
+    With ``global_limit``, more than that many non-interaction calls per window
+    trips a global rate limit which, like discord.py's, holds *every* request
+    (interaction responses included) until the window resets.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        limit: int = 0,
+        window: float = 1.0,
+        seed: int = 0,
+        global_limit: int = 0,
+        thread_create_latency: float = 0.0,
+    ):
+        self.latency = latency
+        # Extra time for thread creation, one of Discord's slowest routes.
+        self.thread_create_latency = thread_create_latency
+        self.jitter = jitter
+        self.limit = limit
+        self.window = window
+        self.global_limit = global_limit
+        self._random = random.Random(seed)
+        self._buckets: Dict[str, Deque[float]] = defaultdict(deque)
+        self._global: Deque[float] = deque()
+        self._global_until = 0.0
+        self.global_hits = 0
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.throttled: Dict[str, float] = defaultdict(float)
+
+    async def _global_gate(self, route: str):
+        exempt = route.startswith(("POST /interactions", "POST /webhooks"))
+        while True:
+            now = time.perf_counter()
+            if now < self._global_until:
+                self.throttled[route] += self._global_until - now
+                await asyncio.sleep(self._global_until - now)
+                continue
+            if self.global_limit <= 0 or exempt:
+                return
+            while self._global and self._global[0] <= now - self.window:
+                self._global.popleft()
+            if len(self._global) < self.global_limit:
+                self._global.append(now)
+                return
+            # A 429 with the global flag: everything waits for the window to reset.
+            self.global_hits += 1
+            self._global_until = self._global[0] + self.window
+
+    async def call(self, route: str):
+        self.calls[route] += 1
+        await self._global_gate(route)
+        if self.limit > 0:
+            bucket = self._buckets[route]
+            while True:
+                now = time.perf_counter()
+                while bucket and bucket[0] <= now - self.window:
+                    bucket.popleft()
+                if len(bucket) < self.limit:
+                    bucket.append(now)
+                    break
+                wait = bucket[0] + self.window - now
+                self.throttled[route] += wait
+                await asyncio.sleep(wait)
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+
+
+class FakePermissions:
+    def __init__(self, admin: bool = False):
+        self.administrator = admin
+        self.manage_guild = admin
+        self.manage_messages = admin
+        self.create_private_threads = True
+        self.create_public_threads = True
+
+
+class FakeMember(discord.Member):
+    def __init__(self, guild: "FakeGuild", user_id: int, admin: bool = False):
+        self.guild = guild
+        self._fake_id = user_id
+        self._fake_admin = admin
+
+    @property
+    def id(self) -> int:
+        return self._fake_id
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self._fake_id}>"
+
+    @property
+    def display_name(self) -> str:
+        return f"user{self._fake_id}"
+
+    @property
+    def guild_permissions(self):
+        return FakePermissions(self._fake_admin)
+
+    def __str__(self) -> str:
+        return self.display_name
+
+    def __repr__(self) -> str:
+        return f"<FakeMember id={self._fake_id}>"
+
+
+class FakeMessage:
+    def __init__(self, channel, message_id: int, embed=None, content=None):
+        self.channel = channel
+        self.id = message_id
+        self.embed = embed
+        self.content = content
+
+    async def edit(self, embed=None, **_):
+        await self.channel.rest.call(f"PATCH /channels/{self.channel.id}/messages")
+        stored = self.channel.messages.get(self.id)
+        if stored is None:
+            raise discord.NotFound(_FakeResponse(404), "Unknown Message")
+        stored.embed = embed
+        self.channel.edits += 1
+        return stored
+
+
+class _FakeResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "fake"
+
+
+class FakeGuild:
+    def __init__(self, rest: SimulatedREST, guild_id: Optional[int] = None, name: str = "bench-guild"):
+        self.rest = rest
+        self.id = guild_id or next_id()
+        self.name = name
+        self.icon = None
+        self.unavailable = False
+        self.chunked = True
+        self.members: Dict[int, FakeMember] = {}
+        self.channels: Dict[int, object] = {}
+        self.me = self.member(next_id())
+
+    def member(self, user_id: int, admin: bool = False) -> FakeMember:
+        m = self.members.get(user_id)
+        if m is None:
+            m = self.members[user_id] = FakeMember(self, user_id, admin)
+        return m
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+
+class FakeTextChannel(discord.TextChannel):
+    def __init__(self, client: "FakeClient", guild: FakeGuild, name: str = "queue", channel_id: Optional[int] = None):
+        self.id = channel_id or next_id()
+        self.name = name
+        self.guild = guild
+        self.rest = guild.rest
+        self.client = client
+        self.messages: Dict[int, FakeMessage] = {}
+        self.created_threads: Dict[int, "FakeThread"] = {}
+        self.sends = 0
+        self.edits = 0
+        client.channels[self.id] = self
+        guild.channels[self.id] = self
+        client.guilds[guild.id] = guild
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    def permissions_for(self, obj):
+        return FakePermissions(admin=True)
+
+    async def send(self, content=None, embed=None, **_):
+        await self.rest.call(f"POST /channels/{self.id}/messages")
+        msg = FakeMessage(self, next_id(), embed=embed, content=content)
+        self.messages[msg.id] = msg
+        self.sends += 1
+        return msg
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self, message_id)
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self.rest.call(f"GET /channels/{self.id}/messages")
+        msg = self.messages.get(message_id)
+        if msg is None:
+            raise discord.NotFound(_FakeResponse(404), "Unknown Message")
+        return msg
+
+    async def purge(self, limit=None, **_):
+        await self.rest.call(f"POST /channels/{self.id}/messages/bulk-delete")
+        removed = list(self.messages.values())
+        self.messages.clear()
+        return removed
+
+    async def create_thread(self, name: str, type=None, **_):
+        await self.rest.call(f"POST /channels/{self.id}/threads")
+        if self.rest.thread_create_latency > 0:
+            await asyncio.sleep(self.rest.thread_create_latency)
+        thread = FakeThread(self, name, type or discord.ChannelType.private_thread)
+        self.created_threads[thread.id] = thread
+        self.client.channels[thread.id] = thread
+        return thread
+
+
+class FakeThread(discord.Thread):
+    def __init__(self, parent: FakeTextChannel, name: str, type: discord.ChannelType):
+        self.id = next_id()
+        self.name = name
+        self.guild = parent.guild
+        self._type = type
+        self._fake_parent = parent
+        self._fake_members: Dict[int, discord.abc.Snowflake] = {}
+        self.archived = False
+        self.rest = parent.rest
+        self.sent: List[str] = []
+        self.deleted = False
+
+    @property
+    def parent(self):
+        return self._fake_parent
+
+    @property
+    def members(self):
+        return list(self._fake_members.values())
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    async def add_user(self, user):
+        await self.rest.call(f"PUT /channels/{self.id}/thread-members")
+        self._fake_members[user.id] = user
+
+    async def remove_user(self, user):
+        await self.rest.call(f"DELETE /channels/{self.id}/thread-members")
+        self._fake_members.pop(user.id, None)
+
+    async def fetch_members(self):
+        await self.rest.call(f"GET /channels/{self.id}/thread-members")
+        return list(self._fake_members.values())
+
+    async def purge(self, limit=None, **_):
+        await self.rest.call(f"GET /channels/{self.id}/messages")
+        removed = self.sent[:limit] if limit is not None else list(self.sent)
+        if removed:
+            await self.rest.call(f"POST /channels/{self.id}/messages/bulk-delete")
+        del self.sent[:len(removed)]
+        return removed
+
+    async def send(self, content=None, **_):
+        await self.rest.call(f"POST /channels/{self.id}/messages")
+        self.sent.append(content or "")
+        return FakeMessage(self, next_id(), content=content)
+
+    async def edit(self, **kwargs):
+        await self.rest.call(f"PATCH /channels/{self.id}")
+        if "archived" in kwargs:
+            self.archived = kwargs["archived"]
+        if "name" in kwargs:
+            self.name = kwargs["name"]
+        return self
+
+    async def delete(self, reason=None):
+        await self.rest.call(f"DELETE /channels/{self.id}")
+        self.deleted = True
+        self._fake_parent.created_threads.pop(self.id, None)
+        self._fake_parent.client.channels.pop(self.id, None)
+
+
+class FakeClient:
+    def __init__(self, rest: SimulatedREST):
+        self.rest = rest
+        self.channels: Dict[int, object] = {}
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.user = None
+
+    def is_ready(self) -> bool:
+        return True
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guilds.get(guild_id)
+
+    async def fetch_channel(self, channel_id: int):
+        await self.rest.call("GET /channels")
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            raise discord.NotFound(_FakeResponse(404), "Unknown Channel")
+        return channel
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _ack(self):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)  # type: ignore[arg-type]
+        await self._interaction.rest.call("POST /interactions/callback")
+        self._done = True
+        self._interaction.acked_at = time.perf_counter()
+
+    async def send_message(self, content=None, embed=None, ephemeral: bool = False, **_):
+        await self._ack()
+        self._interaction.replies.append(content if content is not None else embed)
+
+    async def defer(self, ephemeral: bool = False, thinking: bool = False):
+        await self._ack()
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+
+    async def send(self, content=None, embed=None, ephemeral: bool = False, **_):
+        await self._interaction.rest.call("POST /webhooks/followup")
+        self._interaction.replies.append(content if content is not None else embed)
+
+
+class FakeInteraction:
+    def __init__(self, client: FakeClient, channel: FakeTextChannel, user: FakeMember):
+        self.client = client
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.user = user
+        self.rest = channel.rest
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.replies: list = []
+        self.extras: dict = {}
+        self.created_at = time.perf_counter()
+        self.acked_at: Optional[float] = None
+
+    @property
+    def ack_latency(self) -> Optional[float]:
+        return None if self.acked_at is None else self.acked_at - self.created_at
@@ -0,0 +1,107 @@
+"""Micro-benchmark for rating matchmaking: group selection and team balancing.
+
+    python -m bench.match_bench
+    python -m bench.match_bench --waiting 1000 10000 50000 --repeat 2000
+
+"join" is what /join pays with N players already waiting: insert into the
+sorted index and check only the windows around the newcomer. "full" is the
+scan after a leave (every window). Team splits are timed for a 10-player lobby
+(exhaustive, with and without numpy) and for larger lobbies (greedy); "gap"
+is the mean difference between team rating totals.
+"""
+import argparse
+import random
+import time
+
+from core import matchmaking
+from core.matchmaking import RatingIndex, split_teams
+
+
+def _time(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def _index(rng: random.Random, waiting: int, size: int):
+    ratings = {}
+    index = RatingIndex(lambda uid: ratings[uid])
+    for uid in range(waiting):
+        ratings[uid] = rng.gauss(1500, 300)
+        index.add(uid)
+    # Settle the post-build scan so "join" measures the incremental path.
+    index.closest_group(size, max_spread=1e-9)
+    return index, ratings
+
+
+def bench_groups(waiting_sizes, size: int, repeat: int, seed: int):
+    rows = []
+    for waiting in waiting_sizes:
+        rng = random.Random(seed)
+        index, ratings = _index(rng, waiting, size)
+        next_uid = [waiting]
+
+        def join():
+            uid = next_uid[0]
+            next_uid[0] += 1
+            ratings[uid] = rng.gauss(1500, 300)
+            index.add(uid)
+            # A spread no real window meets, so nothing is removed and N stays put.
+            index.closest_group(size, around=uid, max_spread=1e-9)
+
+        join_us = _time(join, repeat) * 1e6
+        full_us = _time(lambda: index.closest_group(size), max(repeat // 10, 1)) * 1e6
+        rows.append((f"group n={size}", f"waiting={waiting}", join_us, full_us))
+    return rows
+
+
+def _split_row(label: str, lobby: int, repeat: int, seed: int):
+    rng = random.Random(seed)
+    lobbies = [[rng.gauss(1500, 300) for _ in range(lobby)] for _ in range(64)]
+    gaps = []
+    for ratings in lobbies:
+        first, second = split_teams(ratings)
+        gaps.append(abs(sum(ratings[i] for i in first) - sum(ratings[i] for i in second)))
+    it = iter(lobbies * (repeat // len(lobbies) + 1))
+    us = _time(lambda: split_teams(next(it)), repeat) * 1e6
+    return (f"split {label}", f"players={lobby}", us, sum(gaps) / len(gaps))
+
+
+def bench_splits(lobbies, repeat: int, seed: int):
+    rows = []
+    for lobby in lobbies:
+        label = "exhaustive" if lobby <= matchmaking.TEAM_EXHAUSTIVE_MAX else "greedy"
+        rows.append(_split_row(label, lobby, repeat, seed))
+        if label == "exhaustive" and matchmaking.np is not None:
+            saved = matchmaking.np
+            matchmaking.np = None
+            matchmaking._splits.cache_clear()
+            try:
+                rows.append(_split_row("exhaustive (no numpy)", lobby, max(repeat // 10, 1), seed))
+            finally:
+                matchmaking.np = saved
+                matchmaking._splits.cache_clear()
+    return rows
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m bench.match_bench", description=__doc__.split("\n\n")[0])
+    p.add_argument("--waiting", type=int, nargs="+", default=[100, 1000, 10000])
+    p.add_argument("--lobbies", type=int, nargs="+", default=[10, 12, 20, 50])
+    p.add_argument("--size", type=int, default=10, help="players per match")
+    p.add_argument("--repeat", type=int, default=1000)
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args(argv)
+    matchmaking._load_numpy()
+    print(f"numpy: {'yes' if matchmaking.np is not None else 'no'}")
+    print(f"{'case':<28}  {'size':<15}  {'join_us':>10}  {'full_us':>10}")
+    for case, size, join_us, full_us in bench_groups(args.waiting, args.size, args.repeat, args.seed):
+        print(f"{case:<28}  {size:<15}  {join_us:>10.1f}  {full_us:>10.1f}")
+    print(f"{'case':<28}  {'size':<15}  {'split_us':>10}  {'gap':>10}")
+    for case, size, us, gap in bench_splits(args.lobbies, args.repeat, args.seed):
+        print(f"{case:<28}  {size:<15}  {us:>10.1f}  {gap:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
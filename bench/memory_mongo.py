@@ -0,0 +1,289 @@
+"""In-memory stand-in for the Motor collections used by ``db.mongo``.
+
+Implements just the query and update surface the bot uses (equality, ``$lt``,
+``$in``, ``$exists``, ``$or``; ``$set``, ``$inc``, ``$push``; upserts; bulk_write of
+UpdateOne / DeleteOne). An optional per-operation latency approximates a network round trip.
+"""
+import asyncio
+import copy
+import itertools
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+_MISSING = object()
+
+
+def _get(doc: dict, path: str):
+    cur: Any = doc
+    for part in path.split("."):
+        if isinstance(cur, dict):
+            cur = cur.get(part, _MISSING)
+        elif isinstance(cur, list) and part.isdigit():
+            idx = int(part)
+            cur = cur[idx] if idx < len(cur) else _MISSING
+        else:
+            return _MISSING
+        if cur is _MISSING:
+            return _MISSING
+    return cur
+
+
+def _match_value(value, cond) -> bool:
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif op == "$in":
+                if value is _MISSING or value not in arg:
+                    return False
+            elif op == "$lt":
+                if value is _MISSING or not value < arg:
+                    return False
+            elif op == "$gt":
+                if value is _MISSING or not value > arg:
+                    return False
+            elif op == "$ne":
+                if value == arg or (isinstance(value, list) and arg in value):
+                    return False
+            else:
+                raise NotImplementedError(f"query operator {op}")
+        return True
+    return value is not _MISSING and value == cond
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for k, v in (query or {}).items():
+        if k == "$or":
+            if not any(matches(doc, clause) for clause in v):
+                return False
+        elif not _match_value(_get(doc, k), v):
+            return False
+    return True
+
+
+def _apply_update(doc: dict, update: dict):
+    for op, fields in update.items():
+        if op == "$set":
+            doc.update(copy.deepcopy(fields))
+        elif op == "$inc":
+            for k, v in fields.items():
+                doc[k] = doc.get(k, 0) + v
+        elif op == "$push":
+            for k, v in fields.items():
+                each = v["$each"] if isinstance(v, dict) and "$each" in v else [v]
+                items = doc.get(k, []) + copy.deepcopy(list(each))
+                if isinstance(v, dict) and "$slice" in v:
+                    items = items[v["$slice"]:] if v["$slice"] < 0 else items[: v["$slice"]]
+                doc[k] = items
+        elif op == "$setOnInsert":
+            continue
+        else:
+            raise NotImplementedError(f"update operator {op}")
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+    if projection.get("_id", 1) and "_id" in doc:
+        out["_id"] = doc["_id"]
+    return out
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[tuple] = []
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        self._sort = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def hint(self, _index):
+        return self
+
+    async def to_list(self, length=None):
+        return [doc async for doc in self]
+
+    async def __aiter__(self):
+        await self._collection._roundtrip()
+        docs = [d for d in self._collection.docs.values() if matches(d, self._query)]
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda d: _get(d, key), reverse=direction == -1)
+        if self._limit:
+            docs = docs[: self._limit]
+        for doc in docs:
+            yield _project(doc, self._projection)
+
+
+class InsertResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class WriteResult:
+    def __init__(self, matched: int = 0, modified: int = 0, deleted: int = 0, upserted_id=None):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.deleted_count = deleted
+        self.upserted_id = upserted_id
+
+
+class MemoryCollection:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.docs: Dict[Any, dict] = {}
+        self.indexes: List[str] = []
+        self.ops: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+
+    async def _roundtrip(self, op: str = "find"):
+        self.ops[op] = self.ops.get(op, 0) + 1
+        await asyncio.sleep(self.latency)
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> MemoryCursor:
+        return MemoryCursor(self, query, projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        await self._roundtrip("find_one")
+        return self._find_one(query, projection)
+
+    def _find_one(self, query, projection=None):
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            doc = self.docs.get(query["_id"])
+            return _project(doc, projection) if doc is not None else None
+        for doc in self.docs.values():
+            if matches(doc, query):
+                return _project(doc, projection)
+        return None
+
+    async def insert_one(self, doc: dict):
+        await self._roundtrip("insert_one")
+        return InsertResult(self._insert(doc))
+
+    def _insert(self, doc: dict):
+        doc = copy.deepcopy(doc)
+        _id = doc.setdefault("_id", next(self._ids))
+        if _id in self.docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} _id: {_id!r}")
+        self.docs[_id] = doc
+        return _id
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        await self._roundtrip("update_one")
+        return self._update(query, update, upsert)
+
+    def _update(self, query: dict, update: dict, upsert: bool) -> WriteResult:
+        target = None
+        if set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            target = self.docs.get(query["_id"])
+        else:
+            target = next((d for d in self.docs.values() if matches(d, query)), None)
+        if target is not None:
+            _apply_update(target, update)
+            return WriteResult(matched=1, modified=1)
+        if not upsert:
+            return WriteResult()
+        doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+        _apply_update(doc, update)
+        _apply_update(doc, {"$set": update.get("$setOnInsert", {})})
+        return WriteResult(upserted_id=self._insert(doc))
+
+    async def delete_one(self, query: dict):
+        await self._roundtrip("delete_one")
+        return self._delete(query, many=False)
+
+    async def delete_many(self, query: dict):
+        await self._roundtrip("delete_many")
+        return self._delete(query, many=True)
+
+    def _delete(self, query: dict, many: bool) -> WriteResult:
+        victims = [k for k, d in self.docs.items() if matches(d, query)]
+        if not many:
+            victims = victims[:1]
+        for k in victims:
+            del self.docs[k]
+        return WriteResult(deleted=len(victims))
+
+    async def bulk_write(self, requests: Iterable, ordered: bool = True):
+        await self._roundtrip("bulk_write")
+        result = WriteResult()
+        errors = []
+        for index, req in enumerate(requests):
+            try:
+                if isinstance(req, UpdateOne):
+                    r = self._update(req._filter, req._doc, bool(req._upsert))
+                    result.matched_count += r.matched_count
+                    result.modified_count += r.modified_count
+                elif isinstance(req, DeleteOne):
+                    result.deleted_count += self._delete(req._filter, many=False).deleted_count
+                else:
+                    raise NotImplementedError(type(req).__name__)
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nModified": result.modified_count})
+        return result
+
+    async def create_index(self, keys, name: Optional[str] = None, **_):
+        await self._roundtrip("create_index")
+        self.indexes.append(name or str(keys))
+        return name
+
+    async def drop_index(self, name: str):
+        await self._roundtrip("drop_index")
+        if name not in self.indexes:
+            raise OperationFailure(f"index not found with name [{name}]", code=27)
+        self.indexes.remove(name)
+
+    async def count_documents(self, query: dict):
+        await self._roundtrip("count_documents")
+        return sum(1 for d in self.docs.values() if matches(d, query))
+
+
+class MemoryDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        col = self._collections.get(name)
+        if col is None:
+            col = self._collections[name] = MemoryCollection(name, self.latency)
+        return col
+
+    def op_counts(self) -> Dict[str, int]:
+        return {f"{name}.{op}": n for name, col in self._collections.items() for op, n in col.ops.items()}
+
+
+async def install(latency: float = 0.0) -> MemoryDatabase:
+    """Point ``db.mongo``'s collection globals at a fresh in-memory database."""
+    from db import mongo
+
+    memdb = MemoryDatabase(latency)
+    mongo.client = memdb  # non-None so init_mongo() is a no-op
+    mongo.db = memdb
+    mongo.queues_col = memdb["queues"]
+    mongo.matches_col = memdb["matches"]
+    mongo.cleanups_col = memdb["thread_cleanups"]
+    mongo.meta_col = memdb["meta"]
+    mongo.members_col = memdb["queue_members"]
+    mongo.stats_col = memdb["match_stats"]
+    await mongo.ensure_indexes()
+    mongo.QUEUE_WRITES.start(mongo.queues_col)
+    mongo.CLEANUP_WRITES.start(mongo.cleanups_col)
+    return memdb
@@ -0,0 +1,80 @@
+"""Micro-benchmark: full queue-embed rebuild vs the incremental render cache.
+
+    python -m bench.render_bench
+    python -m bench.render_bench --sizes 10 100 1000 5000 --repeat 500
+
+For each queue size it times three steps the renderer sees: one user joins,
+a user in the middle leaves, and a flush with nothing changed. "full" is the
+previous path (rebuild the embed and hash its dict); "cached" is
+QueueEmbedCache.update + signature, building an Embed only when it changed.
+"""
+import argparse
+import json
+import time
+
+from bench.fakes import FakeClient, FakeGuild, FakeTextChannel, SimulatedREST
+from utils.embeds import QueueEmbedCache, build_queue_embed
+
+
+def _full(channel, ids):
+    payload = build_queue_embed(channel, ids).to_dict()
+    payload.pop("timestamp", None)
+    return json.dumps(payload, sort_keys=True)
+
+
+def _cached(cache: QueueEmbedCache, channel, ids, last: list):
+    cache.update(ids)
+    signature = cache.signature(channel)
+    if signature != last[0]:
+        cache.build(channel)
+        last[0] = signature
+    return signature
+
+
+def _steps(n: int):
+    base = list(range(1_000_000, 1_000_000 + n))
+    joined = base + [2_000_000]
+    left = base[: n // 2] + base[n // 2 + 1:]
+    return base, {"join": joined, "leave": left, "noop": base}
+
+
+def _time(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def run(sizes, repeat: int):
+    rest = SimulatedREST()
+    channel = FakeTextChannel(FakeClient(rest), FakeGuild(rest))
+    rows = []
+    for n in sizes:
+        base, steps = _steps(n)
+        for step, target in steps.items():
+            # Each sample is a round trip base -> target -> base, so both paths
+            # see the same amount of change; report the per-render average.
+            full = _time(lambda: (_full(channel, target), _full(channel, base)), repeat) / 2
+            cache = QueueEmbedCache()
+            last = [None]
+            _cached(cache, channel, base, last)
+            cached = _time(
+                lambda: (_cached(cache, channel, target, last), _cached(cache, channel, base, last)), repeat
+            ) / 2
+            rows.append((n, step, full * 1e6, cached * 1e6))
+    return rows
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m bench.render_bench", description=__doc__.split("\n\n")[0])
+    p.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    p.add_argument("--repeat", type=int, default=200)
+    args = p.parse_args(argv)
+    print(f"{'users':>6}  {'step':<6}  {'full_us':>10}  {'cached_us':>10}  {'speedup':>8}")
+    for n, step, full, cached in run(args.sizes, args.repeat):
+        speedup = full / cached if cached else float("inf")
+        print(f"{n:>6}  {step:<6}  {full:>10.1f}  {cached:>10.1f}  {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
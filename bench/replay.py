@@ -0,0 +1,197 @@
+"""Replay a command trace (core.trace) through the real handlers against the fakes.
+
+    TRACE_PATH=trace.jsonl python -m bench.run rush       # or a production trace
+    python -m bench.replay trace.jsonl --speed 10
+    python -m bench.replay trace.jsonl --speed 0 --save-state before.json
+    python -m bench.replay trace.jsonl --speed 0 --compare before.json
+
+Records are fed at their recorded offsets divided by ``--speed``; 0 runs them
+back to back, one at a time, which is fully deterministic. Guild, channel and
+user ids are kept, so final states from two builds can be diffed. Reports
+per-command handler latency (recorded vs replayed), outcomes that differ from
+the trace, and the final queue state. As in bench.run, cooldowns and rate
+limits are off unless set in the environment, so "rate_limited" outcomes
+will not reproduce.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+os.environ.pop("TRACE_PATH", None)  # don't append the replay to a trace
+
+from bench.fakes import FakeGuild, FakeInteraction, FakeTextChannel  # noqa: E402
+from bench.run import Harness, percentile  # noqa: E402
+
+_ADMIN = frozenset(("setup", "cancel"))
+
+
+def load_trace(path: str) -> List[dict]:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            if rec.get("g") and rec.get("c") and rec.get("cmd"):
+                records.append(rec)
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+class Replayer:
+    def __init__(self, h: Harness):
+        from commands.admin import cancel_cmd, setup_cmd
+        from commands.user import join_cmd, leave_cmd
+
+        self.h = h
+        self.commands = {"join": join_cmd, "leave": leave_cmd, "setup": setup_cmd, "cancel": cancel_cmd}
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.channels: Dict[int, FakeTextChannel] = {}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.recorded: Dict[str, List[float]] = defaultdict(list)
+        self.mismatches: Counter = Counter()
+        self.skipped = 0
+
+    def _channel(self, guild_id: int, channel_id: int) -> FakeTextChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            guild = self.guilds.get(guild_id)
+            if guild is None:
+                guild = self.guilds[guild_id] = FakeGuild(self.h.rest, guild_id=guild_id)
+            channel = self.channels[channel_id] = FakeTextChannel(
+                self.h.client, guild, name=f"queue-{channel_id}", channel_id=channel_id
+            )
+        return channel
+
+    async def invoke(self, rec: dict):
+        command = self.commands.get(rec["cmd"])
+        if command is None:
+            self.skipped += 1
+            return
+        channel = self._channel(rec["g"], rec["c"])
+        member = channel.guild.member(rec["u"])
+        if rec["cmd"] in _ADMIN:
+            member._fake_admin = True
+        interaction = FakeInteraction(self.h.client, channel, member)
+        started = time.perf_counter()
+        try:
+            await command.callback(interaction)
+            outcome = interaction.extras.get("outcome", "ok")
+        except Exception as exc:
+            outcome = f"error:{type(exc).__name__}"
+        self.latencies[rec["cmd"]].append(time.perf_counter() - started)
+        if "ms" in rec:
+            self.recorded[rec["cmd"]].append(rec["ms"] / 1000)
+        if "out" in rec and rec["out"] != outcome:
+            self.mismatches[(rec["cmd"], rec["out"], outcome)] += 1
+
+    async def run(self, records: List[dict], speed: float):
+        if speed <= 0:
+            for rec in records:
+                await self.invoke(rec)
+            return
+        tasks = []
+        origin = records[0]["t"] if records else 0.0
+        started = time.perf_counter()
+        for rec in records:
+            delay = started + (rec["t"] - origin) / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.invoke(rec)))
+        await asyncio.gather(*tasks)
+
+
+def final_state() -> Dict[str, dict]:
+    from core.state import STATE
+
+    return {
+        str(channel_id): {
+            "queue": data.queue.ids(),
+            "embed": data.embed_msg_id is not None,
+            "thread": data.queue_thread_id is not None,
+        }
+        for channel_id, data in sorted(STATE.items())
+    }
+
+
+def diff_states(before: Dict[str, dict], after: Dict[str, dict]) -> List[str]:
+    lines = []
+    for channel_id in sorted(set(before) | set(after), key=int):
+        a, b = before.get(channel_id), after.get(channel_id)
+        if a == b:
+            continue
+        if a is None or b is None:
+            lines.append(f"channel {channel_id}: only in {'replay' if a is None else 'baseline'}")
+            continue
+        for key in ("queue", "embed", "thread"):
+            if a[key] != b[key]:
+                shown = (a[key], b[key]) if key != "queue" else (f"{len(a[key])} queued", f"{len(b[key])} queued")
+                lines.append(f"channel {channel_id}: {key} {shown[0]} -> {shown[1]}")
+    return lines
+
+
+def _ms(samples: List[float], pct: float) -> str:
+    return f"{percentile(samples, pct) * 1000:.1f}" if samples else "-"
+
+
+async def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m bench.replay", description=__doc__.split("\n\n")[0])
+    p.add_argument("trace", help="JSONL written with TRACE_PATH set")
+    p.add_argument("--speed", type=float, default=1.0, help="time compression (1 = real time, 0 = back to back)")
+    p.add_argument("--save-state", metavar="PATH", help="write the final queue state as JSON")
+    p.add_argument("--compare", metavar="PATH", help="diff the final state against a --save-state file")
+    p.add_argument("--rest-latency", type=float, default=0.02)
+    p.add_argument("--rest-jitter", type=float, default=0.01)
+    p.add_argument("--rest-limit", type=int, default=0)
+    p.add_argument("--rest-global", type=int, default=0)
+    p.add_argument("--mongo-latency", type=float, default=0.002)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+
+    records = load_trace(args.trace)
+    h = Harness(args)
+    await h.start()
+    replayer = Replayer(h)
+    started = time.perf_counter()
+    await replayer.run(records, args.speed)
+    elapsed = time.perf_counter() - started
+    await h.settle()
+
+    span = records[-1]["t"] - records[0]["t"] if records else 0.0
+    print(f"{len(records)} records spanning {span:.1f}s replayed in {elapsed:.2f}s (speed {args.speed:g})")
+    print(f"{'command':<8}  {'n':>6}  {'rec_p50':>8}  {'rec_p99':>8}  {'p50_ms':>8}  {'p90_ms':>8}  {'p99_ms':>8}  {'max_ms':>8}")
+    for cmd, samples in sorted(replayer.latencies.items()):
+        rec = replayer.recorded.get(cmd, [])
+        print(
+            f"{cmd:<8}  {len(samples):>6}  {_ms(rec, 50):>8}  {_ms(rec, 99):>8}  {_ms(samples, 50):>8}  "
+            f"{_ms(samples, 90):>8}  {_ms(samples, 99):>8}  {_ms(samples, 100):>8}"
+        )
+    if replayer.skipped:
+        print(f"skipped {replayer.skipped} records for commands without a replay handler")
+    total = sum(replayer.mismatches.values())
+    print(f"outcomes differing from the trace: {total}")
+    for (cmd, was, now), n in replayer.mismatches.most_common(10):
+        print(f"  {cmd}: {was} -> {now} x{n}")
+
+    state = final_state()
+    queued = sum(len(c["queue"]) for c in state.values())
+    print(f"final state: {len(state)} channels, {queued} queued, {sum(h.rest.calls.values())} REST calls")
+    if args.save_state:
+        with open(args.save_state, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines = diff_states(baseline, state)
+        print(f"channels differing from {args.compare}: {len(lines)}")
+        for line in lines[:20]:
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
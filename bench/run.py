@@ -0,0 +1,352 @@
+"""Load scenarios for the real /join and /leave callbacks.
+
+    python -m bench.run                       # all scenarios, default sizes
+    python -m bench.run rush --users 2000 --rest-latency 0.05
+    python -m bench.run churn --rest-limit 50 --json
+    python -m bench.run background --rest-global 50
+    THREAD_POOL_SIZE=1 python -m bench.run lobbies --thread-latency 0.3    # pool is off by default
+
+Each scenario reports ops/sec over the command phase, p50/p99 time-to-ack
+(interaction created -> response sent), the time for background effects to
+settle, the simulated REST and Mongo call counts, and time until a new lobby
+has its queue thread (lobbies scenario) with the thread pool hit rate.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Dict, List
+
+# Cooldowns and rate limits would dominate the numbers; turn them off unless the
+# caller set them explicitly. Must happen before config is imported.
+for _key, _value in (
+    ("COOLDOWN_JOIN_SEC", "0"),
+    ("COOLDOWN_LEAVE_SEC", "0"),
+    ("MATCH_DELETE_AFTER_SEC", "3600"),
+    ("QUEUE_THREAD_DELETE_AFTER_SEC", "3600"),
+    ("LOG_LEVEL", "WARNING"),
+):
+    os.environ.setdefault(_key, _value)
+
+from bench import memory_mongo  # noqa: E402
+from bench.fakes import FakeClient, FakeGuild, FakeInteraction, FakeTextChannel, SimulatedREST  # noqa: E402
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.rest = SimulatedREST(
+            args.rest_latency, args.rest_jitter, args.rest_limit, seed=args.seed, global_limit=args.rest_global,
+            thread_create_latency=getattr(args, "thread_latency", 0.0),
+        )
+        self.client = FakeClient(self.rest)
+        self.guild = FakeGuild(self.rest)
+        self.random = random.Random(args.seed)
+        self.latencies: List[float] = []
+        self.thread_ready: List[float] = []
+        self.memdb = None
+
+    async def start(self):
+        self.memdb = await memory_mongo.install(self.args.mongo_latency)
+
+    def channels(self, n: int) -> List[FakeTextChannel]:
+        return [FakeTextChannel(self.client, self.guild, name=f"queue-{i}") for i in range(n)]
+
+    async def invoke(self, command, channel: FakeTextChannel, user_id: int):
+        interaction = FakeInteraction(self.client, channel, self.guild.member(user_id))
+        await command.callback(interaction)
+        if interaction.ack_latency is not None:
+            self.latencies.append(interaction.ack_latency)
+
+    async def settle(self):
+        """Wait for effect workers, pending embed renders and write-behind flushes."""
+        from core.effects import drain
+        from core.state import RENDERERS
+        from db.mongo import QUEUE_WRITES
+
+        while True:
+            await drain()
+            busy = [r for r in RENDERERS.values() if r.busy]
+            if not busy:
+                break
+            await asyncio.gather(*(r.flush() for r in busy), return_exceptions=True)
+        await QUEUE_WRITES.flush()
+
+
+async def _gather_bounded(coros, concurrency: int):
+    gate = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _run(coro):
+        async with gate:
+            await coro
+
+    await asyncio.gather(*(_run(c) for c in coros))
+
+
+async def scenario_rush(h: Harness):
+    """``--users`` players all hit /join on one channel at once."""
+    from commands.user import join_cmd
+
+    (channel,) = h.channels(1)
+    users = [1_000 + i for i in range(h.args.users)]
+    await _gather_bounded((h.invoke(join_cmd, channel, uid) for uid in users), h.args.concurrency)
+    return len(users)
+
+
+async def scenario_channels(h: Harness):
+    """``--users`` players spread over ``--channels`` channels, joining in parallel."""
+    from commands.user import join_cmd
+
+    channels = h.channels(h.args.channels)
+    calls = [(channels[i % len(channels)], 1_000 + i) for i in range(h.args.users)]
+    h.random.shuffle(calls)
+    await _gather_bounded((h.invoke(join_cmd, ch, uid) for ch, uid in calls), h.args.concurrency)
+    return len(calls)
+
+
+async def scenario_churn(h: Harness):
+    """Each of ``--users`` players alternates /join and /leave ``--rounds`` times."""
+    from commands.user import join_cmd, leave_cmd
+
+    channels = h.channels(h.args.channels)
+
+    async def _player(uid: int):
+        channel = channels[uid % len(channels)]
+        for _ in range(h.args.rounds):
+            await h.invoke(join_cmd, channel, uid)
+            await h.invoke(leave_cmd, channel, uid)
+
+    users = [1_000 + i for i in range(h.args.users)]
+    await _gather_bounded((_player(uid) for uid in users), h.args.concurrency)
+    return len(users) * h.args.rounds * 2
+
+
+async def scenario_background(h: Harness):
+    """``--users`` joins over ``--channels`` channels while ``--cleanups`` thread deletions fall due.
+
+    Run with ``--rest-global 50`` to see whether background work trips the
+    global rate limit and stalls acks (compare DISCORD_GLOBAL_RATE=0).
+    """
+    import discord
+
+    from bench.fakes import FakeThread
+    from commands.user import join_cmd
+    from core.threads import schedule_thread_cleanup
+
+    channels = h.channels(h.args.channels)
+    for i in range(h.args.cleanups):
+        # Threads left over from earlier matches; built directly so setup costs no REST budget.
+        parent = channels[i % len(channels)]
+        thread = FakeThread(parent, f"match-{i}", discord.ChannelType.private_thread)
+        parent.created_threads[thread.id] = thread
+        h.client.channels[thread.id] = thread
+        await schedule_thread_cleanup(h.client, thread, delete_after=0, warn_before=0)
+    h.rest.calls.clear()
+    calls = [(channels[i % len(channels)], 1_000 + i) for i in range(h.args.users)]
+
+    async def _paced(ch, uid, delay):
+        await asyncio.sleep(delay)
+        await h.invoke(join_cmd, ch, uid)
+
+    # Joins arrive over ~2s so they overlap the cleanup wave instead of preceding it.
+    spread = 2.0 / max(len(calls), 1)
+    await asyncio.gather(*(_paced(ch, uid, i * spread) for i, (ch, uid) in enumerate(calls)))
+    return len(calls)
+
+
+async def scenario_stall(h: Harness):
+    """``--users`` joins over ~2s while something blocks the loop for ``--stall-ms`` every 250 ms.
+
+    Stands in for a large purge or a CPU-bound burst. Under overload, admission
+    control answers with a busy reply (counted as "shed") instead of queueing
+    more work.
+    """
+    from commands.user import join_cmd
+    from core.metrics import start_lag_probe
+
+    start_lag_probe(0.05)
+    channels = h.channels(h.args.channels)
+    calls = [(channels[i % len(channels)], 1_000 + i) for i in range(h.args.users)]
+    done = asyncio.Event()
+
+    async def _blocker():
+        while not done.is_set():
+            time.sleep(h.args.stall_ms / 1000)
+            await asyncio.sleep(0.25)
+
+    async def _paced(ch, uid, delay):
+        await asyncio.sleep(delay)
+        await h.invoke(join_cmd, ch, uid)
+
+    blocker = asyncio.create_task(_blocker())
+    spread = 2.0 / max(len(calls), 1)
+    try:
+        await asyncio.gather(*(_paced(ch, uid, i * spread) for i, (ch, uid) in enumerate(calls)))
+    finally:
+        done.set()
+        await blocker
+    return len(calls)
+
+
+async def scenario_lobbies(h: Harness):
+    """Lobbies open and empty ``--rounds`` times in each of ``--channels`` channels.
+
+    Times the first /join of each lobby until its queue thread exists. With
+    THREAD_POOL_SIZE > 0 later lobbies take a recycled or pre-created thread.
+    """
+    from commands.user import join_cmd, leave_cmd
+    from config import QUEUE_SIZE
+    from core.effects import _WORKERS
+    from core.state import STATE
+    from core.threads import _REFILLS
+
+    channels = h.channels(h.args.channels)
+    players = max(min(QUEUE_SIZE - 1, 4), 1)
+
+    async def _lobbies(channel, first_uid: int):
+        uids = [first_uid + i for i in range(players)]
+        for _ in range(h.args.rounds):
+            started = time.perf_counter()
+            await h.invoke(join_cmd, channel, uids[0])
+            while STATE[channel.id].queue_thread_id is None:
+                await asyncio.sleep(0.001)
+            h.thread_ready.append(time.perf_counter() - started)
+            for uid in uids[1:]:
+                await h.invoke(join_cmd, channel, uid)
+            for uid in uids:
+                await h.invoke(leave_cmd, channel, uid)
+            # Lobby gone: wait for the close (and any recycle or refill) to finish.
+            while channel.id in _WORKERS or channel.id in _REFILLS:
+                await asyncio.sleep(0.005)
+
+    await asyncio.gather(*(_lobbies(ch, 1_000 + i * 100) for i, ch in enumerate(channels)))
+    return len(channels) * h.args.rounds * players * 2
+
+
+SCENARIOS = {
+    "rush": scenario_rush,
+    "channels": scenario_channels,
+    "churn": scenario_churn,
+    "background": scenario_background,
+    "stall": scenario_stall,
+    "lobbies": scenario_lobbies,
+}
+
+
+async def run_scenario(name: str, args) -> Dict[str, object]:
+    from core.admission import ADMISSION
+    from core.threads import thread_pool_stats
+
+    h = Harness(args)
+    await h.start()
+    started = time.perf_counter()
+    ops = await SCENARIOS[name](h)
+    commands_done = time.perf_counter()
+    await h.settle()
+    settled = time.perf_counter()
+    elapsed = commands_done - started
+    return {
+        "scenario": name,
+        "ops": ops,
+        "elapsed_s": round(elapsed, 4),
+        "ops_per_s": round(ops / elapsed, 1) if elapsed > 0 else 0.0,
+        "ack_p50_ms": round(percentile(h.latencies, 50) * 1000, 3),
+        "ack_p99_ms": round(percentile(h.latencies, 99) * 1000, 3),
+        "ack_max_ms": round(max(h.latencies, default=0.0) * 1000, 3),
+        "settle_s": round(settled - commands_done, 4),
+        "rest_calls": sum(h.rest.calls.values()),
+        "rest_throttled_s": round(sum(h.rest.throttled.values()), 3),
+        "global_429": h.rest.global_hits,
+        "shed": ADMISSION.stats["shed"],
+        "mongo_ops": sum(h.memdb.op_counts().values()),
+        "thread_p50_ms": round(percentile(h.thread_ready, 50) * 1000, 3),
+        "pool_hit_rate": thread_pool_stats()["hit_rate"],
+        "pool_saved_ms": round(thread_pool_stats()["saved_ms"], 1),
+    }
+
+
+def _reset_process_state():
+    """Scenarios share module globals; start each from empty state."""
+    from core import state
+    from core.admission import ADMISSION
+    from core.threads import _POOL, _POOLED, _THREAD_CACHE, CLEANUPS, THREAD_POOL_STATS
+
+    for renderer in state.RENDERERS.values():
+        renderer.cancel()
+    state.RENDERERS.clear()
+    state.STATE.clear()
+    state.GLOBAL_Q_MEMBERS.clear()
+    for key in list(CLEANUPS._entries):
+        CLEANUPS.cancel(key)
+    _THREAD_CACHE.clear()
+    _POOL.clear()
+    _POOLED.clear()
+    for key in THREAD_POOL_STATS:
+        THREAD_POOL_STATS[key] = 0
+    ADMISSION._samples.clear()
+    for key in ADMISSION.stats:
+        ADMISSION.stats[key] = 0
+
+
+def _print_table(rows: List[Dict[str, object]]):
+    cols = list(rows[0])
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.split("\n\n")[0])
+    p.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                   help=f"one or more of {', '.join(SCENARIOS)} (default: all)")
+    p.add_argument("--users", type=int, default=500)
+    p.add_argument("--channels", type=int, default=20)
+    p.add_argument("--rounds", type=int, default=3, help="join/leave pairs per user in churn")
+    p.add_argument("--concurrency", type=int, default=256, help="max in-flight interactions")
+    p.add_argument("--rest-latency", type=float, default=0.02, help="seconds per simulated REST call")
+    p.add_argument("--rest-jitter", type=float, default=0.01)
+    p.add_argument("--rest-limit", type=int, default=0, help="calls per second per route (0 = unlimited)")
+    p.add_argument("--rest-global", type=int, default=0,
+                   help="non-interaction calls per second before a global rate limit stalls everything (0 = off)")
+    p.add_argument("--cleanups", type=int, default=200, help="thread deletions already due (background scenario)")
+    p.add_argument("--stall-ms", type=float, default=600, help="loop block per stall (stall scenario)")
+    p.add_argument("--thread-latency", type=float, default=0.0, help="extra seconds per thread creation")
+    p.add_argument("--mongo-latency", type=float, default=0.002, help="seconds per in-memory Mongo op")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", action="store_true", help="print one JSON object per scenario")
+    args = p.parse_args(argv)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        p.error(f"unknown scenario(s): {', '.join(unknown)}")
+    return args
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    rows = []
+    for name in args.scenarios or list(SCENARIOS):
+        _reset_process_state()
+        row = await run_scenario(name, args)
+        rows.append(row)
+        if args.json:
+            print(json.dumps(row))
+    if not args.json:
+        _print_table(rows)
+    from core.trace import TRACE
+
+    await TRACE.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""Cold vs warm start: time until queue state is servable, and until Mongo has caught up.
+
+    python -m bench.startup_bench
+    python -m bench.startup_bench --channels 5000 --players 8 --connect-delay 5
+
+"cold" waits for the connection (``--connect-delay`` stands in for TLS server
+selection) and streams every queue document. "warm" loads the snapshot file
+first and serves from it; the connection and the reconcile against Mongo
+(``--changed`` documents updated after the snapshot) finish in the background.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import tempfile
+import time
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from bench import memory_mongo  # noqa: E402
+
+
+def _seed(col, channels: int, players: int, when: dt.datetime):
+    uid = 1_000
+    for i in range(channels):
+        channel_id = 100_000 + i
+        queue = list(range(uid, uid + players))
+        uid += players
+        col.docs[channel_id] = {
+            "_id": channel_id,
+            "channelId": channel_id,
+            "guildId": 1,
+            "queue": queue,
+            "queueJoinedAt": [when.timestamp()] * players,
+            "embedMsgId": 500_000 + i,
+            "queueThreadId": None,
+            "updatedAt": when,
+        }
+
+
+def _reset():
+    from core import snapshot, state
+
+    state.STATE.clear()
+    state.GLOBAL_Q_MEMBERS.clear()
+    snapshot._RESTORED.clear()
+
+
+async def run(args):
+    from core import snapshot
+    from core.state import GLOBAL_Q_MEMBERS, STATE
+    from db import mongo
+
+    memdb = await memory_mongo.install(args.mongo_latency)
+    col = memdb["queues"]
+    stamp = dt.datetime.now(dt.timezone.utc).replace(microsecond=0) - dt.timedelta(seconds=60)
+    _seed(col, args.channels, args.players, stamp)
+
+    async def _connect_and_load():
+        await asyncio.sleep(args.connect_delay)
+        await mongo.load_queues_from_db(STATE, GLOBAL_Q_MEMBERS)
+
+    rows = []
+    _reset()
+    started = time.perf_counter()
+    await _connect_and_load()
+    cold = time.perf_counter() - started
+    rows.append(("cold", cold, cold, len(STATE), len(GLOBAL_Q_MEMBERS), 0))
+
+    path = os.path.join(tempfile.mkdtemp(prefix="mm-snapshot-"), "queue_state.snap")
+    await snapshot.write_snapshot(path)
+    size = os.path.getsize(path)
+    # Other writers moved some queues on after the snapshot was taken.
+    for i in range(min(args.changed, args.channels)):
+        doc = col.docs[100_000 + i]
+        doc["queue"] = doc["queue"][:-1]
+        doc["queueJoinedAt"] = doc["queueJoinedAt"][:-1]
+        doc["updatedAt"] = stamp + dt.timedelta(seconds=30)
+
+    _reset()
+    started = time.perf_counter()
+    snapshot.load_snapshot(path=path, max_age=0)
+    serve = time.perf_counter() - started
+    served = (len(STATE), len(GLOBAL_Q_MEMBERS))
+    await asyncio.sleep(args.connect_delay)
+    outcome = await snapshot.reconcile()
+    await mongo.load_queues_from_db(STATE, GLOBAL_Q_MEMBERS)
+    ready = time.perf_counter() - started
+    rows.append(("warm", serve, ready, *served, size))
+
+    print(f"{'mode':<6}  {'serve_ms':>10}  {'mongo_ready_ms':>14}  {'channels':>8}  {'players':>8}  {'snapshot_bytes':>14}")
+    for mode, serve_s, ready_s, channels, players, nbytes in rows:
+        print(f"{mode:<6}  {serve_s * 1000:>10.1f}  {ready_s * 1000:>14.1f}  {channels:>8}  {players:>8}  {nbytes:>14}")
+    print(f"warm reconcile: {outcome}")
+    wrong = [
+        cid for cid in range(100_000, 100_000 + args.channels)
+        if STATE[cid].queue.ids() != col.docs[cid]["queue"]
+    ]
+    print(f"channels differing from Mongo after reconcile: {len(wrong)}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m bench.startup_bench", description=__doc__.split("\n\n")[0])
+    p.add_argument("--channels", type=int, default=2000)
+    p.add_argument("--players", type=int, default=5, help="queued players per channel")
+    p.add_argument("--changed", type=int, default=100, help="documents updated after the snapshot")
+    p.add_argument("--connect-delay", type=float, default=2.0, help="seconds of simulated server selection")
+    p.add_argument("--mongo-latency", type=float, default=0.002, help="seconds per in-memory Mongo op")
+    asyncio.run(run(p.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,36 @@
-import asyncio
+from typing import Literal
+
 import discord
 from discord import app_commands
 from logging import getLogger
 
 log = getLogger("bot")
 
-from core.state import ensure_state, update_embed, STATE, GLOBAL_Q_MEMBERS
-from core.threads import fetch_thread, delete_thread
-from db.mongo import persist_queue_doc
+from config import MATCHMAKING_MODE, PROFILE_DIR, PROFILE_MAX_SEC
+from core import engine
+from core.admission import admission_control
+from core.effects import submit
+from core.matchmaking import store_rating
+from core.metrics import lock_timed, timed_command
+from core.profiling import start_profile, write_task_dump
+from core.trace import note_outcome, traced
+from core.state import ensure_state, GLOBAL_Q_MEMBERS
+from core.threads import fill_thread_pool
+from db.breaker import UNAVAILABLE
+
+STORAGE_UNAVAILABLE = "Queue storage is temporarily unavailable. Try again shortly."
 
 
 @app_commands.command(name="setup", description="Admin: clears channel and creates a matchmaking queue embed here.")
+@timed_command
+@traced
+@admission_control(heavy=True)
 async def setup_cmd(interaction: discord.Interaction):
     if not interaction.guild or not isinstance(interaction.user, discord.Member):
         return await interaction.response.send_message("This can only be used in a server.", ephemeral=True)
     perms = interaction.user.guild_permissions
     if not (perms.administrator or perms.manage_guild or perms.manage_messages):
+        note_outcome(interaction, "forbidden")
         return await interaction.response.send_message("You need admin/mod permissions to use this.", ephemeral=True)
     if not isinstance(interaction.channel, discord.TextChannel):
         return await interaction.response.send_message("Run this in a text channel.", ephemeral=True)
@@ -40,87 +55,47 @@ async def setup_cmd(interaction: discord.Interaction):
     except Exception:
         pass
 
-    await ensure_state(ch)
-    data = STATE[ch.id]
-    lock: asyncio.Lock = data["lock"]  # type: ignore
-    thread_id: int | None = None
-
-    async with lock:
-        old_queue = data["queue"]  # type: ignore
-        for uid in list(old_queue):
-            if GLOBAL_Q_MEMBERS.get(uid) == ch.id:
-                GLOBAL_Q_MEMBERS.pop(uid, None)
-        raw_thread_id = data.get("queue_thread_id")
-        if raw_thread_id:
-            try:
-                thread_id = int(raw_thread_id)
-            except (TypeError, ValueError):
-                thread_id = None
-            data["queue_thread_id"] = None
-        data["queue"] = []
-        data["embed_msg_id"] = None
-    try:
-        await update_embed(ch)
-    except Exception as exc:
-        log.warning("embed_update_fail", extra={"channel_id": ch.id, "err": repr(exc)})
     try:
-        await persist_queue_doc(ch, STATE)
-    except Exception as exc:
-        log.warning("persist_queue_fail", extra={"channel_id": ch.id, "err": repr(exc)})
+        data = await ensure_state(ch)
+    except UNAVAILABLE:
+        note_outcome(interaction, "unavailable")
+        return await interaction.followup.send(STORAGE_UNAVAILABLE, ephemeral=True)
 
-    if thread_id:
-        thread = await fetch_thread(interaction.client, thread_id)
-        if thread:
-            try:
-                await delete_thread(thread, "Queue setup reset.")
-            except Exception:
-                pass
+    async with lock_timed(data.lock, "setup"):
+        result = engine.clear(data, ch.id, GLOBAL_Q_MEMBERS, "Queue setup reset.", reset_embed=True)
+    note_outcome(interaction, result.status)
 
-    await interaction.followup.send("Setup complete. Queue is ready in this channel.", ephemeral=True)
+    try:
+        await interaction.followup.send("Setup complete. Queue is ready in this channel.", ephemeral=True)
+    finally:
+        submit(interaction.client, ch, result)
+        fill_thread_pool(interaction.client, ch)
 
 
 @app_commands.command(name="cancel", description="Admin: cancels and clears the current queue in this channel.")
+@timed_command
+@traced
+@admission_control()
 async def cancel_cmd(interaction: discord.Interaction):
     if not interaction.guild or not isinstance(interaction.user, discord.Member):
         return await interaction.response.send_message("This can only be used in a server.", ephemeral=True)
     perms = interaction.user.guild_permissions
     if not (perms.administrator or perms.manage_guild or perms.manage_messages):
+        note_outcome(interaction, "forbidden")
         return await interaction.response.send_message("You need admin/mod permissions to use this.", ephemeral=True)
     if not isinstance(interaction.channel, discord.TextChannel):
         return await interaction.response.send_message("Run this in a text channel.", ephemeral=True)
 
     ch: discord.TextChannel = interaction.channel
-    await ensure_state(ch)
-
-    data = STATE[ch.id]
-    lock: asyncio.Lock = data["lock"]  # type: ignore
-    thread_id: int | None = None
-    cleared = 0
-
-    await interaction.response.defer(ephemeral=True)
-    async with lock:
-        queue = data["queue"]  # type: ignore
-        cleared = len(queue)
-        for uid in queue:
-            if GLOBAL_Q_MEMBERS.get(uid) == ch.id:
-                GLOBAL_Q_MEMBERS.pop(uid, None)
-        raw_thread_id = data.get("queue_thread_id")
-        if raw_thread_id:
-            try:
-                thread_id = int(raw_thread_id)
-            except (TypeError, ValueError):
-                thread_id = None
-            data["queue_thread_id"] = None
-        data["queue"] = []
-
     try:
-        await update_embed(ch)
-    except Exception as exc:
-        log.warning("embed_update_fail", extra={"channel_id": ch.id, "err": repr(exc)})
-    try:
-        await persist_queue_doc(ch, STATE)
-    except Exception as exc:
-        log.warning("persist_queue_fail", extra={"channel_id": ch.id, "err": repr(exc)})
+        data = await ensure_state(ch)
+    except UNAVAILABLE:
+        note_outcome(interaction, "unavailable")
+        return await interaction.response.send_message(STORAGE_UNAVAILABLE, ephemeral=True)
+
+    async with lock_timed(data.lock, "cancel"):
+        result = engine.clear(data, ch.id, GLOBAL_Q_MEMBERS, "Queue cancelled by admin.")
+    note_outcome(interaction, result.status)
 
     log.info(
         "queue_cancel",
@@ -131,16 +106,66 @@ async def cancel_cmd(interaction: discord.Interaction):
             "channel_name": ch.name,
             "user_id": getattr(interaction.user, "id", None),
             "user": str(interaction.user),
-            "cleared": cleared,
+            "cleared": result.cleared,
         },
     )
 
-    await interaction.followup.send("Queue cancelled and cleared.", ephemeral=True)
+    try:
+        await interaction.response.send_message("Queue cancelled and cleared.", ephemeral=True)
+    finally:
+        submit(interaction.client, ch, result)
+
+
+@app_commands.command(name="setrating", description="Admin: set a player's matchmaking rating.")
+@app_commands.describe(member="Whose rating to set.", value="The new rating.")
+@timed_command
+@admission_control()
+async def setrating_cmd(
+    interaction: discord.Interaction,
+    member: discord.Member,
+    value: app_commands.Range[float, 0, 100000],
+):
+    if not interaction.guild or not isinstance(interaction.user, discord.Member):
+        return await interaction.response.send_message("This can only be used in a server.", ephemeral=True)
+    perms = interaction.user.guild_permissions
+    if not (perms.administrator or perms.manage_guild):
+        return await interaction.response.send_message("You need admin permissions to use this.", ephemeral=True)
+
+    try:
+        await store_rating(interaction.guild.id, member.id, value)
+    except UNAVAILABLE:
+        return await interaction.response.send_message(STORAGE_UNAVAILABLE, ephemeral=True)
 
-    if thread_id:
-        thread = await fetch_thread(interaction.client, thread_id)
-        if thread:
-            try:
-                await delete_thread(thread, "Queue cancelled by admin.")
-            except Exception:
-                pass
+    log.info(
+        "rating_set",
+        extra={"guild_id": interaction.guild.id, "member_id": member.id, "rating": value, "user_id": interaction.user.id},
+    )
+    note = "" if MATCHMAKING_MODE == "rating" else " (ratings are only used when MATCHMAKING_MODE=rating)"
+    await interaction.response.send_message(
+        f"{member.mention}'s rating is now {value:g}; it applies from their next join{note}.", ephemeral=True
+    )
+
+
+@app_commands.command(name="profile", description="Owner: profile the bot for a while, or dump its running tasks.")
+@app_commands.describe(action="start: sampling profile + slow callbacks; tasks: dump every asyncio task",
+                       seconds="How long to profile (start only).")
+@timed_command
+async def profile_cmd(
+    interaction: discord.Interaction,
+    action: Literal["start", "tasks"],
+    seconds: app_commands.Range[int, 1, PROFILE_MAX_SEC] = 30,
+):
+    # Deliberately not behind admission control: it is most useful while the bot is overloaded.
+    # It profiles the whole process and writes to the host, so only the bot's owner may run it.
+    if not await interaction.client.is_owner(interaction.user):
+        return await interaction.response.send_message("Only the bot owner can use this.", ephemeral=True)
+
+    log.info("profile_requested", extra={"action": action, "seconds": seconds, "user_id": interaction.user.id})
+    if action == "tasks":
+        path = await write_task_dump()
+        return await interaction.response.send_message(f"Task dump written to `{path}`.", ephemeral=True)
+    if not start_profile(seconds):
+        return await interaction.response.send_message("A profile is already running.", ephemeral=True)
+    await interaction.response.send_message(
+        f"Profiling for {seconds}s; reports will be written to `{PROFILE_DIR}`.", ephemeral=True
+    )
@@ -1,209 +1,192 @@
 import asyncio
+import time
+from typing import Optional
 import discord
 from discord import app_commands
 from logging import getLogger
 
 log = getLogger("bot")
 
+from config import HISTORY_PAGE_SIZE, MATCHMAKING_MODE
+from core import engine
+from core.admission import admission_control
+from core.matchmaking import prepare_join
+from core.effects import submit
+from core.metrics import lock_timed, timed_command
+from core.trace import note_outcome, traced
 from core.state import (
     ensure_state,
-    update_embed,
     cooldown_blocked,
     mark_cooldown,
-    STATE,
+    rate_limited,
+    refund_rate_limit,
     GLOBAL_Q_MEMBERS,
+    MEMBERSHIP,
 )
-from config import QUEUE_SIZE, QUEUE_THREAD_DELETE_AFTER_SEC
-from core.threads import (
-    add_members_to_thread,
-    delete_thread,
-    ensure_queue_thread,
-    fetch_thread,
-    remove_members_from_thread,
-    schedule_thread_cleanup,
-)
-from db.mongo import persist_queue_doc, record_match
+from db.breaker import UNAVAILABLE
+from db.mongo import fetch_match_history, get_match_stats, guild_stats_key, player_stats_key
+from utils.embeds import build_history_embed, build_stats_embed, parse_history_cursor
+
+STORAGE_UNAVAILABLE = "Queue storage is temporarily unavailable. Try again shortly."
+
+
+async def _release_claim(uid: int, channel_id: int):
+    try:
+        await MEMBERSHIP.release((uid,), channel_id)
+    except Exception as exc:
+        log.warning("membership_release_fail", extra={"user_id": uid, "err": repr(exc)})
 
 
 @app_commands.command(name="join", description="Join the current queue in this channel.")
+@timed_command
+@traced
+@admission_control()
 async def join_cmd(interaction: discord.Interaction):
     if not interaction.guild or not isinstance(interaction.channel, discord.TextChannel):
         return await interaction.response.send_message("This can only be used in a server text channel.", ephemeral=True)
     ch: discord.TextChannel = interaction.channel
-    await ensure_state(ch)
-    data = STATE[ch.id]
-    lock: asyncio.Lock = data["lock"]  # type: ignore
+    try:
+        data = await ensure_state(ch)
+    except UNAVAILABLE:
+        note_outcome(interaction, "unavailable")
+        return await interaction.response.send_message(STORAGE_UNAVAILABLE, ephemeral=True)
 
     now = asyncio.get_event_loop().time()
-    remaining = cooldown_blocked(interaction.user.id, "join", now)
+    remaining = cooldown_blocked(interaction.user.id, "join", now) or rate_limited(
+        interaction.user.id, ch.id, ch.guild.id, now
+    )
     if remaining:
+        note_outcome(interaction, "rate_limited")
         return await interaction.response.send_message(f"Slow down. Try again in {remaining:.1f}s.", ephemeral=True)
 
-    members_to_add: list[int] = []
-    active_thread: discord.Thread | None = None
-    match_players: list[int] = []
-    match_thread: discord.Thread | None = None
-    leftover_queue_ids: list[int] = []
-
-    async with lock:
-        queue: list[int] = data["queue"]  # type: ignore
-        uid = interaction.user.id
-        other_ch_id = GLOBAL_Q_MEMBERS.get(uid)
-        if other_ch_id and other_ch_id != ch.id:
-            return await interaction.response.send_message(
-                f"You're already queued in <#{other_ch_id}>. Leave there first.", ephemeral=True
-            )
-        if uid in queue:
-            return await interaction.response.send_message("You're already in the queue.", ephemeral=True)
-        queue.append(uid)
-        GLOBAL_Q_MEMBERS[uid] = ch.id
-        log.info(f"/join ok size={len(queue)} in #{ch.name} ({ch.id})")
-        mark_cooldown(uid, "join", now)
-
-        thread, created = await ensure_queue_thread(interaction.client, ch, data)
-        active_thread = thread
-        if thread:
-            members_to_add = queue.copy() if created else [uid]
-
-        await update_embed(ch)
-        try:
-            await persist_queue_doc(ch, STATE)
-        except Exception as exc:
-            log.warning("persist_queue_fail", extra={"channel_id": ch.id, "err": repr(exc)})
-
-        if len(queue) >= QUEUE_SIZE:
-            match_players = queue[:QUEUE_SIZE]
-            remaining = queue[QUEUE_SIZE:]
-            data["queue"] = remaining
-            leftover_queue_ids = remaining.copy()
-            for queued_id in match_players:
-                if GLOBAL_Q_MEMBERS.get(queued_id) == ch.id:
-                    GLOBAL_Q_MEMBERS.pop(queued_id, None)
-            match_thread = thread
-            data["queue_thread_id"] = None
-            await update_embed(ch)
-            try:
-                await persist_queue_doc(ch, STATE)
-            except Exception as exc:
-                log.warning("persist_queue_fail", extra={"channel_id": ch.id, "err": repr(exc)})
-
-    await interaction.response.send_message("You joined the queue.", ephemeral=True)
-
-    if active_thread and members_to_add:
-        try:
-            await add_members_to_thread(active_thread, ch.guild, members_to_add)
-        except Exception as exc:
-            log.debug("thread_member_add_fail", extra={"thread_id": active_thread.id, "err": repr(exc)})
-
-    if match_players:
-        mentions = " ".join(f"<@{uid}>" for uid in match_players)
-        if match_thread:
-            if leftover_queue_ids:
-                try:
-                    await remove_members_from_thread(match_thread, ch.guild, leftover_queue_ids)
-                except Exception as exc:
-                    log.debug(
-                        "thread_member_remove_fail",
-                        extra={"thread_id": match_thread.id, "err": repr(exc)},
-                    )
-            try:
-                await match_thread.send(
-                    f"Queue full - match ready!\nPlayers: {mentions}\nGood luck and have fun!"
-                )
-            except Exception as exc:
-                log.warning("thread_announce_fail", extra={"thread_id": match_thread.id, "err": repr(exc)})
-            try:
-                await record_match(ch.guild.id, ch.id, match_players, match_thread.id)
-            except Exception as exc:
-                log.warning("record_match_fail", extra={"thread_id": match_thread.id, "err": repr(exc)})
-            try:
-                await schedule_thread_cleanup(
-                    interaction.client,
-                    match_thread,
-                    delete_after=QUEUE_THREAD_DELETE_AFTER_SEC,
-                    warn_before=0,
-                )
-            except Exception as exc:
-                log.warning("thread_schedule_fail", extra={"thread_id": match_thread.id, "err": repr(exc)})
-        else:
-            try:
-                await ch.send(f"Queue is full! (thread unavailable)\nPlayers: {mentions}")
-            except Exception:
-                pass
-            try:
-                await record_match(ch.guild.id, ch.id, match_players, None)
-            except Exception as exc:
-                log.warning("record_match_fail", extra={"channel_id": ch.id, "err": repr(exc)})
+    uid = interaction.user.id
+    claimed = False
+    try:
+        other_ch_id = await MEMBERSHIP.claim(uid, ch.id, ch.guild.id)
+        claimed = other_ch_id is None and MEMBERSHIP.shared
+    except Exception as exc:
+        # Fail open: the local index still stops double-queueing within this process.
+        log.warning("membership_claim_fail", extra={"user_id": uid, "err": repr(exc)})
+        other_ch_id = None
+    if other_ch_id:
+        refund_rate_limit(uid, ch.id, ch.guild.id, asyncio.get_event_loop().time())
+        note_outcome(interaction, engine.QUEUED_ELSEWHERE)
+        return await interaction.response.send_message(
+            f"You're already queued in <#{other_ch_id}>. Leave there first.", ephemeral=True
+        )
+    result = None
+    try:
+        if MATCHMAKING_MODE == "rating":
+            # The engine reads ratings synchronously under the lock.
+            await prepare_join(data, ch.guild.id, uid)
+
+        async with lock_timed(data.lock, "join"):
+            result = engine.join(data, ch.id, uid, GLOBAL_Q_MEMBERS, joined_at=time.time())
+            if result.ok:
+                mark_cooldown(uid, "join", now)
+            else:
+                # Already queued here or elsewhere: nothing changed, so don't spend their burst.
+                refund_rate_limit(uid, ch.id, ch.guild.id, asyncio.get_event_loop().time())
+    finally:
+        # Cancelled or failed before queueing, or queued elsewhere locally: drop our claim.
+        if claimed and (result is None or result.status == engine.QUEUED_ELSEWHERE):
+            await _release_claim(uid, ch.id)
+    note_outcome(interaction, result.status)
+
+    if result.status == engine.QUEUED_ELSEWHERE:
+        return await interaction.response.send_message(
+            f"You're already queued in <#{result.other_channel_id}>. Leave there first.", ephemeral=True
+        )
+    if result.status == engine.ALREADY_QUEUED:
+        return await interaction.response.send_message("You're already in the queue.", ephemeral=True)
+
+    log.info("join_ok", extra={"size": result.size, "channel_id": ch.id, "channel_name": ch.name})
+    try:
+        await interaction.response.send_message("You joined the queue.", ephemeral=True)
+    finally:
+        submit(interaction.client, ch, result)
 
 
 @app_commands.command(name="leave", description="Leave the current queue in this channel.")
+@timed_command
+@traced
+@admission_control()
 async def leave_cmd(interaction: discord.Interaction):
     if not interaction.guild or not isinstance(interaction.channel, discord.TextChannel):
         return await interaction.response.send_message("This can only be used in a server text channel.", ephemeral=True)
     ch: discord.TextChannel = interaction.channel
-    await ensure_state(ch)
-    data = STATE[ch.id]
-    lock: asyncio.Lock = data["lock"]  # type: ignore
+    try:
+        data = await ensure_state(ch)
+    except UNAVAILABLE:
+        note_outcome(interaction, "unavailable")
+        return await interaction.response.send_message(STORAGE_UNAVAILABLE, ephemeral=True)
 
     now = asyncio.get_event_loop().time()
-    remaining = cooldown_blocked(interaction.user.id, "leave", now)
+    remaining = cooldown_blocked(interaction.user.id, "leave", now) or rate_limited(
+        interaction.user.id, ch.id, ch.guild.id, now
+    )
     if remaining:
+        note_outcome(interaction, "rate_limited")
         return await interaction.response.send_message(f"Slow down. Try again in {remaining:.1f}s.", ephemeral=True)
 
-    thread_id_value: int | None = None
-    queue_empty = False
-
-    async with lock:
-        queue: list[int] = data["queue"]  # type: ignore
-        uid = interaction.user.id
-        if uid not in queue:
-            return await interaction.response.send_message("You're not in the queue.", ephemeral=True)
-        queue.remove(uid)
-        log.info(f"/leave ok size={len(queue)} in #{ch.name} ({ch.id})")
-        if GLOBAL_Q_MEMBERS.get(uid) == ch.id:
-            GLOBAL_Q_MEMBERS.pop(uid, None)
-        mark_cooldown(uid, "leave", now)
-
-        raw_thread_id = data.get("queue_thread_id")
-        if raw_thread_id:
-            try:
-                thread_id_value = int(raw_thread_id)
-            except (TypeError, ValueError):
-                thread_id_value = None
-
-        queue_empty = len(queue) == 0
-        if queue_empty and raw_thread_id:
-            data["queue_thread_id"] = None
-
-        await update_embed(ch)
-        try:
-            await persist_queue_doc(ch, STATE)
-        except Exception as exc:
-            log.warning("persist_queue_fail", extra={"channel_id": ch.id, "err": repr(exc)})
-
-    await interaction.response.send_message("Left the queue.", ephemeral=True)
-
-    if not thread_id_value:
-        return
-
-    thread = await fetch_thread(interaction.client, thread_id_value)
-    if not thread:
-        async with lock:
-            if data.get("queue_thread_id") == thread_id_value:
-                data["queue_thread_id"] = None
-                try:
-                    await persist_queue_doc(ch, STATE)
-                except Exception as exc:
-                    log.warning("persist_queue_fail", extra={"channel_id": ch.id, "err": repr(exc)})
-        return
+    uid = interaction.user.id
+    async with lock_timed(data.lock, "leave"):
+        result = engine.leave(data, ch.id, uid, GLOBAL_Q_MEMBERS)
+        if result.ok:
+            mark_cooldown(uid, "leave", now)
+        else:
+            refund_rate_limit(uid, ch.id, ch.guild.id, asyncio.get_event_loop().time())
+    note_outcome(interaction, result.status)
+
+    if result.status == engine.NOT_QUEUED:
+        return await interaction.response.send_message("You're not in the queue.", ephemeral=True)
 
+    log.info("leave_ok", extra={"size": result.size, "channel_id": ch.id, "channel_name": ch.name})
     try:
-        await remove_members_from_thread(thread, ch.guild, [interaction.user.id])
+        await interaction.response.send_message("Left the queue.", ephemeral=True)
+    finally:
+        submit(interaction.client, ch, result)
+
+
+@app_commands.command(name="history", description="Show recent matches in this server.")
+@app_commands.describe(here="Only show matches from this channel.", before="Page cursor from a previous /history.")
+@timed_command
+async def history_cmd(interaction: discord.Interaction, here: bool = False, before: Optional[str] = None):
+    if not interaction.guild:
+        return await interaction.response.send_message("This can only be used in a server.", ephemeral=True)
+    cursor = parse_history_cursor(before)
+    if before and cursor is None:
+        return await interaction.response.send_message(
+            "Invalid cursor; copy `before:` from the footer of a previous /history.", ephemeral=True
+        )
+    channel_id = interaction.channel_id if here else None
+    try:
+        matches = await fetch_match_history(
+            interaction.guild.id,
+            channel_id=channel_id,
+            before=cursor,
+            limit=HISTORY_PAGE_SIZE,
+        )
     except Exception as exc:
-        log.debug("thread_member_remove_fail", extra={"thread_id": thread.id, "err": repr(exc)})
-
-    if queue_empty:
-        try:
-            await delete_thread(thread, "Queue emptied before match.")
-        except Exception as exc:
-            log.warning("thread_delete_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+        log.warning("history_fetch_fail", extra={"guild_id": interaction.guild.id, "err": repr(exc)})
+        return await interaction.response.send_message("Couldn't load match history right now.", ephemeral=True)
+    emb = build_history_embed(interaction.guild, matches, HISTORY_PAGE_SIZE)
+    await interaction.response.send_message(embed=emb, ephemeral=True)
+
+
+@app_commands.command(name="stats", description="Show games played and last played time.")
+@app_commands.describe(member="Whose stats to show (defaults to you).")
+@timed_command
+async def stats_cmd(interaction: discord.Interaction, member: Optional[discord.Member] = None):
+    if not interaction.guild:
+        return await interaction.response.send_message("This can only be used in a server.", ephemeral=True)
+    target = member or interaction.user
+    try:
+        player, totals = await asyncio.gather(
+            get_match_stats(player_stats_key(interaction.guild.id, target.id)),
+            get_match_stats(guild_stats_key(interaction.guild.id)),
+        )
+    except Exception as exc:
+        log.warning("stats_fetch_fail", extra={"guild_id": interaction.guild.id, "err": repr(exc)})
+        return await interaction.response.send_message("Couldn't load stats right now.", ephemeral=True)
+    await interaction.response.send_message(embed=build_stats_embed(target, player, totals), ephemeral=True)
@@ -6,22 +6,153 @@ load_dotenv()
 # Discord
 DISCORD_TOKEN: str | None = os.getenv("DISCORD_TOKEN")
 GUILD_ID: int | None = int(os.getenv("GUILD_ID")) if os.getenv("GUILD_ID") else None
+# Sharding: set SHARD_COUNT to run AutoShardedBot; SHARD_IDS (comma-separated) picks
+# the shards this process owns, so several processes can split one bot.
+SHARD_COUNT: int | None = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS: list[int] | None = (
+    [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()] or None
+)
 
 # Mongo
 MONGO_URI: str | None = os.getenv("MONGO_URI")
 MONGO_DB: str = os.getenv("MONGO_DB", "discord_matchmaker")
 MATCH_TTL_DAYS: int = int(os.getenv("MATCH_TTL_DAYS", "60"))
+PERSIST_FLUSH_INTERVAL_SEC: float = float(os.getenv("PERSIST_FLUSH_INTERVAL_SEC", "0.5"))
+PERSIST_MAX_STALENESS_SEC: float = float(os.getenv("PERSIST_MAX_STALENESS_SEC", "5"))
+PERSIST_MAX_BATCH: int = int(os.getenv("PERSIST_MAX_BATCH", "100"))
+STATS_CACHE_SIZE: int = int(os.getenv("STATS_CACHE_SIZE", "2048"))
+STATS_CACHE_TTL_SEC: float = float(os.getenv("STATS_CACHE_TTL_SEC", "60"))
+HISTORY_PAGE_SIZE: int = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+# "memory" (single process) or "mongo" (shared across processes) index enforcing one queue per user.
+MEMBERSHIP_BACKEND: str = os.getenv("MEMBERSHIP_BACKEND", "memory").lower()
+# With the mongo backend, the reconcile sweep drops claims older than this that no queue
+# lists (a join that failed after claiming, a crash before the write-behind flush).
+MEMBERSHIP_CLAIM_GRACE_SEC: float = float(os.getenv("MEMBERSHIP_CLAIM_GRACE_SEC", "120"))
+# Client profile. MONGO_TIMEOUT_MS bounds each operation end to end (0 = driver default).
+MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "zlib")  # e.g. "zstd,snappy,zlib"
+MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_TIMEOUT_MS: int = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+MONGO_RETRY_WRITES: bool = os.getenv("MONGO_RETRY_WRITES", "1") == "1"
+# Circuit breaker: open after this many consecutive failures, probe again after the reset time.
+MONGO_BREAKER_FAILURES: int = int(os.getenv("MONGO_BREAKER_FAILURES", "3"))
+MONGO_BREAKER_RESET_SEC: float = float(os.getenv("MONGO_BREAKER_RESET_SEC", "10"))
+MONGO_REPLAY_MAX: int = int(os.getenv("MONGO_REPLAY_MAX", "10000"))
 
 # Thread lifecycle
 MATCH_DELETE_AFTER_SEC: int = int(os.getenv("MATCH_DELETE_AFTER_SEC", "600"))
 MATCH_WARN_BEFORE_SEC: int  = int(os.getenv("MATCH_WARN_BEFORE_SEC", "300"))
 QUEUE_THREAD_DELETE_AFTER_SEC: int = int(os.getenv("QUEUE_THREAD_DELETE_AFTER_SEC", str(20 * 60)))
+THREAD_CLEANUP_CONCURRENCY: int = int(os.getenv("THREAD_CLEANUP_CONCURRENCY", "4"))
+# Concurrent thread add/remove-member calls per thread, and across all threads.
+THREAD_MEMBER_CONCURRENCY: int = int(os.getenv("THREAD_MEMBER_CONCURRENCY", "4"))
+THREAD_MEMBER_GLOBAL_CONCURRENCY: int = int(os.getenv("THREAD_MEMBER_GLOBAL_CONCURRENCY", "16"))
+# Thread lookups: found threads are cached for THREAD_CACHE_TTL_SEC, known-missing ids
+# for THREAD_CACHE_NEGATIVE_TTL_SEC (deleted threads do not come back). Gateway
+# thread events refresh or invalidate entries in between.
+THREAD_CACHE_SIZE: int = int(os.getenv("THREAD_CACHE_SIZE", "4096"))
+THREAD_CACHE_TTL_SEC: float = float(os.getenv("THREAD_CACHE_TTL_SEC", "300"))
+THREAD_CACHE_NEGATIVE_TTL_SEC: float = float(os.getenv("THREAD_CACHE_NEGATIVE_TTL_SEC", "3600"))
+# Spare queue threads kept per channel (0 = off: create one per lobby, delete when done).
+# Spares are created in the background or recycled from finished private threads (members
+# removed, messages purged), and deleted after THREAD_POOL_IDLE_SEC unused. A finished
+# thread with THREAD_POOL_PURGE_LIMIT or more messages is deleted instead.
+THREAD_POOL_SIZE: int = int(os.getenv("THREAD_POOL_SIZE", "0"))
+THREAD_POOL_IDLE_SEC: int = int(os.getenv("THREAD_POOL_IDLE_SEC", str(6 * 3600)))
+THREAD_POOL_PURGE_LIMIT: int = int(os.getenv("THREAD_POOL_PURGE_LIMIT", "200"))
+
+# Outbound Discord REST (core.dispatch). Rate + burst stay within Discord's 50 requests in
+# any second so a global 429 never stalls interaction acks; a rate of 0 disables the budget.
+DISCORD_REST_CONCURRENCY: int = int(os.getenv("DISCORD_REST_CONCURRENCY", "16"))
+DISCORD_ROUTE_CONCURRENCY: int = int(os.getenv("DISCORD_ROUTE_CONCURRENCY", "4"))
+DISCORD_GLOBAL_RATE: float = float(os.getenv("DISCORD_GLOBAL_RATE", "40"))
+DISCORD_GLOBAL_BURST: int = int(os.getenv("DISCORD_GLOBAL_BURST", "10"))
+# Share of the global burst cleanup may not use (embed refreshes may use half of it).
+DISCORD_BACKGROUND_RESERVE: float = float(os.getenv("DISCORD_BACKGROUND_RESERVE", "0.25"))
+# Requests per route bucket left for match traffic.
+DISCORD_ROUTE_RESERVE: int = int(os.getenv("DISCORD_ROUTE_RESERVE", "1"))
+# Embed edits that waited this long are dropped and re-requested with fresh content.
+DISCORD_EMBED_STALE_SEC: float = float(os.getenv("DISCORD_EMBED_STALE_SEC", "10"))
 
 # Queue
 QUEUE_SIZE: int = int(os.getenv("QUEUE_SIZE", "10"))
+# "fifo" matches the first QUEUE_SIZE players; "rating" matches the QUEUE_SIZE players
+# with the closest ratings once their spread is within MATCH_MAX_SPREAD (0 = any).
+# Ratings are not computed from results: set them with /setrating or write
+# match_stats "rating" externally; unrated players all get RATING_DEFAULT.
+MATCHMAKING_MODE: str = os.getenv("MATCHMAKING_MODE", "fifo").lower()
+MATCH_MAX_SPREAD: float = float(os.getenv("MATCH_MAX_SPREAD", "300"))
+RATING_DEFAULT: float = float(os.getenv("RATING_DEFAULT", "1500"))
+RATING_CACHE_SIZE: int = int(os.getenv("RATING_CACHE_SIZE", "100000"))
+# Lobbies up to this size are split into teams by trying every split; larger ones greedily.
+TEAM_EXHAUSTIVE_MAX: int = int(os.getenv("TEAM_EXHAUSTIVE_MAX", "14"))
 COOLDOWN_JOIN_SEC: float = float(os.getenv("COOLDOWN_JOIN_SEC", "5"))
 COOLDOWN_LEAVE_SEC: float = float(os.getenv("COOLDOWN_LEAVE_SEC", "5"))
+COOLDOWN_MAX_ENTRIES: int = int(os.getenv("COOLDOWN_MAX_ENTRIES", "100000"))
+# Token buckets shared by /join and /leave; a rate of 0 disables that scope.
+RATE_USER_PER_MIN: float = float(os.getenv("RATE_USER_PER_MIN", "0"))
+RATE_USER_BURST: int = int(os.getenv("RATE_USER_BURST", "5"))
+RATE_CHANNEL_PER_MIN: float = float(os.getenv("RATE_CHANNEL_PER_MIN", "0"))
+RATE_CHANNEL_BURST: int = int(os.getenv("RATE_CHANNEL_BURST", "60"))
+RATE_GUILD_PER_MIN: float = float(os.getenv("RATE_GUILD_PER_MIN", "0"))
+RATE_GUILD_BURST: int = int(os.getenv("RATE_GUILD_BURST", "300"))
+
+# Channel state
+# Channels with an empty queue are evicted after this much idle time, or when more
+# than STATE_MAX_CHANNELS are resident. Startup only prefetches non-empty queues.
+STATE_IDLE_TTL_SEC: float = float(os.getenv("STATE_IDLE_TTL_SEC", "1800"))
+STATE_MAX_CHANNELS: int = int(os.getenv("STATE_MAX_CHANNELS", "5000"))
+STATE_EVICT_INTERVAL_SEC: float = float(os.getenv("STATE_EVICT_INTERVAL_SEC", "60"))
+STATE_PREFETCH_LIMIT: int = int(os.getenv("STATE_PREFETCH_LIMIT", "500"))
+# Gateway events keep state in sync; this sweep only catches events missed while disconnected.
+RECONCILE_SWEEP_SEC: float = float(os.getenv("RECONCILE_SWEEP_SEC", "600"))
+RECONCILE_SWEEP_BATCH: int = int(os.getenv("RECONCILE_SWEEP_BATCH", "200"))
+# Warm start: resident state is snapshotted to SNAPSHOT_PATH every SNAPSHOT_INTERVAL_SEC
+# (if it changed) and on shutdown. A snapshot younger than SNAPSHOT_MAX_AGE_SEC is served
+# at startup while Mongo connects and is reconciled in the background. Empty path disables.
+SNAPSHOT_PATH: str = os.getenv("SNAPSHOT_PATH", "queue_state.snap")
+SNAPSHOT_INTERVAL_SEC: float = float(os.getenv("SNAPSHOT_INTERVAL_SEC", "30"))
+SNAPSHOT_MAX_AGE_SEC: float = float(os.getenv("SNAPSHOT_MAX_AGE_SEC", "3600"))
+
+# Embed rendering
+EMBED_RENDER_WINDOW_SEC: float = float(os.getenv("EMBED_RENDER_WINDOW_SEC", "1.0"))
+
+# Metrics
+# Prometheus text endpoint at http://METRICS_HOST:METRICS_PORT/metrics; 0 disables it.
+METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+LOOP_LAG_PROBE_SEC: float = float(os.getenv("LOOP_LAG_PROBE_SEC", "0.5"))
+# /profile (core.profiling): reports go to PROFILE_DIR; stacks are sampled every PROFILE_SAMPLE_MS
+# and loop callbacks slower than PROFILE_SLOW_CALLBACK_MS are recorded.
+PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_MS: float = float(os.getenv("PROFILE_SAMPLE_MS", "10"))
+PROFILE_SLOW_CALLBACK_MS: float = float(os.getenv("PROFILE_SLOW_CALLBACK_MS", "50"))
+PROFILE_MAX_SEC: int = int(os.getenv("PROFILE_MAX_SEC", "300"))
+# Command trace for bench.replay (core.trace): JSONL appended to TRACE_PATH; unset disables it.
+TRACE_PATH: str | None = os.getenv("TRACE_PATH")
+TRACE_FLUSH_SEC: float = float(os.getenv("TRACE_FLUSH_SEC", "1"))
+
+# Admission control (core.admission). Loop lag over ADMISSION_DEFER_LAG_SEC defers background
+# work (each item at most ADMISSION_DEFER_MAX_SEC) and turns away /setup; lag over
+# ADMISSION_SHED_LAG_SEC, or ADMISSION_MAX_INFLIGHT running commands, gets every command a
+# fast "busy" reply. 0 disables a threshold. Percentiles cover the last ADMISSION_LAG_WINDOW samples.
+ADMISSION_DEFER_LAG_SEC: float = float(os.getenv("ADMISSION_DEFER_LAG_SEC", "0.1"))
+ADMISSION_SHED_LAG_SEC: float = float(os.getenv("ADMISSION_SHED_LAG_SEC", "1.0"))
+ADMISSION_MAX_INFLIGHT: int = int(os.getenv("ADMISSION_MAX_INFLIGHT", "500"))
+ADMISSION_DEFER_MAX_SEC: float = float(os.getenv("ADMISSION_DEFER_MAX_SEC", "30"))
+ADMISSION_LAG_WINDOW: int = int(os.getenv("ADMISSION_LAG_WINDOW", "120"))
 
 # Logging
 LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
 LOG_FILE: str | None = os.getenv("LOG_FILE")
+LOG_JSON: bool = os.getenv("LOG_JSON", "0") == "1"
+# Format and write log records on a background thread instead of the event loop.
+LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "1") == "1"
+# High-volume events (by message prefix) are capped at LOG_SAMPLE_PER_SEC records per second each.
+LOG_SAMPLE_PREFIXES: list[str] = [
+    p.strip() for p in os.getenv("LOG_SAMPLE_PREFIXES", "thread_add_user_,thread_remove_user_").split(",") if p.strip()
+]
+LOG_SAMPLE_PER_SEC: float = float(os.getenv("LOG_SAMPLE_PER_SEC", "5"))
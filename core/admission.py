@@ -0,0 +1,174 @@
+"""Admission control driven by event-loop lag.
+
+Everything shares one asyncio loop, so when it falls behind every interaction
+slows down together until Discord's 3-second window runs out. The lag probe
+(core.metrics) feeds samples in here. Load is then shed in order:
+
+* PRESSURE (lag >= ADMISSION_DEFER_LAG_SEC): background work (embed refreshes,
+  thread cleanup, sweeps, snapshots) waits in ``wait_calm`` for up to
+  ADMISSION_DEFER_MAX_SEC, and heavy admin commands (/setup) are turned away;
+* OVERLOAD (lag >= ADMISSION_SHED_LAG_SEC, or ADMISSION_MAX_INFLIGHT commands
+  already running): every command gets an immediate ephemeral "busy, retry"
+  reply instead of timing out.
+
+"Lag" is the worst of the last few probe samples and how overdue the probe is
+right now, so a stall in progress counts before its sample arrives.
+"""
+import asyncio
+import functools
+import time
+from collections import deque
+from typing import Deque, Dict
+
+import discord
+from logging import getLogger
+
+from config import (
+    ADMISSION_DEFER_LAG_SEC,
+    ADMISSION_DEFER_MAX_SEC,
+    ADMISSION_LAG_WINDOW,
+    ADMISSION_MAX_INFLIGHT,
+    ADMISSION_SHED_LAG_SEC,
+)
+from core.metrics import LAG_LISTENERS, Counter, probe_overdue, register, stats_gauge
+from core.trace import note_outcome
+
+log = getLogger("bot")
+
+CALM, PRESSURE, OVERLOAD = 0, 1, 2
+
+BUSY_REPLY = "The bot is busy right now. Please try again in a few seconds."
+
+ADMISSION_SHED = register(Counter(
+    "matchmaker_admission_shed_total", "Commands answered with a busy reply instead of run.", ("command",),
+))
+ADMISSION_DEFERRED = register(Counter(
+    "matchmaker_admission_deferred_total", "Background work held back while the loop was lagging.", ("kind",),
+))
+
+# Samples that make up "recent" lag; at the default 0.5 s probe, the last 1.5 s.
+_RECENT = 3
+
+
+class AdmissionController:
+    def __init__(self, defer_lag: float, shed_lag: float, max_inflight: int, window: int, defer_max: float):
+        self.defer_lag = defer_lag
+        self.shed_lag = shed_lag
+        self.max_inflight = max_inflight
+        self.defer_max = defer_max
+        self.inflight = 0
+        self._samples: Deque[float] = deque(maxlen=max(window, _RECENT))
+        self._level = CALM
+        self.stats: Dict[str, float] = {
+            "admitted": 0,
+            "shed": 0,
+            "deferred": 0,
+            "deferred_seconds": 0.0,
+            "overloads": 0,
+        }
+
+    def observe(self, lag: float):
+        self._samples.append(lag)
+
+    def lag(self) -> float:
+        recent = max((self._samples[-i] for i in range(1, min(_RECENT, len(self._samples)) + 1)), default=0.0)
+        return max(recent, probe_overdue())
+
+    def level(self) -> int:
+        lag = self.lag()
+        if (self.shed_lag > 0 and lag >= self.shed_lag) or (
+            self.max_inflight > 0 and self.inflight >= self.max_inflight
+        ):
+            level = OVERLOAD
+        elif self.defer_lag > 0 and lag >= self.defer_lag:
+            level = PRESSURE
+        else:
+            level = CALM
+        if level != self._level:
+            if level == OVERLOAD:
+                self.stats["overloads"] += 1
+            log.info("admission_level", extra={"level": level, "lag": round(lag, 3), "inflight": self.inflight})
+            self._level = level
+        return level
+
+    def admit(self, command: str, heavy: bool = False) -> bool:
+        level = self.level()
+        if level == OVERLOAD or (heavy and level >= PRESSURE):
+            self.stats["shed"] += 1
+            ADMISSION_SHED.inc(command)
+            return False
+        self.stats["admitted"] += 1
+        return True
+
+    async def wait_calm(self, kind: str):
+        """Hold background work while the loop is lagging (at most ``defer_max`` seconds)."""
+        if self.level() == CALM:
+            return
+        started = time.monotonic()
+        self.stats["deferred"] += 1
+        ADMISSION_DEFERRED.inc(kind)
+        while self.level() != CALM and time.monotonic() - started < self.defer_max:
+            await asyncio.sleep(0.25)
+        self.stats["deferred_seconds"] += time.monotonic() - started
+
+    def percentiles(self) -> Dict[str, float]:
+        ordered = sorted(self._samples)
+        if not ordered:
+            return {"lag_p50": 0.0, "lag_p95": 0.0, "lag_p99": 0.0}
+
+        def pick(pct: float) -> float:
+            return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+        return {"lag_p50": pick(50), "lag_p95": pick(95), "lag_p99": pick(99)}
+
+    def snapshot_stats(self) -> Dict[str, float]:
+        stats = dict(self.stats)
+        stats.update(self.percentiles())
+        stats["lag"] = round(self.lag(), 4)
+        stats["level"] = self._level
+        stats["inflight"] = self.inflight
+        return stats
+
+
+ADMISSION = AdmissionController(
+    ADMISSION_DEFER_LAG_SEC,
+    ADMISSION_SHED_LAG_SEC,
+    ADMISSION_MAX_INFLIGHT,
+    ADMISSION_LAG_WINDOW,
+    ADMISSION_DEFER_MAX_SEC,
+)
+LAG_LISTENERS.append(ADMISSION.observe)
+stats_gauge("matchmaker_admission", "Loop lag percentiles (recent window), load level, in-flight and shed counts.",
+            ADMISSION.snapshot_stats)
+
+
+async def _reply_busy(interaction: discord.Interaction):
+    note_outcome(interaction, "busy")
+    try:
+        await interaction.response.send_message(BUSY_REPLY, ephemeral=True)
+    except discord.HTTPException as exc:
+        log.debug("busy_reply_fail", extra={"err": repr(exc)})
+
+
+def admission_control(heavy: bool = False):
+    """Wrap a slash-command callback so it is turned away fast when the bot is overloaded.
+
+    ``heavy`` commands are also turned away under pressure.
+    """
+
+    def decorator(fn):
+        command = fn.__name__.removesuffix("_cmd")
+
+        @functools.wraps(fn)
+        async def wrapper(interaction, *args, **kwargs):
+            if not ADMISSION.admit(command, heavy):
+                return await _reply_busy(interaction)
+            ADMISSION.inflight += 1
+            try:
+                return await fn(interaction, *args, **kwargs)
+            finally:
+                ADMISSION.inflight -= 1
+
+        return wrapper
+
+    return decorator
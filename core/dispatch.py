@@ -0,0 +1,329 @@
+"""Prioritised scheduler for the bot's own outbound Discord REST calls.
+
+Interaction responses are not routed through here. Each interaction has its
+own bucket and Discord exempts them from the global rate limit. What can
+still stall them is a global 429: discord.py then blocks every request,
+acks included, until the reset. The dispatcher keeps the rest of the bot's
+traffic under DISCORD_GLOBAL_RATE so that doesn't happen. Within that
+budget it admits work by priority class (match > embed > cleanup):
+
+* at most DISCORD_REST_CONCURRENCY calls in flight, and
+  DISCORD_ROUTE_CONCURRENCY per route (method + path with the major id);
+* route buckets learned from Discord's rate-limit headers (via the aiohttp
+  trace hooked into the bot's HTTP session). Lower classes leave the last
+  DISCORD_ROUTE_RESERVE requests of a bucket to higher ones;
+* a share of the global budget (DISCORD_BACKGROUND_RESERVE) that cleanup
+  can't touch and embed refreshes can only half use;
+* requests that waited past their ``stale_after`` are rejected with
+  ``StaleRequest`` instead of being sent late.
+"""
+import asyncio
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import aiohttp
+from logging import getLogger
+
+from config import (
+    DISCORD_BACKGROUND_RESERVE,
+    DISCORD_GLOBAL_BURST,
+    DISCORD_GLOBAL_RATE,
+    DISCORD_REST_CONCURRENCY,
+    DISCORD_ROUTE_CONCURRENCY,
+    DISCORD_ROUTE_RESERVE,
+)
+from core.metrics import DISCORD_LATENCY, Counter, Histogram, register, stats_gauge
+
+log = getLogger("bot")
+
+
+class Priority(IntEnum):
+    MATCH = 0  # thread creation, member adds, match announcements
+    EMBED = 1  # queue embed edits/sends
+    CLEANUP = 2  # thread deletes, warnings, member removals
+
+
+class StaleRequest(Exception):
+    """The request waited longer than its ``stale_after`` and was not sent."""
+
+
+REST_QUEUE_WAIT = register(Histogram(
+    "matchmaker_rest_queue_wait_seconds",
+    "Time outbound REST calls waited for admission, by priority class.",
+    ("priority",),
+))
+REST_REJECTED = register(Counter(
+    "matchmaker_rest_rejected_total", "REST calls dropped as stale before sending.", ("priority",),
+))
+
+_MAJOR = frozenset(("channels", "guilds", "webhooks"))
+# Scan at most this many waiters per class on each pump.
+_SCAN_LIMIT = 64
+
+
+def route_key(method: str, path: str) -> str:
+    """Normalise a request to Discord's bucket granularity.
+
+    The first id after channels/guilds/webhooks is the major parameter and
+    stays; other ids become ``{id}``. ``route_key("PATCH", "/channels/1/messages/2")``
+    -> ``"PATCH /channels/1/messages/{id}"``. Full URLs (as seen by the trace)
+    normalise to the same key.
+    """
+    path = path.split("?", 1)[0]
+    parts = [p for p in path.split("/") if p]
+    if "api" in parts:
+        parts = parts[parts.index("api") + 1:]
+        if parts and parts[0].startswith("v") and parts[0][1:].isdigit():
+            parts = parts[1:]
+    out = []
+    major_seen = False
+    for i, seg in enumerate(parts):
+        if seg.isdigit():
+            if not major_seen and i and parts[i - 1] in _MAJOR:
+                out.append(seg)
+                major_seen = True
+            else:
+                out.append("{id}")
+        else:
+            out.append(seg)
+    return f"{method.upper()} /" + "/".join(out)
+
+
+class _Waiter:
+    __slots__ = ("priority", "route", "future", "enqueued", "stale_at")
+
+    def __init__(self, priority: Priority, route: str, future: asyncio.Future, stale_after: Optional[float]):
+        self.priority = priority
+        self.route = route
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.stale_at = self.enqueued + stale_after if stale_after else None
+
+
+class RestDispatcher:
+    def __init__(
+        self,
+        concurrency: int,
+        route_concurrency: int,
+        global_rate: float,
+        global_burst: int,
+        background_reserve: float,
+        route_reserve: int,
+    ):
+        self.concurrency = max(concurrency, 1)
+        self.route_concurrency = max(route_concurrency, 1)
+        self.global_rate = global_rate
+        self.global_burst = max(global_burst, 1)
+        self.background_reserve = min(max(background_reserve, 0.0), 0.9)
+        self.route_reserve = max(route_reserve, 0)
+        self._queues: Dict[Priority, Deque[_Waiter]] = {p: deque() for p in Priority}
+        self._in_flight = 0
+        self._route_in_flight: Dict[str, int] = {}
+        # route -> (remaining, resets_at) from the last response on that route.
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+        self._tokens = float(self.global_burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[str, int] = {"admitted": 0, "queued": 0, "stale": 0, "route_429": 0, "global_429": 0}
+
+    # -- admission ---------------------------------------------------------
+
+    def _refill(self, now: float):
+        if self.global_rate > 0:
+            self._tokens = min(self.global_burst, self._tokens + (now - self._refilled) * self.global_rate)
+        self._refilled = now
+
+    def _global_floor(self, priority: Priority) -> float:
+        """Tokens that must remain after this class takes one."""
+        reserve = self.global_burst * self.background_reserve
+        if priority == Priority.CLEANUP:
+            return reserve
+        if priority == Priority.EMBED:
+            return reserve / 2
+        return 0.0
+
+    def _blocked_until(self, priority: Priority, route: str, now: float) -> Optional[float]:
+        """None if the request may go now, else when to look again (0 = on next completion)."""
+        if self._in_flight >= self.concurrency or self._route_in_flight.get(route, 0) >= self.route_concurrency:
+            return 0.0
+        if now < self._paused_until:
+            return self._paused_until
+        bucket = self._buckets.get(route)
+        if bucket is not None:
+            remaining, resets_at = bucket
+            keep = 0 if priority == Priority.MATCH else self.route_reserve
+            if remaining <= keep and now < resets_at:
+                return resets_at
+        if self.global_rate > 0:
+            need = 1 + self._global_floor(priority)
+            if self._tokens < need:
+                return now + (need - self._tokens) / self.global_rate
+        return None
+
+    def _admit(self, waiter: _Waiter, now: float):
+        self._in_flight += 1
+        self._route_in_flight[waiter.route] = self._route_in_flight.get(waiter.route, 0) + 1
+        if self.global_rate > 0:
+            self._tokens -= 1
+        bucket = self._buckets.get(waiter.route)
+        if bucket is not None and now < bucket[1]:
+            # Count our own request against the bucket until the response updates it.
+            self._buckets[waiter.route] = (bucket[0] - 1, bucket[1])
+        self.stats["admitted"] += 1
+        REST_QUEUE_WAIT.observe(now - waiter.enqueued, waiter.priority.name.lower())
+        waiter.future.set_result(None)
+
+    def _pump(self):
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        wake: Optional[float] = None
+        for priority in Priority:
+            queue = self._queues[priority]
+            scanned = 0
+            i = 0
+            while i < len(queue) and scanned < _SCAN_LIMIT:
+                waiter = queue[i]
+                scanned += 1
+                if waiter.future.done():  # cancelled by its caller
+                    del queue[i]
+                    continue
+                if waiter.stale_at is not None and now >= waiter.stale_at:
+                    del queue[i]
+                    self.stats["stale"] += 1
+                    REST_REJECTED.inc(priority.name.lower())
+                    waiter.future.set_exception(StaleRequest(waiter.route))
+                    continue
+                blocked = self._blocked_until(priority, waiter.route, now)
+                if blocked is None:
+                    del queue[i]
+                    self._admit(waiter, now)
+                    continue
+                if blocked:
+                    wake = blocked if wake is None else min(wake, blocked)
+                if waiter.stale_at is not None:
+                    wake = waiter.stale_at if wake is None else min(wake, waiter.stale_at)
+                i += 1
+        if wake is not None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(max(wake - now, 0.001), self._pump)
+
+    def _kick(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._pump()
+
+    def _release(self, route: str):
+        self._in_flight -= 1
+        left = self._route_in_flight.get(route, 1) - 1
+        if left > 0:
+            self._route_in_flight[route] = left
+        else:
+            self._route_in_flight.pop(route, None)
+        if self.queued():
+            self._kick()
+
+    async def call(
+        self,
+        priority: Priority,
+        route: str,
+        op: str,
+        fn: Callable[..., Awaitable[Any]],
+        *args,
+        stale_after: Optional[float] = None,
+        **kwargs,
+    ):
+        """Wait for admission, then run ``fn(*args, **kwargs)`` timed as ``op``."""
+        now = time.monotonic()
+        self._refill(now)
+        if not any(self._queues.values()) and self._blocked_until(priority, route, now) is None:
+            waiter = _Waiter(priority, route, asyncio.get_running_loop().create_future(), None)
+            self._admit(waiter, now)
+        else:
+            waiter = _Waiter(priority, route, asyncio.get_running_loop().create_future(), stale_after)
+            self._queues[priority].append(waiter)
+            self.stats["queued"] += 1
+            self._kick()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    self._release(route)  # admitted just as the caller gave up
+                raise  # otherwise the cancelled future is dropped by the next pump
+        try:
+            async with DISCORD_LATENCY.time(op):
+                return await fn(*args, **kwargs)
+        finally:
+            self._release(route)
+
+    # -- rate-limit feedback -------------------------------------------------
+
+    def observe(self, method: str, url: str, status: int, headers) -> None:
+        """Record the bucket state from a response's rate-limit headers."""
+        now = time.monotonic()
+        if status == 429:
+            retry = _float(headers.get("Retry-After")) or 1.0
+            if headers.get("X-RateLimit-Global") or headers.get("X-RateLimit-Scope") == "global":
+                self.stats["global_429"] += 1
+                self._paused_until = max(self._paused_until, now + retry)
+                self._tokens = 0.0
+                log.warning("rest_global_ratelimit", extra={"retry_after": retry})
+            else:
+                self.stats["route_429"] += 1
+                self._buckets[route_key(method, url)] = (0, now + retry)
+            return
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = _float(headers.get("X-RateLimit-Reset-After"))
+        if remaining is None or reset_after is None:
+            return
+        try:
+            self._buckets[route_key(method, url)] = (int(remaining), now + reset_after)
+        except ValueError:
+            return
+        if len(self._buckets) > 4096:
+            self._buckets = {k: v for k, v in self._buckets.items() if v[1] > now}
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp trace feeding ``observe``; pass as the bot's ``http_trace``."""
+
+        async def on_request_end(session, context, params: aiohttp.TraceRequestEndParams):
+            self.observe(params.method, str(params.url), params.response.status, params.response.headers)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    # -- introspection -------------------------------------------------------
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def snapshot_stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = dict(self.stats)
+        stats["in_flight"] = self._in_flight
+        stats["tokens"] = round(self._tokens, 2)
+        for priority, queue in self._queues.items():
+            stats[f"queued_{priority.name.lower()}"] = len(queue)
+        return stats
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+REST = RestDispatcher(
+    DISCORD_REST_CONCURRENCY,
+    DISCORD_ROUTE_CONCURRENCY,
+    DISCORD_GLOBAL_RATE,
+    DISCORD_GLOBAL_BURST,
+    DISCORD_BACKGROUND_RESERVE,
+    DISCORD_ROUTE_RESERVE,
+)
+stats_gauge("matchmaker_rest_dispatch", "Outbound REST admission counters, in-flight calls and queue depths.",
+            REST.snapshot_stats)
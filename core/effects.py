@@ -0,0 +1,264 @@
+"""Runs queue-engine outboxes outside the channel lock.
+
+Each channel gets a short-lived worker that applies its outboxes strictly in
+submission order, so thread creation, announcements and deletions never race
+each other, while different channels proceed concurrently.
+"""
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import discord
+from logging import getLogger
+
+from config import QUEUE_THREAD_DELETE_AFTER_SEC
+from core.engine import (
+    AnnounceMatch,
+    CloseQueueThread,
+    DeleteThread,
+    EnsureThread,
+    Persist,
+    QueueResult,
+    ReleaseMembers,
+    RemoveMembers,
+    RenderEmbed,
+)
+from core.dispatch import REST, Priority, route_key
+from core.metrics import gauge_fn
+from core.queue import ChannelState
+from core.state import EVICTION_GUARDS, MEMBERSHIP, STATE, update_embed
+from core.threads import (
+    add_members_to_thread,
+    delete_thread,
+    ensure_queue_thread,
+    fetch_thread,
+    recycle_thread,
+    remove_members_from_thread,
+    schedule_thread_cleanup,
+)
+from db.mongo import persist_queue_doc, record_match
+
+log = getLogger("bot")
+
+_Batch = Tuple[discord.Client, discord.TextChannel, QueueResult]
+
+_PENDING: Dict[int, Deque[_Batch]] = {}
+_WORKERS: Dict[int, asyncio.Task] = {}
+# A channel with outboxes still running must stay resident.
+EVICTION_GUARDS.append(lambda channel_id: channel_id in _WORKERS)
+gauge_fn("matchmaker_effect_backlog", "Outboxes waiting to be applied, across channels.",
+         lambda: sum(len(p) for p in _PENDING.values()))
+
+
+def submit(client: discord.Client, channel: discord.TextChannel, result: QueueResult):
+    """Queue ``result.effects`` for ``channel``; returns immediately."""
+    if not result.effects:
+        return
+    pending = _PENDING.setdefault(channel.id, deque())
+    pending.append((client, channel, result))
+    worker = _WORKERS.get(channel.id)
+    if worker is None or worker.done():
+        _WORKERS[channel.id] = asyncio.create_task(_drain_channel(channel.id))
+
+
+def discard(channel_id: int) -> int:
+    """Drop outboxes not yet started for a channel that no longer exists."""
+    pending = _PENDING.get(channel_id)
+    if not pending:
+        return 0
+    dropped = len(pending)
+    pending.clear()
+    return dropped
+
+
+async def drain():
+    """Wait until every submitted outbox has been applied."""
+    while _WORKERS:
+        await asyncio.gather(*list(_WORKERS.values()), return_exceptions=True)
+
+
+async def _drain_channel(channel_id: int):
+    pending = _PENDING.get(channel_id)
+    try:
+        while pending:
+            client, channel, result = pending.popleft()
+            for effect in result.effects:
+                try:
+                    await _apply(client, channel, result.epoch, effect)
+                except Exception as exc:
+                    log.warning(
+                        "effect_fail",
+                        extra={"channel_id": channel_id, "effect": type(effect).__name__, "err": repr(exc)},
+                    )
+    finally:
+        _PENDING.pop(channel_id, None)
+        _WORKERS.pop(channel_id, None)
+
+
+def _current(channel: discord.TextChannel, epoch: int) -> Optional[ChannelState]:
+    """The channel's state, or None if it was reset after the outbox was produced."""
+    data = STATE.get(channel.id)
+    if data is None or data.epoch != epoch:
+        return None
+    return data
+
+
+async def _persist(channel: discord.TextChannel):
+    try:
+        await persist_queue_doc(channel, STATE)
+    except Exception as exc:
+        log.warning("persist_queue_fail", extra={"channel_id": channel.id, "err": repr(exc)})
+
+
+async def _current_thread(
+    client: discord.Client,
+    channel: discord.TextChannel,
+    data: ChannelState,
+    priority: Priority = Priority.MATCH,
+):
+    thread_id = data.queue_thread_id
+    if not thread_id:
+        return None
+    thread = await fetch_thread(client, thread_id, priority)
+    if thread is None and data.queue_thread_id == thread_id:
+        data.queue_thread_id = None
+        await _persist(channel)
+    return thread
+
+
+async def _apply(client: discord.Client, channel: discord.TextChannel, epoch: int, effect):
+    if isinstance(effect, RenderEmbed):
+        await update_embed(channel, immediate=effect.immediate)
+    elif isinstance(effect, Persist):
+        await _persist(channel)
+    elif isinstance(effect, ReleaseMembers):
+        await MEMBERSHIP.release(effect.user_ids, channel.id)
+    elif isinstance(effect, EnsureThread):
+        await _ensure_thread(client, channel, epoch, effect)
+    elif isinstance(effect, RemoveMembers):
+        data = _current(channel, epoch)
+        if data is None:
+            return
+        thread = await _current_thread(client, channel, data, Priority.CLEANUP)
+        if thread:
+            try:
+                await remove_members_from_thread(thread, channel.guild, effect.user_ids)
+            except Exception as exc:
+                log.debug("thread_member_remove_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+    elif isinstance(effect, CloseQueueThread):
+        await _close_queue_thread(client, channel, epoch, effect)
+    elif isinstance(effect, DeleteThread):
+        thread = await fetch_thread(client, effect.thread_id, Priority.CLEANUP)
+        if thread:
+            await delete_thread(thread, effect.reason)
+    elif isinstance(effect, AnnounceMatch):
+        await _announce_match(client, channel, epoch, effect)
+    else:
+        raise TypeError(f"unknown effect {effect!r}")
+
+
+async def _ensure_thread(client: discord.Client, channel: discord.TextChannel, epoch: int, effect: EnsureThread):
+    data = _current(channel, epoch)
+    if data is None:
+        return
+    before = data.queue_thread_id
+    thread, created = await ensure_queue_thread(client, channel, data)
+    if data.queue_thread_id != before:
+        await _persist(channel)
+    if not thread:
+        return
+    members_to_add = list(effect.user_ids)
+    if created:
+        # A fresh thread also needs everyone who queued before it existed.
+        members_to_add.extend(uid for uid in data.queue if uid not in effect.user_ids)
+    if members_to_add:
+        try:
+            await add_members_to_thread(thread, channel.guild, members_to_add)
+        except Exception as exc:
+            log.debug("thread_member_add_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+
+
+async def _close_queue_thread(
+    client: discord.Client,
+    channel: discord.TextChannel,
+    epoch: int,
+    effect: CloseQueueThread,
+):
+    data = _current(channel, epoch)
+    if data is None or data.queue:
+        return
+    thread = await _current_thread(client, channel, data, Priority.CLEANUP)
+    if not thread:
+        return
+    data.queue_thread_id = None
+    await _persist(channel)
+    if await recycle_thread(client, thread):
+        return
+    try:
+        await delete_thread(thread, effect.reason)
+    except Exception as exc:
+        log.warning("thread_delete_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+
+
+async def _announce(target, content: str):
+    await REST.call(
+        Priority.MATCH, route_key("POST", f"/channels/{target.id}/messages"), "message_send", target.send, content
+    )
+
+
+def _team_lines(effect: AnnounceMatch) -> str:
+    if not effect.teams:
+        return ""
+    rating_of = dict(zip(effect.players, effect.ratings))
+    lines = []
+    for n, team in enumerate(effect.teams, 1):
+        avg = sum(rating_of.get(uid, 0.0) for uid in team) / len(team) if team else 0.0
+        lines.append(f"Team {n} (avg {avg:.0f}): " + " ".join(f"<@{uid}>" for uid in team))
+    return "\n".join(lines)
+
+
+async def _announce_match(client: discord.Client, channel: discord.TextChannel, epoch: int, effect: AnnounceMatch):
+    data = _current(channel, epoch)
+    match_thread = await _current_thread(client, channel, data) if data is not None else None
+    if match_thread is not None:
+        # The lobby keeps this thread; the next /join starts a new one.
+        data.queue_thread_id = None
+        await _persist(channel)
+
+    players = list(effect.players)
+    mentions = " ".join(f"<@{uid}>" for uid in players)
+    lineup = _team_lines(effect) or f"Players: {mentions}"
+    teams = [list(team) for team in effect.teams] or None
+    ratings = list(effect.ratings) or None
+    if match_thread:
+        if effect.leftover:
+            try:
+                await remove_members_from_thread(match_thread, channel.guild, effect.leftover)
+            except Exception as exc:
+                log.debug("thread_member_remove_fail", extra={"thread_id": match_thread.id, "err": repr(exc)})
+        try:
+            await _announce(match_thread, f"Queue full - match ready!\n{lineup}\nGood luck and have fun!")
+        except Exception as exc:
+            log.warning("thread_announce_fail", extra={"thread_id": match_thread.id, "err": repr(exc)})
+        try:
+            await record_match(channel.guild.id, channel.id, players, match_thread.id, teams, ratings)
+        except Exception as exc:
+            log.warning("record_match_fail", extra={"thread_id": match_thread.id, "err": repr(exc)})
+        try:
+            await schedule_thread_cleanup(
+                client,
+                match_thread,
+                delete_after=QUEUE_THREAD_DELETE_AFTER_SEC,
+                warn_before=0,
+            )
+        except Exception as exc:
+            log.warning("thread_schedule_fail", extra={"thread_id": match_thread.id, "err": repr(exc)})
+    else:
+        try:
+            await _announce(channel, f"Queue is full! (thread unavailable)\n{lineup}")
+        except Exception:
+            pass
+        try:
+            await record_match(channel.guild.id, channel.id, players, None, teams, ratings)
+        except Exception as exc:
+            log.warning("record_match_fail", extra={"channel_id": channel.id, "err": repr(exc)})
@@ -0,0 +1,194 @@
+"""Pure in-memory queue transitions.
+
+Every function here mutates channel state synchronously and returns the network
+side effects it implies as an outbox. Nothing in this module awaits, so callers
+can hold the channel lock for microseconds and run the outbox afterwards with
+``core.effects``.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from config import MATCH_MAX_SPREAD, MATCHMAKING_MODE, QUEUE_SIZE
+from core import matchmaking
+from core.queue import ChannelState
+
+JOINED = "joined"
+LEFT = "left"
+CLEARED = "cleared"
+ALREADY_QUEUED = "already_queued"
+QUEUED_ELSEWHERE = "queued_elsewhere"
+NOT_QUEUED = "not_queued"
+
+
+@dataclass(frozen=True)
+class RenderEmbed:
+    immediate: bool = False
+
+
+@dataclass(frozen=True)
+class Persist:
+    pass
+
+
+@dataclass(frozen=True)
+class ReleaseMembers:
+    """Drop the users' cross-channel queue claims."""
+    user_ids: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class EnsureThread:
+    """Make sure the channel has a queue thread and add ``user_ids`` to it."""
+    user_ids: Tuple[int, ...] = ()
+
+
+@dataclass(frozen=True)
+class RemoveMembers:
+    user_ids: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class CloseQueueThread:
+    """Delete the current queue thread if the queue is still empty when this runs."""
+    reason: str
+
+
+@dataclass(frozen=True)
+class DeleteThread:
+    thread_id: int
+    reason: str
+
+
+@dataclass(frozen=True)
+class AnnounceMatch:
+    players: Tuple[int, ...]
+    leftover: Tuple[int, ...] = ()
+    # Rating matchmaking only: two balanced teams and ratings aligned with ``players``.
+    teams: Tuple[Tuple[int, ...], ...] = ()
+    ratings: Tuple[float, ...] = ()
+
+
+@dataclass
+class QueueResult:
+    status: str
+    epoch: int = 0
+    size: int = 0
+    other_channel_id: Optional[int] = None
+    cleared: int = 0
+    match_players: Tuple[int, ...] = ()
+    effects: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (JOINED, LEFT, CLEARED)
+
+
+def _release(members: Dict[int, int], channel_id: int, user_ids) -> None:
+    for uid in user_ids:
+        if members.get(uid) == channel_id:
+            members.pop(uid, None)
+
+
+def _take_match(data: ChannelState, uid: int) -> Optional[AnnounceMatch]:
+    """Remove and describe the match ``uid``'s join completed, if any."""
+    queue = data.queue
+    if MATCHMAKING_MODE == "rating":
+        picked = matchmaking.take_match(data, uid, QUEUE_SIZE, MATCH_MAX_SPREAD)
+        if picked is None:
+            return None
+        players, teams, ratings = picked
+        return AnnounceMatch(players=players, leftover=tuple(queue), teams=teams, ratings=ratings)
+    if len(queue) < QUEUE_SIZE:
+        return None
+    players = tuple(queue.pop_n(QUEUE_SIZE))
+    return AnnounceMatch(players=players, leftover=tuple(queue))
+
+
+def join(
+    data: ChannelState,
+    channel_id: int,
+    uid: int,
+    members: Dict[int, int],
+    joined_at: Optional[float] = None,
+) -> QueueResult:
+    other_ch_id = members.get(uid)
+    if other_ch_id and other_ch_id != channel_id:
+        return QueueResult(QUEUED_ELSEWHERE, other_channel_id=other_ch_id)
+    queue = data.queue
+    if not queue.append(uid, joined_at):
+        return QueueResult(ALREADY_QUEUED)
+
+    members[uid] = channel_id
+    result = QueueResult(JOINED, epoch=data.epoch, size=len(queue))
+    result.effects.append(EnsureThread(user_ids=(uid,)))
+
+    announce = _take_match(data, uid)
+    if announce is not None:
+        match_players = announce.players
+        _release(members, channel_id, match_players)
+        result.match_players = match_players
+        result.effects.insert(0, ReleaseMembers(user_ids=match_players))
+        result.effects.append(announce)
+
+    result.effects.append(RenderEmbed())
+    result.effects.append(Persist())
+    return result
+
+
+def leave(data: ChannelState, channel_id: int, uid: int, members: Dict[int, int]) -> QueueResult:
+    queue = data.queue
+    if not queue.remove(uid):
+        return QueueResult(NOT_QUEUED)
+
+    _release(members, channel_id, (uid,))
+    result = QueueResult(LEFT, epoch=data.epoch, size=len(queue))
+    result.effects.append(ReleaseMembers(user_ids=(uid,)))
+    result.effects.append(RenderEmbed())
+    result.effects.append(Persist())
+    result.effects.append(RemoveMembers(user_ids=(uid,)))
+    if not queue:
+        result.effects.append(CloseQueueThread(reason="Queue emptied before match."))
+    return result
+
+
+def drop_members(data: ChannelState, channel_id: int, user_ids, members: Dict[int, int]) -> QueueResult:
+    """Remove users who can no longer play here (left the guild); like ``leave`` for many."""
+    removed = data.queue.take(user_ids)
+    if not removed:
+        return QueueResult(NOT_QUEUED)
+
+    _release(members, channel_id, removed)
+    result = QueueResult(LEFT, epoch=data.epoch, size=len(data.queue), cleared=len(removed))
+    result.effects.append(ReleaseMembers(user_ids=tuple(removed)))
+    result.effects.append(RenderEmbed())
+    result.effects.append(Persist())
+    if not data.queue:
+        result.effects.append(CloseQueueThread(reason="Queue emptied before match."))
+    return result
+
+
+def clear(
+    data: ChannelState,
+    channel_id: int,
+    members: Dict[int, int],
+    reason: str,
+    reset_embed: bool = False,
+) -> QueueResult:
+    """Empty the queue and detach its thread (``/cancel``, or ``/setup`` with ``reset_embed``)."""
+    cleared_ids = data.queue.clear()
+    _release(members, channel_id, cleared_ids)
+    # Bumping the epoch invalidates thread effects still queued from before the reset.
+    data.epoch += 1
+    thread_id = data.queue_thread_id
+    data.queue_thread_id = None
+    if reset_embed:
+        data.embed_msg_id = None
+
+    result = QueueResult(CLEARED, epoch=data.epoch, cleared=len(cleared_ids))
+    if cleared_ids:
+        result.effects.append(ReleaseMembers(user_ids=tuple(cleared_ids)))
+    result.effects.append(RenderEmbed(immediate=reset_embed))
+    result.effects.append(Persist())
+    if thread_id:
+        result.effects.append(DeleteThread(thread_id=thread_id, reason=reason))
+    return result
@@ -0,0 +1,288 @@
+"""Rating-based matchmaking: pick the closest-rated group and split it into teams.
+
+Ratings live on each player's match_stats document (``rating``) and are cached
+here. Nothing derives them from results: admins set them with ``/setrating`` (or
+an external job writes the field); players without one get RATING_DEFAULT. The engine reads them synchronously, so ``/join`` loads the ratings it
+needs before taking the channel lock. With numpy installed, the scans and the
+team search are vectorized; the pure-Python fallback returns the same answers.
+"""
+import itertools
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from logging import getLogger
+
+from config import RATING_CACHE_SIZE, RATING_DEFAULT, TEAM_EXHAUSTIVE_MAX
+from core.metrics import stats_gauge
+from core.queue import ChannelState
+from db.mongo import load_ratings, set_rating
+
+log = getLogger("bot")
+
+# numpy (in requirements.txt) for the window scans and team search. Imported on
+# first use so FIFO deployments don't pay its import time at startup; without it
+# the pure-Python fallback runs, about an order of magnitude slower per split.
+np = None
+_NUMPY_CHECKED = False
+
+
+def _load_numpy():
+    global np, _NUMPY_CHECKED
+    if not _NUMPY_CHECKED:
+        _NUMPY_CHECKED = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:  # pragma: no cover - depends on environment
+            np = None
+
+
+MATCHMAKING_STATS: Dict[str, int] = {
+    "ratings_loaded": 0,
+    "ratings_load_failed": 0,
+    "groups": 0,
+    "full_scans": 0,
+    "exhaustive_splits": 0,
+    "greedy_splits": 0,
+}
+stats_gauge("matchmaker_matchmaking", "Rating cache loads, groups formed and team splits.", lambda: MATCHMAKING_STATS)
+
+# Below this many candidate windows the Python loop beats converting to an array.
+_NUMPY_MIN_WINDOWS = 64
+
+# (guild_id, user_id) -> rating, least recently loaded first.
+_RATINGS: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+
+
+def rating(guild_id: Optional[int], user_id: int) -> float:
+    value = _RATINGS.get((guild_id, user_id))  # type: ignore[arg-type]
+    return RATING_DEFAULT if value is None else value
+
+
+def cache_rating(guild_id: int, user_id: int, value: float):
+    key = (guild_id, user_id)
+    _RATINGS[key] = float(value)
+    _RATINGS.move_to_end(key)
+    while len(_RATINGS) > RATING_CACHE_SIZE:
+        _RATINGS.popitem(last=False)
+
+
+async def ensure_ratings(guild_id: int, user_ids: Iterable[int]) -> int:
+    """Load uncached ratings from Mongo (one query); returns how many were loaded."""
+    missing = [uid for uid in dict.fromkeys(user_ids) if (guild_id, uid) not in _RATINGS]
+    if not missing:
+        return 0
+    found = await load_ratings(guild_id, missing)
+    for uid in missing:
+        cache_rating(guild_id, uid, found.get(uid, RATING_DEFAULT))
+    MATCHMAKING_STATS["ratings_loaded"] += len(missing)
+    return len(missing)
+
+
+async def store_rating(guild_id: int, user_id: int, value: float):
+    """Persist a rating and refresh the cache; a queued player keeps the old one until they rejoin."""
+    await set_rating(guild_id, user_id, value)
+    cache_rating(guild_id, user_id, value)
+
+
+async def prepare_join(data: ChannelState, guild_id: int, user_id: int):
+    """Cache the ratings a join may need; on failure the default rating is used."""
+    ids = [user_id] if data.queue.index is not None else [user_id, *data.queue]
+    try:
+        await ensure_ratings(guild_id, ids)
+    except Exception as exc:
+        MATCHMAKING_STATS["ratings_load_failed"] += 1
+        log.warning("rating_load_fail", extra={"guild_id": guild_id, "user_id": user_id, "err": repr(exc)})
+
+
+class RatingIndex:
+    """Queued players sorted by rating; ``ChannelQueue`` keeps it in step.
+
+    Ratings are captured when a player is added, so a rating change applies
+    from their next join.
+    """
+
+    __slots__ = ("_rating_of", "_keys", "_values", "_ratings", "_dirty")
+
+    def __init__(self, rating_of: Callable[[int], float]):
+        _load_numpy()
+        self._rating_of = rating_of
+        self._keys: List[Tuple[float, int]] = []
+        self._values: List[float] = []
+        self._ratings: Dict[int, float] = {}
+        # Set when a removal (or a bulk load) may have made some window qualify.
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, uid: int):
+        if uid in self._ratings:
+            return
+        value = float(self._rating_of(uid))
+        i = bisect_left(self._keys, (value, uid))
+        self._keys.insert(i, (value, uid))
+        self._values.insert(i, value)
+        self._ratings[uid] = value
+
+    def discard(self, uid: int):
+        value = self._ratings.pop(uid, None)
+        if value is None:
+            return
+        i = bisect_left(self._keys, (value, uid))
+        del self._keys[i]
+        del self._values[i]
+        self._dirty = True
+
+    def clear(self):
+        self._keys.clear()
+        self._values.clear()
+        self._ratings.clear()
+        self._dirty = True
+
+    def rating(self, uid: int) -> Optional[float]:
+        return self._ratings.get(uid)
+
+    def closest_group(self, n: int, around: Optional[int] = None, max_spread: float = 0) -> Optional[List[int]]:
+        """The ``n`` players with the smallest rating spread, or None.
+
+        Only windows containing ``around`` (the player who just joined) can have
+        started qualifying since the last check, so only those ``n`` windows are
+        scanned unless a removal has happened since. ``max_spread`` <= 0 accepts
+        any spread.
+        """
+        total = len(self._keys)
+        if n <= 0 or total < n:
+            return None
+        if around in self._ratings and not self._dirty:
+            pos = bisect_left(self._keys, (self._ratings[around], around))
+            lo, hi = max(pos - n + 1, 0), min(pos, total - n)
+        else:
+            lo, hi = 0, total - n
+            self._dirty = False
+            MATCHMAKING_STATS["full_scans"] += 1
+        values = self._values
+        if np is not None and hi - lo >= _NUMPY_MIN_WINDOWS:
+            window = np.asarray(values[lo:hi + n])
+            spreads = window[n - 1:] - window[: hi - lo + 1]
+            offset = int(spreads.argmin())
+            best, spread = lo + offset, float(spreads[offset])
+        else:
+            best = min(range(lo, hi + 1), key=lambda i: values[i + n - 1] - values[i])
+            spread = values[best + n - 1] - values[best]
+        if max_spread > 0 and spread > max_spread:
+            return None
+        MATCHMAKING_STATS["groups"] += 1
+        return [uid for _, uid in self._keys[best:best + n]]
+
+
+def index_for(data: ChannelState) -> RatingIndex:
+    """The channel's rating index, attached (and seeded) on first use."""
+    index = data.queue.index
+    if not isinstance(index, RatingIndex):
+        index = RatingIndex(partial(rating, data.guild_id))
+        data.queue.attach_index(index)
+    return index
+
+
+@lru_cache(maxsize=None)
+def _splits(n: int):
+    """Every possible first team of size n // 2, each split counted once.
+
+    For even ``n`` a split and its mirror are the same match, so player 0 is
+    pinned to the first team: 126 candidates for 10 players instead of 252.
+    """
+    size = n // 2
+    combos = [c for c in itertools.combinations(range(n), size) if n % 2 or c[0] == 0]
+    mask = None
+    if np is not None:
+        mask = np.zeros((len(combos), n))
+        for row, combo in enumerate(combos):
+            mask[row, list(combo)] = 1.0
+    return combos, mask
+
+
+def _exhaustive(ratings: Sequence[float]) -> Tuple[List[int], List[int]]:
+    n = len(ratings)
+    combos, mask = _splits(n)
+    total = sum(ratings)
+    if mask is not None:
+        sums = mask @ np.asarray(ratings, dtype=float)
+        best = int(np.abs(2 * sums - total).argmin())
+    else:
+        best = min(range(len(combos)), key=lambda i: abs(2 * sum(ratings[j] for j in combos[i]) - total))
+    first = list(combos[best])
+    chosen = set(first)
+    return first, [i for i in range(n) if i not in chosen]
+
+
+def _greedy(ratings: Sequence[float]) -> Tuple[List[int], List[int]]:
+    """Strongest-first into the weaker team, then best single swaps until none helps."""
+    n = len(ratings)
+    caps = (n // 2, n - n // 2)
+    teams: Tuple[List[int], List[int]] = ([], [])
+    sums = [0.0, 0.0]
+    for i in sorted(range(n), key=lambda i: -ratings[i]):
+        side = 0 if sums[0] <= sums[1] else 1
+        if len(teams[side]) >= caps[side]:
+            side = 1 - side
+        teams[side].append(i)
+        sums[side] += ratings[i]
+    diff = sums[0] - sums[1]
+    for _ in range(n):
+        best = None
+        best_diff = abs(diff)
+        for a_pos, a in enumerate(teams[0]):
+            for b_pos, b in enumerate(teams[1]):
+                moved = abs(diff - 2 * (ratings[a] - ratings[b]))
+                if moved < best_diff:
+                    best, best_diff = (a_pos, b_pos), moved
+        if best is None:
+            break
+        a_pos, b_pos = best
+        a, b = teams[0][a_pos], teams[1][b_pos]
+        diff -= 2 * (ratings[a] - ratings[b])
+        teams[0][a_pos], teams[1][b_pos] = b, a
+    return teams[0], teams[1]
+
+
+def split_teams(ratings: Sequence[float]) -> Tuple[List[int], List[int]]:
+    """Positions of two teams (sizes n // 2 and n - n // 2) with the closest rating totals.
+
+    Exhaustive up to TEAM_EXHAUSTIVE_MAX players, greedy with swap refinement beyond.
+    """
+    n = len(ratings)
+    if n < 2:
+        return list(range(n)), []
+    _load_numpy()
+    if n <= TEAM_EXHAUSTIVE_MAX:
+        MATCHMAKING_STATS["exhaustive_splits"] += 1
+        return _exhaustive(ratings)
+    MATCHMAKING_STATS["greedy_splits"] += 1
+    return _greedy(ratings)
+
+
+def take_match(
+    data: ChannelState,
+    user_id: int,
+    size: int,
+    max_spread: float,
+) -> Optional[Tuple[Tuple[int, ...], Tuple[Tuple[int, ...], Tuple[int, ...]], Tuple[float, ...]]]:
+    """Remove the closest-rated group that ``user_id`` completed, if any.
+
+    Returns ``(players, teams, ratings)``: players in join order, two balanced
+    teams, and each player's rating aligned with ``players``.
+    """
+    index = index_for(data)
+    group = index.closest_group(size, around=user_id, max_spread=max_spread)
+    if not group:
+        return None
+    queue = data.queue
+    players = tuple(sorted(group, key=lambda uid: queue.joined_at(uid) or 0.0))
+    ratings = tuple(index.rating(uid) for uid in players)
+    first, second = split_teams(ratings)
+    teams = (tuple(players[i] for i in first), tuple(players[i] for i in second))
+    queue.take(players)
+    return players, teams, ratings
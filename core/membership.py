@@ -0,0 +1,122 @@
+"""Cross-channel "one queue per user" index.
+
+``GLOBAL_Q_MEMBERS`` is this process's view. When several processes (shards)
+serve the bot, the authoritative claim lives in a shared backend: a Mongo
+collection whose ``_id`` is the user id, so inserting a claim is atomic and a
+second channel's claim fails with a duplicate key. Claims record ``claimedAt``
+so the reconcile sweep can find ones no queue lists any more.
+"""
+import datetime as dt
+from typing import Dict, Iterable, List, Optional
+
+from logging import getLogger
+from pymongo.errors import DuplicateKeyError
+
+from config import MEMBERSHIP_BACKEND, SHARD_COUNT, SHARD_IDS
+from core.metrics import MONGO_LATENCY, timed
+from db.breaker import guarded, replayable
+from db import mongo
+
+log = getLogger("bot")
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+def owns_guild(guild_id: Optional[int]) -> bool:
+    """Whether this process serves ``guild_id`` under the configured sharding."""
+    if not SHARD_COUNT or not SHARD_IDS or guild_id is None:
+        return True
+    return shard_for_guild(guild_id, SHARD_COUNT) in SHARD_IDS
+
+
+class InMemoryMembership:
+    """Single-process backend (and test stand-in): the local map is the source of truth."""
+
+    shared = False
+
+    def __init__(self, members: Dict[int, int]):
+        self.members = members
+
+    async def claim(self, user_id: int, channel_id: int, guild_id: Optional[int] = None) -> Optional[int]:
+        """Claim ``user_id`` for ``channel_id``; returns the other channel if already claimed."""
+        owner = self.members.get(user_id)
+        return owner if owner and owner != channel_id else None
+
+    async def release(self, user_ids: Iterable[int], channel_id: int):
+        pass
+
+    async def release_guild(self, guild_id: int):
+        pass
+
+
+class MongoMembership:
+    shared = True
+
+    def __init__(self, collection_getter):
+        self._collection = collection_getter
+
+    @timed(MONGO_LATENCY, "membership_claim")
+    @guarded(mongo.MONGO_BREAKER)
+    async def claim(self, user_id: int, channel_id: int, guild_id: Optional[int] = None) -> Optional[int]:
+        col = self._collection()
+        claim = {"_id": user_id, "channelId": channel_id, "guildId": guild_id,
+                 "claimedAt": dt.datetime.now(dt.timezone.utc)}
+        try:
+            await col.insert_one(claim)
+            return None
+        except DuplicateKeyError:
+            doc = await col.find_one({"_id": user_id}, {"channelId": 1})
+            if doc is None:
+                # Released between our insert and read; try once more.
+                try:
+                    await col.insert_one(claim)
+                    return None
+                except DuplicateKeyError:
+                    doc = await col.find_one({"_id": user_id}, {"channelId": 1}) or {}
+            owner = doc.get("channelId")
+            return owner if owner and owner != channel_id else None
+
+    @timed(MONGO_LATENCY, "membership_release")
+    @replayable(mongo.MONGO_BREAKER)
+    async def release(self, user_ids: Iterable[int], channel_id: int):
+        ids = list(user_ids)
+        if ids:
+            await self._collection().delete_many({"_id": {"$in": ids}, "channelId": channel_id})
+
+    @timed(MONGO_LATENCY, "membership_claims_before")
+    @guarded(mongo.MONGO_BREAKER)
+    async def claims_before(self, cutoff: dt.datetime) -> List[dict]:
+        """Claims made before ``cutoff``, plus any stored before claimedAt was recorded."""
+        col = self._collection()
+        docs = [doc async for doc in col.find({"claimedAt": {"$lt": cutoff}})]
+        docs.extend([doc async for doc in col.find({"claimedAt": {"$exists": False}})])
+        return docs
+
+    @timed(MONGO_LATENCY, "membership_release_claims")
+    @guarded(mongo.MONGO_BREAKER)
+    async def release_claims(self, docs: Iterable[dict]) -> int:
+        """Delete the given claims, each only if it is still the same claim."""
+        col = self._collection()
+        released = 0
+        for doc in docs:
+            claimed_at = doc.get("claimedAt")
+            result = await col.delete_one({
+                "_id": doc["_id"],
+                "channelId": doc.get("channelId"),
+                "claimedAt": claimed_at if claimed_at is not None else {"$exists": False},
+            })
+            released += result.deleted_count
+        return released
+
+    @timed(MONGO_LATENCY, "membership_release_guild")
+    @replayable(mongo.MONGO_BREAKER)
+    async def release_guild(self, guild_id: int):
+        await self._collection().delete_many({"guildId": guild_id})
+
+
+def build_membership(members: Dict[int, int]):
+    if MEMBERSHIP_BACKEND == "mongo":
+        return MongoMembership(lambda: mongo.members_col)
+    return InMemoryMembership(members)
@@ -0,0 +1,321 @@
+"""In-process counters, gauges and histograms with a Prometheus text endpoint.
+
+Recording is a dict lookup plus a bisect into fixed buckets, cheap enough to
+leave on in production. Label values are passed positionally and keyed by
+tuple. Values that already live elsewhere (queue sizes, task counts, existing
+``*_STATS`` dicts) are read at scrape time through gauge callbacks instead of
+being mirrored on every change.
+"""
+import asyncio
+import bisect
+import functools
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from logging import getLogger
+
+log = getLogger("bot")
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+# Seconds; spans a cache hit (~0.1 ms) to a slow REST call behind a rate limit.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_num(value)}"
+
+
+class Gauge(_Metric):
+    """A set-able gauge, or one read from ``fn`` at scrape time.
+
+    ``fn`` returns a number, or a dict of label-values tuple -> number.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), fn: Optional[Callable[[], GaugeValue]] = None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def samples(self):
+        values = self._values
+        if self.fn is not None:
+            try:
+                got = self.fn()
+            except Exception as exc:
+                log.debug("metrics_gauge_fail", extra={"metric": self.name, "err": repr(exc)})
+                return
+            values = got if isinstance(got, dict) else {(): got}
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_num(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        row = self._values.get(labels)
+        if row is None:
+            row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """``async with``/``with`` block that observes its duration."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        for labels, row in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                le = 'le="%s"' % _num(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(row[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        if exc_type is not None and exc_type is not asyncio.CancelledError:
+            ERRORS.inc(self.histogram.name, *self.labels[:1])
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class _TimedLock:
+    __slots__ = ("lock", "op")
+
+    def __init__(self, lock: asyncio.Lock, op: str):
+        self.lock = lock
+        self.op = op
+
+    async def __aenter__(self):
+        if self.lock.locked():
+            LOCK_CONTENDED.inc(self.op)
+        started = time.perf_counter()
+        await self.lock.acquire()
+        LOCK_WAIT.observe(time.perf_counter() - started, self.op)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.lock.release()
+        return False
+
+
+REGISTRY: List[_Metric] = []
+
+
+def register(metric: _Metric) -> _Metric:
+    REGISTRY.append(metric)
+    return metric
+
+
+def gauge_fn(name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Iterable[str] = ()) -> Gauge:
+    """Register a gauge computed at scrape time."""
+    return register(Gauge(name, help, labelnames, fn=fn))
+
+
+def stats_gauge(name: str, help: str, stats: Callable[[], Dict[str, float]], label: str = "stat") -> Gauge:
+    """Expose a ``*_stats()`` dict (numeric values only) as one labelled gauge."""
+
+    def _read():
+        return {(k,): v for k, v in stats().items() if isinstance(v, (int, float))}
+
+    return gauge_fn(name, help, _read, (label,))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.append("")
+    return "\n".join(lines)
+
+
+COMMAND_LATENCY = register(Histogram(
+    "matchmaker_command_seconds", "Slash command handler duration, interaction received to return.", ("command",)
+))
+LOCK_WAIT = register(Histogram(
+    "matchmaker_channel_lock_wait_seconds", "Time spent waiting for a channel's state lock.", ("op",)
+))
+LOCK_CONTENDED = register(Counter(
+    "matchmaker_channel_lock_contended_total", "Channel lock acquisitions that had to wait.", ("op",)
+))
+DISCORD_LATENCY = register(Histogram(
+    "matchmaker_discord_call_seconds", "Latency of Discord REST operations.", ("op",)
+))
+MONGO_LATENCY = register(Histogram(
+    "matchmaker_mongo_call_seconds", "Latency of db.mongo operations.", ("op",)
+))
+ERRORS = register(Counter(
+    "matchmaker_errors_total", "Timed operations that raised, by metric and operation.", ("metric", "op")
+))
+LOOP_LAG = register(Histogram(
+    "matchmaker_event_loop_lag_seconds", "How late the lag probe woke up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+))
+LOOP_LAG_LAST = register(Gauge("matchmaker_event_loop_lag_last_seconds", "Most recent lag probe result."))
+
+
+def lock_timed(lock: asyncio.Lock, op: str) -> _TimedLock:
+    """``async with lock_timed(data.lock, "join"):`` records how long the lock took."""
+    return _TimedLock(lock, op)
+
+
+def timed(histogram: Histogram, op: Optional[str] = None):
+    """Decorator observing an async function's duration under ``op`` (default: its name)."""
+
+    def decorator(fn):
+        label = op or fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with _Timer(histogram, (label,)):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_command(fn):
+    """Wrap a slash-command callback (below ``@app_commands.command``) to record its latency."""
+    return timed(COMMAND_LATENCY, fn.__name__.removesuffix("_cmd"))(fn)
+
+
+_LAG_TASK: Optional[asyncio.Task] = None
+# Called with each lag sample (e.g. by core.admission).
+LAG_LISTENERS: List[Callable[[float], None]] = []
+_PROBE_DUE: Optional[float] = None
+
+
+async def _lag_loop(interval: float):
+    global _PROBE_DUE
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        _PROBE_DUE = expected
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - expected, 0.0)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+        for listener in LAG_LISTENERS:
+            listener(lag)
+
+
+def probe_overdue() -> float:
+    """How far past its wake-up time the lag probe is right now: lag that no sample shows yet."""
+    if _PROBE_DUE is None or _LAG_TASK is None or _LAG_TASK.done():
+        return 0.0
+    return max(asyncio.get_running_loop().time() - _PROBE_DUE, 0.0)
+
+
+def start_lag_probe(interval: float = 0.5):
+    global _LAG_TASK
+    if _LAG_TASK is None or _LAG_TASK.done():
+        _LAG_TASK = asyncio.create_task(_lag_loop(interval))
+
+
+_RUNNER = None
+
+
+async def start_metrics_server(host: str, port: int):
+    """Serve ``GET /metrics`` on ``host:port``; a port of 0 disables it."""
+    global _RUNNER
+    if not port or _RUNNER is not None:
+        return
+    from aiohttp import web
+
+    async def _metrics(_request):
+        return web.Response(
+            body=render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    _RUNNER = runner
+    log.info("metrics_server_started", extra={"host": host, "port": port})
+
+
+async def stop_metrics_server():
+    global _RUNNER
+    if _RUNNER is not None:
+        await _RUNNER.cleanup()
+        _RUNNER = None
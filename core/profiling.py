@@ -0,0 +1,243 @@
+"""On-demand profiling of the live bot (driven by the owner-only /profile command).
+
+A profile runs for a fixed number of seconds and writes, under PROFILE_DIR:
+
+* ``profile-<stamp>.folded``: event-loop thread stacks sampled every
+  PROFILE_SAMPLE_MS by a background thread, in collapsed-stack format
+  (speedscope, flamegraph.pl and inferno load it as is);
+* ``slow-<stamp>.json``: loop callbacks and task steps that ran for at least
+  PROFILE_SLOW_CALLBACK_MS, longest first, with the coroutine, the line its
+  outermost coroutine resumed at and the await chain it suspended at.
+
+``write_task_dump`` writes ``tasks-<stamp>.txt``: every asyncio task with its
+stack, thread-cleanup tasks (THREAD_TASKS) marked. Nothing is installed while
+no profile is running.
+"""
+import asyncio
+import heapq
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from logging import getLogger
+
+from config import PROFILE_DIR, PROFILE_SAMPLE_MS, PROFILE_SLOW_CALLBACK_MS
+from core.threads import CLEANUPS, THREAD_TASKS
+
+log = getLogger("bot")
+
+# Slowest callbacks kept per profile.
+_SLOW_KEEP = 200
+_SITE = f"site-packages{os.sep}"
+_STDLIB = os.path.dirname(os.__file__) + os.sep
+_CWD = os.getcwd() + os.sep
+
+_SESSION: Optional[asyncio.Task] = None
+
+
+def _short(path: str) -> str:
+    if _SITE in path:
+        return path.split(_SITE, 1)[1]
+    for prefix in (_CWD, _STDLIB):
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path
+
+
+def _stamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, target: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.target = target
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _chain(task: asyncio.Task) -> List[Tuple[object, int]]:
+    """The task's await chain as ``(code, line)`` pairs, outermost first; cheap, nothing formatted."""
+    chain = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None)
+        if frame is not None:
+            chain.append((frame.f_code, frame.f_lineno))
+        coro = getattr(coro, "cr_await", None)
+    return chain
+
+
+def _format_chain(chain: List[Tuple[object, int]]) -> Optional[str]:
+    """``join_cmd (commands/user.py:57) > ...``"""
+    return " > ".join(f"{code.co_name} ({_short(code.co_filename)}:{line})" for code, line in chain) or None
+
+
+def _where(task: asyncio.Task) -> Optional[str]:
+    return _format_chain(_chain(task))
+
+
+class _SlowCallbacks:
+    """Times every loop callback by wrapping ``Handle._run``; keeps the slowest."""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.slow: List[Tuple[float, int, Dict[str, object]]] = []
+        self.callbacks = 0
+        self.over = 0
+        self._seq = 0
+        self._original = None
+
+    def install(self):
+        original = self._original = asyncio.events.Handle._run
+        tracer = self
+
+        def _run(handle):
+            task = getattr(handle._callback, "__self__", None)
+            if not isinstance(task, asyncio.Task):
+                task = None
+            # Only the outermost frame and line are captured up front; walking the await
+            # chain or building strings on every callback would dominate the loop.
+            resumed = None
+            if task is not None:
+                frame = getattr(task.get_coro(), "cr_frame", None)
+                if frame is not None:
+                    resumed = ((frame.f_code, frame.f_lineno),)
+            started = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                tracer._record(time.perf_counter() - started, handle, task, resumed)
+
+        asyncio.events.Handle._run = _run
+
+    def uninstall(self):
+        if self._original is not None:
+            asyncio.events.Handle._run = self._original
+            self._original = None
+
+    def _record(self, elapsed: float, handle, task: Optional[asyncio.Task], resumed):
+        self.callbacks += 1
+        if elapsed < self.threshold:
+            return
+        self.over += 1
+        if len(self.slow) >= _SLOW_KEEP and elapsed <= self.slow[0][0]:
+            return
+        if task is not None:
+            coro = task.get_coro()
+            entry = {
+                "task": task.get_name(),
+                "coro": getattr(coro, "__qualname__", repr(coro)),
+                "resumed_at": _format_chain(resumed),
+                "suspended_at": None if task.done() else _where(task),
+            }
+        else:
+            entry = {"callback": repr(handle)}
+        entry["ms"] = round(elapsed * 1000, 3)
+        entry["at"] = time.time()
+        self._seq += 1
+        item = (elapsed, self._seq, entry)
+        if len(self.slow) < _SLOW_KEEP:
+            heapq.heappush(self.slow, item)
+        else:
+            heapq.heapreplace(self.slow, item)
+
+    def report(self) -> Dict[str, object]:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "callbacks": self.callbacks,
+            "over_threshold": self.over,
+            "slowest": [entry for _, _, entry in sorted(self.slow, reverse=True)],
+        }
+
+
+def _write(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+async def _run_profile(seconds: float) -> List[str]:
+    sampler = _Sampler(threading.get_ident(), PROFILE_SAMPLE_MS / 1000)
+    slow = _SlowCallbacks(PROFILE_SLOW_CALLBACK_MS / 1000)
+    started = time.perf_counter()
+    sampler.start()
+    slow.install()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        slow.uninstall()
+        await asyncio.to_thread(sampler.stop)
+    stamp = _stamp()
+    report = slow.report()
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["samples"] = sampler.samples
+    paths = [os.path.join(PROFILE_DIR, f"profile-{stamp}.folded"), os.path.join(PROFILE_DIR, f"slow-{stamp}.json")]
+    await asyncio.to_thread(_write, paths[0], sampler.folded())
+    await asyncio.to_thread(_write, paths[1], json.dumps(report, indent=2, default=str))
+    log.info("profile_written", extra={"paths": paths, "samples": sampler.samples, "slow": slow.over})
+    return paths
+
+
+def start_profile(seconds: float) -> bool:
+    """Start a profile in the background; False if one is already running."""
+    global _SESSION
+    if profile_running():
+        return False
+    _SESSION = asyncio.create_task(_run_profile(seconds), name="profile")
+    log.info("profile_started", extra={"seconds": seconds})
+    return True
+
+
+def profile_running() -> bool:
+    return _SESSION is not None and not _SESSION.done()
+
+
+def task_dump() -> str:
+    cleanups = {id(task): thread_id for thread_id, task in THREAD_TASKS.items()}
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    out = io.StringIO()
+    out.write(
+        f"{len(tasks)} tasks; {len(THREAD_TASKS)} thread cleanups running, {len(CLEANUPS)} pending\n"
+    )
+    for task in tasks:
+        coro = task.get_coro()
+        mark = f" [thread cleanup {cleanups[id(task)]}]" if id(task) in cleanups else ""
+        out.write(f"\n--- {task.get_name()} {getattr(coro, '__qualname__', coro)}{mark}\n")
+        task.print_stack(file=out)
+    return out.getvalue()
+
+
+async def write_task_dump() -> str:
+    path = os.path.join(PROFILE_DIR, f"tasks-{_stamp()}.txt")
+    await asyncio.to_thread(_write, path, task_dump())
+    log.info("task_dump_written", extra={"path": path})
+    return path
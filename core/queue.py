@@ -0,0 +1,220 @@
+import asyncio
+import datetime as dt
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class ChannelQueue:
+    """Insertion-ordered queue of user ids with per-entry join timestamps.
+
+    Backed by a single dict (uid -> joined_at), so membership, append and
+    removal are O(1) and the whole structure costs one dict slot per waiting
+    player. Positions are served from an index that appends keep up to date
+    and that is rebuilt lazily after a removal, so repeated lookups are O(1).
+
+    An optional secondary index (anything with ``add``/``discard``/``clear``,
+    e.g. ``core.matchmaking.RatingIndex``) is kept in step with every mutation.
+    """
+
+    __slots__ = ("_entries", "_positions", "_index")
+
+    def __init__(self, entries: Iterable[Tuple[int, float]] = ()):
+        self._entries: Dict[int, float] = {}
+        self._positions: Optional[Dict[int, int]] = None
+        self._index = None
+        for uid, joined_at in entries:
+            self._entries.setdefault(int(uid), float(joined_at))
+
+    @classmethod
+    def from_ids(cls, user_ids: Iterable[int], joined_at: Optional[Iterable[float]] = None) -> "ChannelQueue":
+        ids = [int(u) for u in user_ids]
+        stamps = list(joined_at or ())
+        if len(stamps) != len(ids):
+            now = time.time()
+            stamps = [now] * len(ids)
+        return cls(zip(ids, stamps))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def __contains__(self, uid: object) -> bool:
+        return uid in self._entries
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._entries)
+
+    def __repr__(self) -> str:
+        return f"ChannelQueue({list(self._entries)!r})"
+
+    @property
+    def index(self):
+        return self._index
+
+    def attach_index(self, index):
+        """Start maintaining ``index``, seeding it with everyone already queued."""
+        index.clear()
+        for uid in self._entries:
+            index.add(uid)
+        self._index = index
+
+    def append(self, uid: int, joined_at: Optional[float] = None) -> bool:
+        """Add ``uid`` at the back; returns False if already queued."""
+        if uid in self._entries:
+            return False
+        if self._positions is not None:
+            self._positions[uid] = len(self._entries)
+        self._entries[uid] = time.time() if joined_at is None else joined_at
+        if self._index is not None:
+            self._index.add(uid)
+        return True
+
+    def remove(self, uid: int) -> bool:
+        """Drop ``uid``; returns False if it was not queued."""
+        if self._entries.pop(uid, None) is None:
+            return False
+        if self._index is not None:
+            self._index.discard(uid)
+        if self._positions is not None:
+            pos = self._positions.pop(uid)
+            if pos != len(self._entries):
+                self._positions = None
+        return True
+
+    def position(self, uid: int) -> Optional[int]:
+        """Zero-based position of ``uid`` or None."""
+        if uid not in self._entries:
+            return None
+        if self._positions is None:
+            self._positions = {u: i for i, u in enumerate(self._entries)}
+        return self._positions[uid]
+
+    def joined_at(self, uid: int) -> Optional[float]:
+        return self._entries.get(uid)
+
+    def head(self, n: int) -> List[int]:
+        """First ``n`` ids without copying the rest of the queue."""
+        return list(islice(self._entries, max(n, 0)))
+
+    def pop_n(self, n: int) -> List[int]:
+        """Remove and return the first ``n`` ids in join order."""
+        taken = self.head(n)
+        for uid in taken:
+            del self._entries[uid]
+            if self._index is not None:
+                self._index.discard(uid)
+        if taken:
+            self._positions = None
+        return taken
+
+    def take(self, user_ids: Iterable[int]) -> List[int]:
+        """Remove the given ids (in the order given), skipping any not queued."""
+        taken = [uid for uid in user_ids if self._entries.pop(uid, None) is not None]
+        if taken:
+            self._positions = None
+            if self._index is not None:
+                for uid in taken:
+                    self._index.discard(uid)
+        return taken
+
+    def clear(self) -> List[int]:
+        ids = list(self._entries)
+        self._entries.clear()
+        self._positions = None
+        if self._index is not None:
+            self._index.clear()
+        return ids
+
+    def ids(self) -> List[int]:
+        return list(self._entries)
+
+    def items(self) -> List[Tuple[int, float]]:
+        return list(self._entries.items())
+
+
+def _as_id(value: object) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_timestamp(value: object) -> float:
+    """Epoch seconds for a stored ``updatedAt`` (naive datetimes are UTC), 0.0 if unknown."""
+    if isinstance(value, dt.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt.timezone.utc)
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return 0.0
+
+
+class ChannelState:
+    """Everything the bot tracks for one queue channel."""
+
+    __slots__ = (
+        "channel_id",
+        "guild_id",
+        "queue",
+        "embed_msg_id",
+        "queue_thread_id",
+        "lock",
+        "epoch",
+        "last_used",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        channel_id: int,
+        guild_id: Optional[int] = None,
+        queue: Optional[ChannelQueue] = None,
+        embed_msg_id: object = None,
+        queue_thread_id: object = None,
+        updated_at: float = 0.0,
+    ):
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.queue = queue if queue is not None else ChannelQueue()
+        self.embed_msg_id: Optional[int] = _as_id(embed_msg_id)
+        self.queue_thread_id: Optional[int] = _as_id(queue_thread_id)
+        self.lock = asyncio.Lock()
+        # Bumped by resets so effects produced before the reset can tell they are stale.
+        self.epoch = 0
+        self.last_used = time.monotonic()
+        # Wall-clock time of the last persisted change (the document's updatedAt).
+        self.updated_at = updated_at
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "ChannelState":
+        channel_id = int(doc.get("_id", doc.get("channelId")))
+        queue = ChannelQueue.from_ids(doc.get("queue", []), doc.get("queueJoinedAt"))
+        return cls(
+            channel_id,
+            guild_id=_as_id(doc.get("guildId")),
+            queue=queue,
+            embed_msg_id=doc.get("embedMsgId"),
+            queue_thread_id=doc.get("queueThreadId"),
+            updated_at=_as_timestamp(doc.get("updatedAt")),
+        )
+
+    def to_doc(self) -> dict:
+        items = self.queue.items()
+        return {
+            "_id": self.channel_id,
+            "channelId": self.channel_id,
+            "guildId": self.guild_id,
+            "queue": [uid for uid, _ in items],
+            "queueJoinedAt": [joined_at for _, joined_at in items],
+            "embedMsgId": self.embed_msg_id,
+            "queueThreadId": self.queue_thread_id,
+        }
@@ -0,0 +1,142 @@
+"""Bounded, self-expiring cooldown and token-bucket stores.
+
+Entries live in a dict keyed by a packed int and carry an expiry time. A
+min-heap of expiries is pruned lazily on every write, so memory tracks the
+number of *active* cooldowns rather than every user ever seen, and a hard cap
+evicts the soonest-to-expire entries if a burst outruns expiry.
+"""
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+_ACTIONS = {"join": 0, "leave": 1}
+
+
+def pack_key(scope_id: int, action: str = "") -> int:
+    """Pack an id and an action into one int key (cheaper than a tuple)."""
+    return (scope_id << 2) | _ACTIONS.get(action, 3)
+
+
+class _ExpiringStore:
+    __slots__ = ("name", "max_entries", "_expires", "_heap", "stats")
+
+    def __init__(self, name: str, max_entries: int):
+        self.name = name
+        self.max_entries = max(max_entries, 1)
+        self._expires: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self.stats: Dict[str, int] = {"expired": 0, "evicted": 0, "peak_entries": 0}
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def _touch(self, key: int, expires_at: float, now: float):
+        self._expires[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+        self.prune(now)
+        if len(self._expires) > self.stats["peak_entries"]:
+            self.stats["peak_entries"] = len(self._expires)
+
+    def _forget(self, key: int):
+        pass
+
+    def prune(self, now: float) -> int:
+        """Drop expired entries, then enforce the size cap. Returns entries removed."""
+        removed = 0
+        heap = self._heap
+        while heap and (heap[0][0] <= now or len(self._expires) > self.max_entries):
+            expires_at, key = heapq.heappop(heap)
+            if self._expires.get(key) != expires_at:
+                continue  # superseded by a later write
+            del self._expires[key]
+            self._forget(key)
+            removed += 1
+            if expires_at <= now:
+                self.stats["expired"] += 1
+            else:
+                self.stats["evicted"] += 1
+        # Superseded heap entries are skipped lazily; compact if they pile up.
+        if len(heap) > 2 * len(self._expires) + 64:
+            self._heap = [(exp, key) for key, exp in self._expires.items()]
+            heapq.heapify(self._heap)
+        return removed
+
+    def snapshot_stats(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        stats["entries"] = len(self._expires)
+        stats["heap"] = len(self._heap)
+        return stats
+
+
+class CooldownStore(_ExpiringStore):
+    """Fixed cooldowns: an entry exists only while its cooldown is running."""
+
+    __slots__ = ()
+
+    def remaining(self, key: int, now: float) -> Optional[float]:
+        expires_at = self._expires.get(key)
+        if expires_at is None or expires_at <= now:
+            return None
+        return expires_at - now
+
+    def start(self, key: int, duration: float, now: float):
+        if duration > 0:
+            self._touch(key, now + duration, now)
+
+
+class TokenBucketStore(_ExpiringStore):
+    """Token buckets keyed by id; a bucket is forgotten once it has fully refilled."""
+
+    __slots__ = ("rate", "burst", "_tokens")
+
+    def __init__(self, name: str, per_minute: float, burst: int, max_entries: int):
+        super().__init__(name, max_entries)
+        self.rate = per_minute / 60.0
+        self.burst = float(max(burst, 1))
+        self._tokens: Dict[int, Tuple[float, float]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _forget(self, key: int):
+        self._tokens.pop(key, None)
+
+    def _level(self, key: int, now: float) -> float:
+        entry = self._tokens.get(key)
+        if entry is None:
+            return self.burst
+        tokens, updated = entry
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def wait_time(self, key: int, now: float) -> Optional[float]:
+        """Seconds until one token is available, or None if one is available now."""
+        if not self.enabled:
+            return None
+        level = self._level(key, now)
+        if level >= 1.0:
+            return None
+        return (1.0 - level) / self.rate
+
+    def consume(self, key: int, now: float):
+        if not self.enabled:
+            return
+        level = self._level(key, now) - 1.0
+        self._tokens[key] = (level, now)
+        self._touch(key, now + (self.burst - level) / self.rate, now)
+
+    def refund(self, key: int, now: float):
+        """Return a token taken by ``consume``; a bucket back at ``burst`` is forgotten."""
+        if not self.enabled or key not in self._tokens:
+            return
+        level = self._level(key, now) + 1.0
+        if level >= self.burst:
+            self._expires.pop(key, None)  # its heap entry is now stale and skipped by prune
+            self._forget(key)
+            return
+        self._tokens[key] = (level, now)
+        self._touch(key, now + (self.burst - level) / self.rate, now)
+
+    def snapshot_stats(self) -> Dict[str, int]:
+        stats = super().snapshot_stats()
+        stats["enabled"] = int(self.enabled)
+        return stats
@@ -0,0 +1,245 @@
+"""Keep queue state in step with Discord from gateway events.
+
+The hot path trusts cached ids (embed message, queue thread, queued members)
+instead of re-fetching them. Deletions the gateway reports are applied here as
+they happen; a slow periodic sweep repairs whatever was missed while the
+gateway was disconnected.
+"""
+import asyncio
+import datetime as dt
+from collections import defaultdict
+from typing import Collection, Dict, Iterable, List, Optional
+
+import discord
+from logging import getLogger
+
+from config import MEMBERSHIP_CLAIM_GRACE_SEC, RECONCILE_SWEEP_BATCH, RECONCILE_SWEEP_SEC
+from core import engine
+from core.admission import ADMISSION
+from core.effects import discard, submit
+from core.membership import owns_guild
+from core.metrics import lock_timed, stats_gauge
+from core.state import GLOBAL_Q_MEMBERS, MEMBERSHIP, RENDERERS, STATE
+from core.threads import forget_thread
+from db.mongo import QUEUE_WRITES, load_queue_docs, persist_queue_doc, remove_guild_queue_docs, remove_queue_doc
+
+log = getLogger("bot")
+
+RECONCILE_STATS: Dict[str, int] = {
+    "embeds_deleted": 0,
+    "members_removed": 0,
+    "channels_deleted": 0,
+    "guilds_removed": 0,
+    "stale_claims": 0,
+    "orphan_claims": 0,
+    "sweeps": 0,
+    "sweep_repairs": 0,
+}
+stats_gauge("matchmaker_reconcile", "State repairs applied from gateway events and sweeps.", lambda: RECONCILE_STATS)
+
+_BOT: Optional[discord.Client] = None
+_SWEEPER: Optional[asyncio.Task] = None
+
+
+def _text_channel(channel_id: int) -> Optional[discord.TextChannel]:
+    channel = _BOT.get_channel(channel_id) if _BOT else None
+    return channel if isinstance(channel, discord.TextChannel) else None
+
+
+async def embeds_deleted(channel_id: int, message_ids: Collection[int]) -> bool:
+    """Forget the queue embed if it was among the deleted messages.
+
+    The next render posts a fresh embed instead of editing a dead one. Nothing
+    is re-posted here: ``/setup`` purges the channel and posts its own embed.
+    """
+    data = STATE.get(channel_id)
+    if data is None or data.embed_msg_id not in message_ids:
+        return False
+    data.embed_msg_id = None
+    RECONCILE_STATS["embeds_deleted"] += 1
+    channel = _text_channel(channel_id)
+    if channel is not None:
+        await persist_queue_doc(channel, STATE)
+    return True
+
+
+async def _drop_members(channel: discord.TextChannel, data, user_ids: Iterable[int]) -> int:
+    async with lock_timed(data.lock, "reconcile"):
+        result = engine.drop_members(data, channel.id, user_ids, GLOBAL_Q_MEMBERS)
+    if not result.ok:
+        return 0
+    RECONCILE_STATS["members_removed"] += result.cleared
+    submit(_BOT, channel, result)
+    return result.cleared
+
+
+async def member_removed(guild_id: int, user_id: int) -> bool:
+    """Take a user who left (or was removed from) the guild out of its queue."""
+    channel_id = GLOBAL_Q_MEMBERS.get(user_id)
+    data = STATE.get(channel_id) if channel_id else None
+    if data is None:
+        return False
+    channel = _text_channel(channel_id)
+    if channel is None or channel.guild.id != guild_id:
+        return False  # queued in another guild; an uncached channel is left to the sweep
+    return bool(await _drop_members(channel, data, (user_id,)))
+
+
+async def channel_deleted(channel_id: int) -> bool:
+    """Drop all state for a deleted queue channel (its threads went with it)."""
+    data = STATE.get(channel_id)
+    if data is None:
+        # Not resident; its stored queue (if any) still has to go.
+        await remove_queue_doc(channel_id)
+        return False
+    async with lock_timed(data.lock, "reconcile"):
+        if STATE.get(channel_id) is data:
+            del STATE[channel_id]
+        queued = data.queue.ids()
+        thread_id = data.queue_thread_id
+        # The outbox targets a channel that no longer exists; only the claims matter.
+        engine.clear(data, channel_id, GLOBAL_Q_MEMBERS, "Queue channel deleted.")
+    discard(channel_id)
+    renderer = RENDERERS.pop(channel_id, None)
+    if renderer:
+        renderer.cancel()
+    if thread_id:
+        forget_thread(thread_id)
+    if queued:
+        await MEMBERSHIP.release(queued, channel_id)
+    await remove_queue_doc(channel_id)
+    RECONCILE_STATS["channels_deleted"] += 1
+    log.info("reconcile_channel_deleted", extra={"channel_id": channel_id, "released": len(queued)})
+    return True
+
+
+async def guild_removed(guild_id: int, channel_ids: Iterable[int] = ()) -> int:
+    """Forget every queue in a guild the bot was removed from."""
+    targets = set(channel_ids) | {cid for cid, data in STATE.items() if data.guild_id == guild_id}
+    dropped = 0
+    for channel_id in targets:
+        if channel_id in STATE:
+            dropped += await channel_deleted(channel_id)
+    await MEMBERSHIP.release_guild(guild_id)
+    await remove_guild_queue_docs(guild_id)
+    RECONCILE_STATS["guilds_removed"] += 1
+    log.info("reconcile_guild_removed", extra={"guild_id": guild_id, "channels": dropped})
+    return dropped
+
+
+async def _release_stale_claims() -> int:
+    """Drop claims whose channel no longer lists the user (e.g. after a missed event)."""
+    stale: Dict[int, List[int]] = defaultdict(list)
+    for uid, channel_id in list(GLOBAL_Q_MEMBERS.items()):
+        data = STATE.get(channel_id)
+        if data is None or uid not in data.queue:
+            stale[channel_id].append(uid)
+    released = 0
+    for channel_id, user_ids in stale.items():
+        for uid in user_ids:
+            if GLOBAL_Q_MEMBERS.get(uid) == channel_id:
+                GLOBAL_Q_MEMBERS.pop(uid, None)
+                released += 1
+        await MEMBERSHIP.release(user_ids, channel_id)
+    RECONCILE_STATS["stale_claims"] += released
+    return released
+
+
+async def _release_orphan_claims() -> int:
+    """Drop shared claims for this process's guilds that no queue lists.
+
+    A join that failed between claiming and queueing, or a process that died
+    before its write-behind flush, leaves a claim in the shared collection that
+    ``_release_stale_claims`` cannot see. Claims younger than
+    MEMBERSHIP_CLAIM_GRACE_SEC may belong to a join still in flight.
+    """
+    if not MEMBERSHIP.shared:
+        return 0
+    cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=MEMBERSHIP_CLAIM_GRACE_SEC)
+    stale: List[dict] = []
+    unresident: Dict[int, List[dict]] = defaultdict(list)
+    for doc in await MEMBERSHIP.claims_before(cutoff):
+        channel_id = doc.get("channelId")
+        if not owns_guild(doc.get("guildId")):
+            continue
+        data = STATE.get(channel_id)
+        if data is not None:
+            if doc["_id"] not in data.queue:
+                stale.append(doc)
+        elif not QUEUE_WRITES.is_dirty(channel_id):
+            unresident[channel_id].append(doc)
+    channel_ids = list(unresident)
+    for start in range(0, len(channel_ids), max(RECONCILE_SWEEP_BATCH, 1)):
+        batch = channel_ids[start:start + max(RECONCILE_SWEEP_BATCH, 1)]
+        stored = await load_queue_docs(batch)
+        for channel_id in batch:
+            queued = set((stored.get(channel_id) or {}).get("queue") or ())
+            stale.extend(doc for doc in unresident[channel_id] if doc["_id"] not in queued)
+    released = await MEMBERSHIP.release_claims(stale) if stale else 0
+    RECONCILE_STATS["orphan_claims"] += released
+    if released:
+        log.info("reconcile_orphan_claims", extra={"released": released})
+    return released
+
+
+async def sweep(bot: discord.Client) -> int:
+    """Check resident state against the gateway cache; returns the number of repairs.
+
+    Uses cached guild/channel/member data only, yielding every
+    RECONCILE_SWEEP_BATCH channels so it never holds the loop for long.
+    """
+    if not bot.is_ready():
+        return 0
+    repairs = 0
+    removed_guilds = set()
+    for n, channel_id in enumerate(list(STATE), 1):
+        if n % max(RECONCILE_SWEEP_BATCH, 1) == 0:
+            await asyncio.sleep(0)
+        data = STATE.get(channel_id)
+        if data is None or data.guild_id is None or not owns_guild(data.guild_id):
+            continue
+        guild = bot.get_guild(data.guild_id)
+        if guild is None:
+            removed_guilds.add(data.guild_id)
+            continue
+        if guild.unavailable:
+            continue  # outage, not a removal
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            repairs += await channel_deleted(channel_id)
+            continue
+        # Without a full member list a missing member may just be uncached.
+        if data.queue and guild.chunked and isinstance(channel, discord.TextChannel):
+            gone = [uid for uid in data.queue if guild.get_member(uid) is None]
+            if gone:
+                repairs += await _drop_members(channel, data, gone)
+    for guild_id in removed_guilds:
+        await guild_removed(guild_id)
+        repairs += 1
+    repairs += await _release_stale_claims()
+    try:
+        repairs += await _release_orphan_claims()
+    except Exception as exc:
+        log.warning("orphan_claims_fail", extra={"err": repr(exc)})
+    RECONCILE_STATS["sweeps"] += 1
+    RECONCILE_STATS["sweep_repairs"] += repairs
+    if repairs:
+        log.info("reconcile_sweep", extra={"repairs": repairs, "channels": len(STATE)})
+    return repairs
+
+
+async def _sweep_loop(bot: discord.Client):
+    while True:
+        await asyncio.sleep(RECONCILE_SWEEP_SEC)
+        await ADMISSION.wait_calm("sweep")
+        try:
+            await sweep(bot)
+        except Exception as exc:
+            log.warning("reconcile_sweep_fail", extra={"err": repr(exc)})
+
+
+def start_reconciler(bot: discord.Client):
+    global _BOT, _SWEEPER
+    _BOT = bot
+    if RECONCILE_SWEEP_SEC > 0 and (_SWEEPER is None or _SWEEPER.done()):
+        _SWEEPER = asyncio.create_task(_sweep_loop(bot))
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+import discord
+from logging import getLogger
+
+from config import DISCORD_EMBED_STALE_SEC, EMBED_RENDER_WINDOW_SEC
+from core.admission import ADMISSION
+from core.dispatch import REST, Priority, StaleRequest, route_key
+from core.metrics import stats_gauge
+from core.queue import ChannelState
+from utils.embeds import QueueEmbedCache
+
+log = getLogger("bot")
+
+RENDER_STATS: Dict[str, float] = {
+    "requests": 0,
+    "coalesced": 0,
+    "unchanged": 0,
+    "edits": 0,
+    "sends": 0,
+    "errors": 0,
+    "stale": 0,
+    "added_latency_total": 0.0,
+    "added_latency_max": 0.0,
+}
+
+
+class EmbedRenderer:
+    """Debounced, coalescing renderer for one channel's queue embed."""
+
+    def __init__(
+        self,
+        channel: discord.TextChannel,
+        data: ChannelState,
+        on_message_created: Callable[[], Awaitable[None]],
+    ):
+        self.channel = channel
+        self.data = data
+        self.on_message_created = on_message_created
+        self._message: Optional[discord.PartialMessage] = None
+        self._last_signature: Optional[str] = None
+        self._view = QueueEmbedCache()
+        self._pending: Optional[asyncio.Task] = None
+        self._first_request_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def request(self, channel: Optional[discord.TextChannel] = None):
+        """Mark the embed stale; bursts within the window collapse into one edit."""
+        if channel is not None:
+            self.channel = channel
+        RENDER_STATS["requests"] += 1
+        if self._pending and not self._pending.done():
+            RENDER_STATS["coalesced"] += 1
+            return
+        self._first_request_at = asyncio.get_running_loop().time()
+        self._pending = asyncio.create_task(self._flush_after(EMBED_RENDER_WINDOW_SEC))
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        # Requests made while deferred still coalesce into this flush.
+        await ADMISSION.wait_calm("embed")
+        # Clear before rendering so changes made during the edit schedule a new window.
+        self._pending = None
+        try:
+            await self.flush(stale_after=DISCORD_EMBED_STALE_SEC)
+        except StaleRequest:
+            # The edit sat behind higher-priority traffic; render again with current content.
+            RENDER_STATS["stale"] += 1
+            self.request()
+        except Exception as exc:
+            RENDER_STATS["errors"] += 1
+            log.warning("embed_update_fail", extra={"channel_id": self.channel.id, "err": repr(exc)})
+
+    def _message_handle(self, msg_id: int) -> discord.PartialMessage:
+        if self._message is None or self._message.id != msg_id:
+            self._message = self.channel.get_partial_message(msg_id)
+        return self._message
+
+    async def flush(self, stale_after: Optional[float] = None):
+        """Render now, skipping the edit when nothing visible changed.
+
+        ``stale_after`` lets the dispatcher drop the edit (``StaleRequest``) if it
+        can't be sent in time.
+        """
+        async with self._lock:
+            if self._first_request_at is not None:
+                added = asyncio.get_running_loop().time() - self._first_request_at
+                self._first_request_at = None
+                RENDER_STATS["added_latency_total"] += added
+                RENDER_STATS["added_latency_max"] = max(RENDER_STATS["added_latency_max"], added)
+
+            self._view.update(self.data.queue.ids())
+            signature = self._view.signature(self.channel)
+            msg_id = self.data.embed_msg_id
+
+            if msg_id and signature == self._last_signature and self._message and self._message.id == msg_id:
+                RENDER_STATS["unchanged"] += 1
+                return
+
+            emb = self._view.build(self.channel)
+
+            if msg_id:
+                try:
+                    await REST.call(
+                        Priority.EMBED, route_key("PATCH", f"/channels/{self.channel.id}/messages/{msg_id}"),
+                        "message_edit", self._message_handle(msg_id).edit, embed=emb, stale_after=stale_after,
+                    )
+                    RENDER_STATS["edits"] += 1
+                    self._last_signature = signature
+                    return
+                except discord.NotFound:
+                    self._message = None
+                    if self.data.embed_msg_id == msg_id:
+                        self.data.embed_msg_id = None
+
+            created = await REST.call(
+                Priority.EMBED, route_key("POST", f"/channels/{self.channel.id}/messages"), "message_send",
+                self.channel.send, embed=emb,
+            )
+            RENDER_STATS["sends"] += 1
+            self.data.embed_msg_id = created.id
+            self._message = self.channel.get_partial_message(created.id)
+            self._last_signature = signature
+            await self.on_message_created()
+
+    @property
+    def busy(self) -> bool:
+        return (self._pending is not None and not self._pending.done()) or self._lock.locked()
+
+    def cancel(self):
+        if self._pending:
+            self._pending.cancel()
+            self._pending = None
+
+
+def render_stats() -> Dict[str, float]:
+    """Snapshot of renderer counters, including edits saved by coalescing."""
+    stats = dict(RENDER_STATS)
+    rendered = stats["edits"] + stats["sends"]
+    stats["saved"] = stats["requests"] - rendered
+    flushes = stats["requests"] - stats["coalesced"]
+    stats["added_latency_avg"] = stats["added_latency_total"] / flushes if flushes else 0.0
+    return stats
+
+
+stats_gauge("matchmaker_embed_render", "Embed renderer counters.", render_stats)
@@ -0,0 +1,125 @@
+"""Single-task deadline scheduler.
+
+All pending deadlines live in one min-heap driven by one loop task, instead of
+one sleeping task per deadline. Deadlines are wall-clock timestamps so they can
+be persisted and resumed after a restart. Rescheduling or cancelling a key is
+O(log n) / O(1); superseded heap entries are skipped lazily.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from logging import getLogger
+
+log = getLogger("bot")
+
+Handler = Callable[[int, Any], Awaitable[None]]
+
+
+class DeadlineScheduler:
+    def __init__(
+        self,
+        name: str,
+        handler: Handler,
+        max_concurrent: int,
+        running: Dict[int, asyncio.Task],
+        gate: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        # Awaited before each due deadline fires, so callers can hold work back under load.
+        self.gate = gate
+        self.max_concurrent = max(max_concurrent, 1)
+        # Tasks for deadlines currently being handled, keyed like the deadlines.
+        self.running = running
+        self._entries: Dict[int, Tuple[float, int, Any]] = {}
+        self._heap: List[Tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"scheduled": 0, "cancelled": 0, "fired": 0, "failed": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._entries
+
+    def _ensure_loop(self):
+        if self._wake is None:
+            self._wake = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def schedule(self, key: int, due_at: float, payload: Any = None):
+        """(Re)schedule ``key`` to fire at wall-clock ``due_at``."""
+        self._ensure_loop()
+        seq = next(self._seq)
+        self._entries[key] = (due_at, seq, payload)
+        heapq.heappush(self._heap, (due_at, seq, key))
+        self.stats["scheduled"] += 1
+        if self._heap[0][1] == seq:
+            self._wake.set()
+
+    def cancel(self, key: int) -> bool:
+        if self._entries.pop(key, None) is None:
+            return False
+        self.stats["cancelled"] += 1
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(due, seq, k) for k, (due, seq, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def due_at(self, key: int) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    async def _run(self):
+        while True:
+            while self._heap:
+                due_at, seq, key = self._heap[0]
+                entry = self._entries.get(key)
+                if entry is None or entry[1] != seq:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = due_at - time.time()
+                if delay > 0:
+                    break
+                if self.gate is not None:
+                    await self.gate()
+                    if self._heap[:1] != [(due_at, seq, key)] or self._entries.get(key) is not entry:
+                        continue  # rescheduled or cancelled while we waited
+                heapq.heappop(self._heap)
+                del self._entries[key]
+                await self._slots.acquire()
+                self.running[key] = asyncio.create_task(self._fire(key, entry[2]))
+            self._wake.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, key: int, payload: Any):
+        try:
+            self.stats["fired"] += 1
+            await self.handler(key, payload)
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:
+            self.stats["failed"] += 1
+            log.warning("deadline_handler_fail", extra={"scheduler": self.name, "key": key, "err": repr(exc)})
+        finally:
+            self._slots.release()
+            if self.running.get(key) is asyncio.current_task():
+                self.running.pop(key, None)
+
+    def snapshot_stats(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        stats["pending"] = len(self._entries)
+        stats["running"] = len(self.running)
+        return stats
@@ -0,0 +1,252 @@
+"""Warm-start snapshots of resident queue state.
+
+``STATE`` is written to SNAPSHOT_PATH periodically and on shutdown, so a restart
+can serve commands before Mongo has connected. The file is a small versioned
+binary format, written to a temp file and renamed into place:
+
+    header   magic "MMQS", u16 version, u32 channels, f64 written_at, u32 crc32(body)
+    channel  u64 channel_id, guild_id, embed_msg_id, queue_thread_id (0 = none),
+             f64 updated_at, u32 queued; then the queued u64 user ids and f64 join times
+
+Once connected, ``reconcile`` compares each restored channel's updatedAt with its
+stored document. A newer document replaces the restored state; a newer snapshot
+(the process died before the write-behind flush) is written back. Channels that
+commands have changed since startup keep their live state.
+"""
+import asyncio
+import os
+import struct
+import time
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from logging import getLogger
+
+from config import SNAPSHOT_INTERVAL_SEC, SNAPSHOT_MAX_AGE_SEC, SNAPSHOT_PATH
+from core.admission import ADMISSION
+from core.metrics import stats_gauge
+from core.queue import ChannelQueue, ChannelState, _as_timestamp
+from core.state import GLOBAL_Q_MEMBERS, STATE
+from db.mongo import QUEUE_WRITES, load_queue_docs, mark_queue_doc
+
+log = getLogger("bot")
+
+MAGIC = b"MMQS"
+VERSION = 1
+_HEADER = struct.Struct("<4sHIdI")
+_CHANNEL = struct.Struct("<QQQQdI")
+# Restored channels compared per Mongo query.
+_RECONCILE_BATCH = 500
+
+SNAPSHOT_STATS: Dict[str, int] = {
+    "written": 0,
+    "write_failed": 0,
+    "unchanged": 0,
+    "bytes": 0,
+    "channels_restored": 0,
+    "players_restored": 0,
+    "refreshed": 0,
+    "written_back": 0,
+    "kept_live": 0,
+    "matched": 0,
+}
+stats_gauge("matchmaker_snapshot", "Warm-start snapshot writes, restores and reconcile outcomes.",
+            lambda: SNAPSHOT_STATS)
+
+# Restored channel id -> the updated_at it was restored with, until reconciled.
+_RESTORED: Dict[int, float] = {}
+_LAST_MARKS: Optional[float] = None
+_WRITER: Optional[asyncio.Task] = None
+
+
+def encode(states: Iterable[ChannelState], written_at: float) -> bytes:
+    parts: List[bytes] = []
+    count = 0
+    for data in states:
+        items = data.queue.items()
+        n = len(items)
+        parts.append(_CHANNEL.pack(
+            data.channel_id,
+            data.guild_id or 0,
+            data.embed_msg_id or 0,
+            data.queue_thread_id or 0,
+            data.updated_at,
+            n,
+        ))
+        if n:
+            parts.append(struct.pack(f"<{n}Q", *(uid for uid, _ in items)))
+            parts.append(struct.pack(f"<{n}d", *(joined_at for _, joined_at in items)))
+        count += 1
+    body = b"".join(parts)
+    return _HEADER.pack(MAGIC, VERSION, count, written_at, zlib.crc32(body)) + body
+
+
+def decode(blob: bytes) -> Tuple[float, List[ChannelState]]:
+    """``(written_at, states)``; raises ValueError (or struct.error) on a bad file."""
+    if len(blob) < _HEADER.size:
+        raise ValueError("truncated snapshot header")
+    magic, version, count, written_at, crc = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("not a queue snapshot")
+    if version != VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    if zlib.crc32(memoryview(blob)[_HEADER.size:]) != crc:
+        raise ValueError("snapshot checksum mismatch")
+    offset = _HEADER.size
+    states = []
+    for _ in range(count):
+        channel_id, guild_id, embed_msg_id, thread_id, updated_at, n = _CHANNEL.unpack_from(blob, offset)
+        offset += _CHANNEL.size
+        ids = struct.unpack_from(f"<{n}Q", blob, offset)
+        offset += 8 * n
+        stamps = struct.unpack_from(f"<{n}d", blob, offset)
+        offset += 8 * n
+        states.append(ChannelState(
+            channel_id,
+            guild_id=guild_id or None,
+            queue=ChannelQueue(zip(ids, stamps)),
+            embed_msg_id=embed_msg_id or None,
+            queue_thread_id=thread_id or None,
+            updated_at=updated_at,
+        ))
+    return written_at, states
+
+
+def _write_atomic(path: str, blob: bytes):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+async def write_snapshot(path: str = SNAPSHOT_PATH) -> bool:
+    """Encode STATE now (on the loop, so it is consistent) and write it off the loop."""
+    if not path:
+        return False
+    blob = encode(list(STATE.values()), time.time())
+    try:
+        await asyncio.to_thread(_write_atomic, path, blob)
+    except OSError as exc:
+        SNAPSHOT_STATS["write_failed"] += 1
+        log.warning("snapshot_write_fail", extra={"path": path, "err": repr(exc)})
+        return False
+    SNAPSHOT_STATS["written"] += 1
+    SNAPSHOT_STATS["bytes"] = len(blob)
+    return True
+
+
+def load_snapshot(
+    owns_guild: Optional[Callable[[Optional[int]], bool]] = None,
+    path: str = SNAPSHOT_PATH,
+    max_age: float = SNAPSHOT_MAX_AGE_SEC,
+) -> int:
+    """Restore channels from a recent snapshot into STATE; returns how many."""
+    if not path:
+        return 0
+    try:
+        with open(path, "rb") as f:
+            blob = f.read()
+    except FileNotFoundError:
+        return 0
+    except OSError as exc:
+        log.warning("snapshot_read_fail", extra={"path": path, "err": repr(exc)})
+        return 0
+    try:
+        written_at, states = decode(blob)
+    except (ValueError, struct.error) as exc:
+        log.warning("snapshot_invalid", extra={"path": path, "err": repr(exc)})
+        return 0
+    age = time.time() - written_at
+    if max_age > 0 and age > max_age:
+        log.info("snapshot_too_old", extra={"path": path, "age": round(age, 1)})
+        return 0
+    restored = players = 0
+    for data in states:
+        if owns_guild is not None and not owns_guild(data.guild_id):
+            continue
+        if data.channel_id in STATE:
+            continue
+        STATE[data.channel_id] = data
+        for uid in data.queue:
+            GLOBAL_Q_MEMBERS.setdefault(uid, data.channel_id)
+        _RESTORED[data.channel_id] = data.updated_at
+        restored += 1
+        players += len(data.queue)
+    SNAPSHOT_STATS["channels_restored"] += restored
+    SNAPSHOT_STATS["players_restored"] += players
+    log.info("snapshot_loaded", extra={"channels": restored, "players": players, "age": round(age, 1)})
+    return restored
+
+
+def _replace(data: ChannelState, doc: dict):
+    """Adopt the stored document in place, keeping the state object (and its lock)."""
+    fresh = ChannelState.from_doc(doc)
+    for uid in data.queue:
+        if GLOBAL_Q_MEMBERS.get(uid) == data.channel_id:
+            del GLOBAL_Q_MEMBERS[uid]
+    data.queue.clear()
+    for uid, joined_at in fresh.queue.items():
+        data.queue.append(uid, joined_at)
+        GLOBAL_Q_MEMBERS.setdefault(uid, data.channel_id)
+    data.guild_id = fresh.guild_id or data.guild_id
+    data.embed_msg_id = fresh.embed_msg_id
+    data.queue_thread_id = fresh.queue_thread_id
+    data.updated_at = fresh.updated_at
+    data.epoch += 1
+
+
+def _reconcile_channel(channel_id: int, restored_at: float, doc: Optional[dict]):
+    data = STATE.get(channel_id)
+    if data is None:
+        return  # evicted or dropped since startup
+    if data.updated_at != restored_at or data.lock.locked() or QUEUE_WRITES.is_dirty(channel_id):
+        SNAPSHOT_STATS["kept_live"] += 1
+        return
+    stored_at = _as_timestamp(doc.get("updatedAt")) if doc is not None else 0.0
+    if doc is not None and stored_at > restored_at:
+        _replace(data, doc)
+        SNAPSHOT_STATS["refreshed"] += 1
+    elif restored_at > stored_at and (doc is not None or data.queue):
+        mark_queue_doc(data)
+        SNAPSHOT_STATS["written_back"] += 1
+    else:
+        SNAPSHOT_STATS["matched"] += 1
+
+
+async def reconcile() -> Dict[str, int]:
+    """Compare restored channels with Mongo; safe to retry after a failure."""
+    before = dict(SNAPSHOT_STATS)
+    while _RESTORED:
+        batch = list(_RESTORED.items())[:_RECONCILE_BATCH]
+        docs = await load_queue_docs([channel_id for channel_id, _ in batch])
+        for channel_id, restored_at in batch:
+            _reconcile_channel(channel_id, restored_at, docs.get(channel_id))
+            del _RESTORED[channel_id]
+        await asyncio.sleep(0)
+    return {k: SNAPSHOT_STATS[k] - before[k] for k in ("refreshed", "written_back", "kept_live", "matched")}
+
+
+async def _snapshot_loop():
+    global _LAST_MARKS
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SEC)
+        await ADMISSION.wait_calm("snapshot")
+        # Every state change is persisted, so an unchanged mark count means nothing to write.
+        marks = QUEUE_WRITES.stats["marks"]
+        if marks == _LAST_MARKS:
+            SNAPSHOT_STATS["unchanged"] += 1
+            continue
+        if await write_snapshot():
+            _LAST_MARKS = marks
+
+
+def start_snapshotter():
+    global _WRITER
+    if not SNAPSHOT_PATH or SNAPSHOT_INTERVAL_SEC <= 0:
+        return
+    if _WRITER is None or _WRITER.done():
+        _WRITER = asyncio.create_task(_snapshot_loop())
@@ -1,55 +1,189 @@
 import asyncio
-from typing import Dict, List, Optional
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
 import discord
-from utils.embeds import build_queue_embed
 from logging import getLogger
-from config import COOLDOWN_JOIN_SEC, COOLDOWN_LEAVE_SEC
+from config import (
+    COOLDOWN_JOIN_SEC,
+    COOLDOWN_LEAVE_SEC,
+    COOLDOWN_MAX_ENTRIES,
+    RATE_USER_PER_MIN,
+    RATE_USER_BURST,
+    RATE_CHANNEL_PER_MIN,
+    RATE_CHANNEL_BURST,
+    RATE_GUILD_PER_MIN,
+    RATE_GUILD_BURST,
+    STATE_IDLE_TTL_SEC,
+    STATE_MAX_CHANNELS,
+    STATE_EVICT_INTERVAL_SEC,
+)
+from core.membership import build_membership
+from core.metrics import gauge_fn, stats_gauge
+from core.queue import ChannelState
+from core.ratelimit import CooldownStore, TokenBucketStore, pack_key
+from core.render import EmbedRenderer
+from db.mongo import QUEUE_WRITES, load_queue_doc, persist_queue_doc
 
 log = getLogger("bot")
 
-# Global in-memory state
-STATE: Dict[int, Dict[str, object]] = {}
+# Global in-memory state; STATE is kept in least-recently-used order.
+STATE: "OrderedDict[int, ChannelState]" = OrderedDict()
 GLOBAL_Q_MEMBERS: Dict[int, int] = {}
-LAST_ACTION: Dict[tuple[int, str], float] = {}
-
-async def ensure_state(channel: discord.TextChannel):
-    if channel.id not in STATE:
-        STATE[channel.id] = {
-            "queue": [],
-            "embed_msg_id": None,
-            "lock": asyncio.Lock(),
-            "queue_thread_id": None,
-        }
+# Authoritative one-queue-per-user claims (shared across shard processes when configured).
+MEMBERSHIP = build_membership(GLOBAL_Q_MEMBERS)
+COOLDOWNS = CooldownStore("cooldowns", COOLDOWN_MAX_ENTRIES)
+USER_BUCKETS = TokenBucketStore("user", RATE_USER_PER_MIN, RATE_USER_BURST, COOLDOWN_MAX_ENTRIES)
+CHANNEL_BUCKETS = TokenBucketStore("channel", RATE_CHANNEL_PER_MIN, RATE_CHANNEL_BURST, COOLDOWN_MAX_ENTRIES)
+GUILD_BUCKETS = TokenBucketStore("guild", RATE_GUILD_PER_MIN, RATE_GUILD_BURST, COOLDOWN_MAX_ENTRIES)
+RENDERERS: Dict[int, EmbedRenderer] = {}
+# Extra "is this channel busy?" checks registered by other modules; busy channels are never evicted.
+EVICTION_GUARDS: List[Callable[[int], bool]] = []
+EVICTION_STATS: Dict[str, int] = {"hydrated": 0, "created": 0, "evicted": 0}
+_HYDRATING: Dict[int, asyncio.Future] = {}
+_EVICTOR: Optional[asyncio.Task] = None
+
+gauge_fn("matchmaker_channels_resident", "Channels with state loaded in memory.", lambda: len(STATE))
+gauge_fn("matchmaker_queued_players", "Players waiting in any queue.", lambda: len(GLOBAL_Q_MEMBERS))
+gauge_fn("matchmaker_queue_size_max", "Largest single channel queue.",
+         lambda: max((len(d.queue) for d in STATE.values()), default=0))
+stats_gauge("matchmaker_channel_state", "Channel hydration and eviction counters.", lambda: EVICTION_STATS)
+
+async def ensure_state(channel: discord.TextChannel) -> ChannelState:
+    """Return the channel's state, loading it from Mongo on first touch."""
+    data = STATE.get(channel.id)
+    if data is None:
+        data = await _hydrate(channel)
     else:
-        STATE[channel.id].setdefault("queue_thread_id", None)
+        STATE.move_to_end(channel.id)
+    if data.guild_id is None:
+        data.guild_id = channel.guild.id
+    data.touch()
+    return data
 
-async def get_embed_message(channel: discord.TextChannel) -> Optional[discord.Message]:
-    await ensure_state(channel)
-    msg_id = STATE[channel.id]["embed_msg_id"]
-    if not msg_id:
-        return None
+async def _hydrate(channel: discord.TextChannel) -> ChannelState:
+    pending = _HYDRATING.get(channel.id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future = asyncio.get_running_loop().create_future()
+    _HYDRATING[channel.id] = future
     try:
-        return await channel.fetch_message(msg_id)  # type: ignore[arg-type]
-    except Exception:
-        return None
+        doc = await load_queue_doc(channel.id)
+        data = STATE.get(channel.id)
+        if data is None:
+            if doc:
+                data = ChannelState.from_doc(doc)
+                for uid in data.queue:
+                    GLOBAL_Q_MEMBERS.setdefault(uid, channel.id)
+                EVICTION_STATS["hydrated"] += 1
+            else:
+                data = ChannelState(channel.id, guild_id=channel.guild.id)
+                EVICTION_STATS["created"] += 1
+            STATE[channel.id] = data
+            if len(STATE) > STATE_MAX_CHANNELS:
+                evict_idle_channels(time.monotonic(), over_capacity_only=True, keep=channel.id)
+        future.set_result(data)
+        return data
+    except BaseException as exc:
+        future.set_exception(exc)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        _HYDRATING.pop(channel.id, None)
+
+def _evictable(channel_id: int, data: ChannelState) -> bool:
+    if data.queue or data.lock.locked() or QUEUE_WRITES.is_dirty(channel_id):
+        return False
+    renderer = RENDERERS.get(channel_id)
+    if renderer is not None and renderer.busy:
+        return False
+    return not any(guard(channel_id) for guard in EVICTION_GUARDS)
+
+def evict_idle_channels(now: float, over_capacity_only: bool = False, keep: Optional[int] = None) -> int:
+    """Drop idle channels with empty queues, least recently used first.
+
+    Channels idle past STATE_IDLE_TTL_SEC go first; if STATE is still over
+    STATE_MAX_CHANNELS, further idle channels are evicted regardless of age.
+    """
+    evicted = 0
+    for channel_id in list(STATE):
+        over = len(STATE) > STATE_MAX_CHANNELS
+        data = STATE[channel_id]
+        expired = now - data.last_used >= STATE_IDLE_TTL_SEC
+        if over_capacity_only and not over:
+            break
+        if not (over or expired):
+            break  # LRU order: everything after this was used more recently
+        if channel_id == keep or not _evictable(channel_id, data):
+            continue
+        del STATE[channel_id]
+        renderer = RENDERERS.pop(channel_id, None)
+        if renderer:
+            renderer.cancel()
+        evicted += 1
+    if evicted:
+        EVICTION_STATS["evicted"] += evicted
+        log.debug("state_evicted", extra={"count": evicted, "resident": len(STATE)})
+    return evicted
+
+async def _evict_loop():
+    while True:
+        await asyncio.sleep(STATE_EVICT_INTERVAL_SEC)
+        evict_idle_channels(time.monotonic())
+
+def start_state_evictor():
+    global _EVICTOR
+    if _EVICTOR is None or _EVICTOR.done():
+        _EVICTOR = asyncio.create_task(_evict_loop())
 
-async def update_embed(channel: discord.TextChannel):
+def get_renderer(channel: discord.TextChannel) -> EmbedRenderer:
+    renderer = RENDERERS.get(channel.id)
+    if renderer is None or renderer.data is not STATE[channel.id]:
+        if renderer:
+            renderer.cancel()
+
+        async def _persist_new_embed():
+            try:
+                await persist_queue_doc(channel, STATE)
+            except Exception as exc:
+                log.warning("persist_queue_fail", extra={"channel_id": channel.id, "err": repr(exc)})
+
+        renderer = EmbedRenderer(channel, STATE[channel.id], _persist_new_embed)
+        RENDERERS[channel.id] = renderer
+    return renderer
+
+async def update_embed(channel: discord.TextChannel, immediate: bool = False):
+    """Schedule a coalesced embed refresh; ``immediate`` renders before returning."""
     await ensure_state(channel)
-    data = STATE[channel.id]
-    queue: List[int] = data["queue"]  # type: ignore
-    emb = build_queue_embed(channel, queue)
-    existing = await get_embed_message(channel)
-    if existing:
-        await existing.edit(embed=emb)
+    renderer = get_renderer(channel)
+    if immediate:
+        renderer.cancel()
+        await renderer.flush()
     else:
-        created = await channel.send(embed=emb)
-        data["embed_msg_id"] = created.id
+        renderer.request(channel)
 
 def cooldown_blocked(user_id: int, action: str, now: float) -> Optional[float]:
-    last = LAST_ACTION.get((user_id, action), 0.0)
-    wait = COOLDOWN_JOIN_SEC if action == "join" else COOLDOWN_LEAVE_SEC
-    remaining = last + wait - now
-    return remaining if remaining > 0 else None
+    return COOLDOWNS.remaining(pack_key(user_id, action), now)
 
 def mark_cooldown(user_id: int, action: str, now: float):
-    LAST_ACTION[(user_id, action)] = now
+    wait = COOLDOWN_JOIN_SEC if action == "join" else COOLDOWN_LEAVE_SEC
+    COOLDOWNS.start(pack_key(user_id, action), wait, now)
+
+def rate_limited(user_id: int, channel_id: int, guild_id: int, now: float) -> Optional[float]:
+    """Take one token from the user, channel and guild buckets, or return the wait if any is empty."""
+    scopes = ((USER_BUCKETS, user_id), (CHANNEL_BUCKETS, channel_id), (GUILD_BUCKETS, guild_id))
+    wait = max((bucket.wait_time(key, now) or 0.0 for bucket, key in scopes), default=0.0)
+    if wait > 0:
+        return wait
+    for bucket, key in scopes:
+        bucket.consume(key, now)
+    return None
+
+def refund_rate_limit(user_id: int, channel_id: int, guild_id: int, now: float):
+    """Give back the tokens ``rate_limited`` took for an action that turned out to be a no-op."""
+    for bucket, key in ((USER_BUCKETS, user_id), (CHANNEL_BUCKETS, channel_id), (GUILD_BUCKETS, guild_id)):
+        bucket.refund(key, now)
+
+def cooldown_stats() -> Dict[str, Dict[str, int]]:
+    """Entry counts and evictions for each cooldown/rate-limit store."""
+    return {store.name: store.snapshot_stats() for store in (COOLDOWNS, USER_BUCKETS, CHANNEL_BUCKETS, GUILD_BUCKETS)}
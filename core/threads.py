@@ -1,42 +1,155 @@
 import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from functools import partial
 from typing import Optional, Sequence
 
 import discord
 from logging import getLogger
 
-from config import MATCH_DELETE_AFTER_SEC, MATCH_WARN_BEFORE_SEC
-from db.mongo import mark_thread_deleted
+from config import (
+    MATCH_DELETE_AFTER_SEC,
+    MATCH_WARN_BEFORE_SEC,
+    THREAD_CACHE_NEGATIVE_TTL_SEC,
+    THREAD_CACHE_SIZE,
+    THREAD_CACHE_TTL_SEC,
+    THREAD_CLEANUP_CONCURRENCY,
+    THREAD_MEMBER_CONCURRENCY,
+    THREAD_MEMBER_GLOBAL_CONCURRENCY,
+    THREAD_POOL_IDLE_SEC,
+    THREAD_POOL_PURGE_LIMIT,
+    THREAD_POOL_SIZE,
+)
+from core.admission import ADMISSION
+from core.dispatch import REST, Priority, route_key
+from core.metrics import gauge_fn, stats_gauge
+from core.queue import ChannelState
+from core.scheduler import DeadlineScheduler
+from db.mongo import (
+    discard_thread_cleanup,
+    load_thread_cleanups,
+    mark_thread_deleted,
+    persist_thread_cleanup,
+)
 
 log = getLogger("bot")
 
+# Cleanups currently running; pending deadlines live in CLEANUPS.
 THREAD_TASKS: dict[int, asyncio.Task] = {}
 
 
-async def fetch_thread(bot: discord.Client, thread_id: int) -> Optional[discord.Thread]:
-    """Fetch a thread by id, trying cache first."""
+# Resolved lookups that missed the gateway cache: thread_id -> (expires_at, thread or None).
+# None records a thread known to be gone so repeat lookups skip the REST call.
+_THREAD_CACHE: "OrderedDict[int, tuple[float, Optional[discord.Thread]]]" = OrderedDict()
+THREAD_CACHE_STATS: dict[str, int] = {
+    "gateway_hits": 0,
+    "hits": 0,
+    "negative_hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+}
+
+
+def _cache_thread(thread_id: int, thread: Optional[discord.Thread]):
+    ttl = THREAD_CACHE_TTL_SEC if thread is not None else THREAD_CACHE_NEGATIVE_TTL_SEC
+    if ttl <= 0:
+        _THREAD_CACHE.pop(thread_id, None)
+        return
+    _THREAD_CACHE[thread_id] = (time.monotonic() + ttl, thread)
+    _THREAD_CACHE.move_to_end(thread_id)
+    while len(_THREAD_CACHE) > THREAD_CACHE_SIZE:
+        _THREAD_CACHE.popitem(last=False)
+
+
+def remember_thread(thread: discord.Thread):
+    """Record a thread we just created or saw updated."""
+    _cache_thread(thread.id, thread)
+
+
+def forget_thread(thread_id: int):
+    """Record that a thread is gone (deleted by us or reported by the gateway)."""
+    THREAD_CACHE_STATS["invalidations"] += 1
+    _cache_thread(thread_id, None)
+    _unpool(thread_id)
+
+
+def thread_cache_stats() -> dict[str, float]:
+    stats: dict[str, float] = dict(THREAD_CACHE_STATS)
+    lookups = stats["gateway_hits"] + stats["hits"] + stats["negative_hits"] + stats["misses"]
+    stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+    stats["size"] = len(_THREAD_CACHE)
+    return stats
+
+
+async def fetch_thread(
+    bot: discord.Client,
+    thread_id: int,
+    priority: Priority = Priority.MATCH,
+) -> Optional[discord.Thread]:
+    """Resolve a thread by id: gateway cache, then the lookup cache, then REST."""
     cached = bot.get_channel(thread_id)
     if isinstance(cached, discord.Thread):
+        THREAD_CACHE_STATS["gateway_hits"] += 1
         return cached
+    entry = _THREAD_CACHE.get(thread_id)
+    if entry is not None:
+        if entry[0] > time.monotonic():
+            THREAD_CACHE_STATS["hits" if entry[1] is not None else "negative_hits"] += 1
+            return entry[1]
+        del _THREAD_CACHE[thread_id]
+    THREAD_CACHE_STATS["misses"] += 1
     try:
-        fetched = await bot.fetch_channel(thread_id)  # type: ignore[arg-type]
-        return fetched if isinstance(fetched, discord.Thread) else None
-    except discord.NotFound:
+        fetched = await REST.call(
+            priority, route_key("GET", f"/channels/{thread_id}"), "fetch_channel", bot.fetch_channel, thread_id
+        )
+    except (discord.NotFound, discord.Forbidden):
+        _cache_thread(thread_id, None)
         return None
     except Exception as exc:
+        # Transient (5xx, timeouts): don't cache, the next lookup retries.
         log.warning("thread_fetch_fail", extra={"thread_id": thread_id, "err": repr(exc)})
         return None
+    thread = fetched if isinstance(fetched, discord.Thread) else None
+    _cache_thread(thread_id, thread)
+    return thread
 
 
-async def _unarchive_thread(thread: discord.Thread, reason: str):
+async def _unarchive_thread(thread: discord.Thread, reason: str, priority: Priority = Priority.CLEANUP):
     if thread.archived:
         try:
-            await thread.edit(archived=False, reason=reason)
+            await REST.call(
+                priority, route_key("PATCH", f"/channels/{thread.id}"), "thread_edit",
+                thread.edit, archived=False, reason=reason,
+            )
         except Exception as exc:
             log.warning("thread_unarchive_fail", extra={"thread_id": thread.id, "err": repr(exc)})
 
 
-async def create_queue_thread(channel: discord.TextChannel) -> Optional[discord.Thread]:
-    """Create a queue coordination thread in the provided channel."""
+async def _create_thread(channel: discord.TextChannel, priority: Priority = Priority.MATCH, **kwargs) -> discord.Thread:
+    return await REST.call(
+        priority, route_key("POST", f"/channels/{channel.id}/threads"), "thread_create",
+        channel.create_thread, **kwargs,
+    )
+
+
+async def _send(target, content: str, priority: Priority = Priority.CLEANUP):
+    return await REST.call(
+        priority, route_key("POST", f"/channels/{target.id}/messages"), "message_send", target.send, content
+    )
+
+
+def _queue_thread_name() -> str:
+    return f"queue-{discord.utils.utcnow().strftime('%H%M%S')}"
+
+
+async def _open_thread(
+    channel: discord.TextChannel,
+    name: str,
+    reason: str,
+    priority: Priority = Priority.MATCH,
+) -> Optional[discord.Thread]:
+    """Create a private thread (public if that is all we may create) in the channel."""
     me = channel.guild.me  # type: ignore[attr-defined]
     if not me:
         log.warning("thread_create_no_member", extra={"channel_id": channel.id})
@@ -49,29 +162,35 @@ async def create_queue_thread(channel: discord.TextChannel) -> Optional[discord.
         log.warning("thread_create_missing_perms", extra={"channel_id": channel.id})
         return None
 
-    name = f"queue-{discord.utils.utcnow().strftime('%H%M%S')}"
     thread: Optional[discord.Thread] = None
+    started = time.perf_counter()
 
     try:
         if has_private:
-            thread = await channel.create_thread(
+            thread = await _create_thread(
+                channel,
+                priority,
                 name=name,
                 auto_archive_duration=1440,
                 type=discord.ChannelType.private_thread,
                 invitable=False,
-                reason="Matchmaking queue started",
+                reason=reason,
             )
         else:
-            thread = await channel.create_thread(
+            thread = await _create_thread(
+                channel,
+                priority,
                 name=name,
                 auto_archive_duration=1440,
                 type=discord.ChannelType.public_thread,
-                reason="Matchmaking queue started",
+                reason=reason,
             )
     except discord.Forbidden as exc:
         if has_private and has_public:
             try:
-                thread = await channel.create_thread(
+                thread = await _create_thread(
+                    channel,
+                    priority,
                     name=name,
                     auto_archive_duration=1440,
                     type=discord.ChannelType.public_thread,
@@ -91,56 +210,80 @@ async def create_queue_thread(channel: discord.TextChannel) -> Optional[discord.
         return None
 
     if thread:
-        try:
-            await thread.send("Queue thread ready. I'll ping everyone once the lobby is full.")
-        except Exception as exc:
-            log.debug("thread_intro_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+        if priority is Priority.MATCH:
+            # Only foreground creations: what a pool hit saves a lobby.
+            _observe_pool_ms("create_ms", time.perf_counter() - started)
+        remember_thread(thread)
+    return thread
+
+
+async def _post_intro(thread: discord.Thread):
+    try:
+        await _send(thread, "Queue thread ready. I'll ping everyone once the lobby is full.", Priority.MATCH)
+    except Exception as exc:
+        log.debug("thread_intro_fail", extra={"thread_id": thread.id, "err": repr(exc)})
 
+
+async def create_queue_thread(channel: discord.TextChannel) -> Optional[discord.Thread]:
+    """Create a queue coordination thread in the provided channel."""
+    thread = await _open_thread(channel, _queue_thread_name(), "Matchmaking queue started")
+    if thread:
+        await _post_intro(thread)
     return thread
 
 
 async def ensure_queue_thread(
     bot: discord.Client,
     channel: discord.TextChannel,
-    state: dict,
+    state: ChannelState,
 ) -> tuple[Optional[discord.Thread], bool]:
-    """Ensure we have an active queue thread for this channel."""
+    """Ensure we have an active queue thread for this channel.
+
+    A new lobby takes a spare from the channel's pool when there is one and
+    only creates a thread on a miss; either way the pool is topped up after.
+    """
     created = False
     thread: Optional[discord.Thread] = None
-    raw_thread_id = state.get("queue_thread_id")
-    thread_id: Optional[int] = None
-    if isinstance(raw_thread_id, int):
-        thread_id = raw_thread_id
-    elif isinstance(raw_thread_id, str):
-        try:
-            thread_id = int(raw_thread_id)
-        except (TypeError, ValueError):
-            thread_id = None
+    thread_id = state.queue_thread_id
     if thread_id:
         thread = await fetch_thread(bot, thread_id)
-        if thread is None:
-            state["queue_thread_id"] = None
+        if thread is None and state.queue_thread_id == thread_id:
+            state.queue_thread_id = None
     if thread is None:
-        thread = await create_queue_thread(channel)
+        thread = await _take_pooled_thread(bot, channel)
+        if thread is None:
+            if THREAD_POOL_SIZE > 0:
+                THREAD_POOL_STATS["misses"] += 1
+            thread = await create_queue_thread(channel)
+        fill_thread_pool(bot, channel)
         if thread:
-            state["queue_thread_id"] = thread.id
+            state.queue_thread_id = thread.id
             created = True
     return thread, created
 
 
 def cancel_thread_cleanup(thread_id: int):
+    pending = CLEANUPS.cancel(thread_id)
     task = THREAD_TASKS.pop(thread_id, None)
     if task:
         task.cancel()
+    if pending or task:
+        discard_thread_cleanup(thread_id)
 
 
 async def delete_thread(thread: discord.Thread, reason: str):
     cancel_thread_cleanup(thread.id)
     try:
         await _unarchive_thread(thread, reason)
-        await thread.delete(reason=reason)
+        await REST.call(
+            Priority.CLEANUP, route_key("DELETE", f"/channels/{thread.id}"), "thread_delete",
+            thread.delete, reason=reason,
+        )
+        forget_thread(thread.id)
         log.info("thread_deleted_manual", extra={"thread_id": thread.id, "reason": reason})
-    except (discord.NotFound, AttributeError):
+    except discord.NotFound:
+        forget_thread(thread.id)
+    except AttributeError:
         return
     except discord.Forbidden as exc:
         log.warning("thread_delete_forbidden", extra={"thread_id": thread.id, "err": repr(exc)})
@@ -148,110 +291,438 @@ async def delete_thread(thread: discord.Thread, reason: str):
         log.warning("thread_delete_error", extra={"thread_id": thread.id, "err": repr(exc)})
 
 
+async def _cleanup_warn(thread_id: int, warn_before: float):
+    target = await fetch_thread(_CLEANUP_BOT, thread_id, Priority.CLEANUP)
+    if not target:
+        return
+    await _unarchive_thread(target, "Thread cleanup warning")
+    minutes = max(int(round(warn_before / 60)), 1)
+    msg = f"[!] This thread will be deleted in {minutes} minute(s). Please wrap up."
+    try:
+        await _send(target, msg)
+    except discord.Forbidden:
+        if target.parent:
+            try:
+                await _send(target.parent, f"{target.mention}: {msg}")
+            except Exception:
+                pass
+    except Exception as exc:
+        log.debug("thread_warn_fail", extra={"thread_id": target.id, "err": repr(exc)})
+
+
+async def _cleanup_delete(thread_id: int):
+    target = await fetch_thread(_CLEANUP_BOT, thread_id, Priority.CLEANUP)
+    if _unpool(thread_id):
+        THREAD_POOL_STATS["expired"] += 1
+    elif target and await recycle_thread(_CLEANUP_BOT, target):
+        try:
+            await mark_thread_deleted(thread_id)
+        except Exception as exc:
+            log.warning("mark_thread_deleted_fail", extra={"thread_id": thread_id, "err": repr(exc)})
+        return
+    if target:
+        await _unarchive_thread(target, "Thread cleanup")
+        try:
+            await _send(target, "Thread is being deleted automatically.")
+        except Exception:
+            pass
+        try:
+            await REST.call(
+                Priority.CLEANUP, route_key("DELETE", f"/channels/{target.id}"), "thread_delete",
+                target.delete, reason="Auto-cleanup after match.",
+            )
+            forget_thread(target.id)
+            log.info("thread_deleted_auto", extra={"thread_id": target.id})
+        except discord.Forbidden as exc:
+            log.warning("thread_delete_forbidden", extra={"thread_id": target.id, "err": repr(exc)})
+        except Exception as exc:
+            log.warning("thread_delete_error", extra={"thread_id": target.id, "err": repr(exc)})
+        try:
+            await mark_thread_deleted(thread_id)
+        except Exception as exc:
+            log.warning("mark_thread_deleted_fail", extra={"thread_id": thread_id, "err": repr(exc)})
+
+
+async def _run_cleanup_stage(thread_id: int, payload: tuple[str, float]):
+    stage, delete_at = payload
+    if stage == "warn":
+        # Queue the deletion first so a failing warning can't drop it.
+        CLEANUPS.schedule(thread_id, delete_at, ("delete", delete_at))
+        await persist_thread_cleanup(thread_id, "delete", delete_at, delete_at)
+        await _cleanup_warn(thread_id, delete_at - time.time())
+        return
+    try:
+        await _cleanup_delete(thread_id)
+    finally:
+        if thread_id not in CLEANUPS:
+            discard_thread_cleanup(thread_id)
+
+
+CLEANUPS = DeadlineScheduler(
+    "thread_cleanup",
+    _run_cleanup_stage,
+    max_concurrent=THREAD_CLEANUP_CONCURRENCY,
+    running=THREAD_TASKS,
+    gate=partial(ADMISSION.wait_calm, "cleanup"),
+)
+_CLEANUP_BOT: Optional[discord.Client] = None
+gauge_fn("matchmaker_thread_tasks", "Thread cleanups currently running (THREAD_TASKS).", lambda: len(THREAD_TASKS))
+gauge_fn("matchmaker_thread_cleanups_pending", "Thread cleanup deadlines waiting to fire.", lambda: len(CLEANUPS))
+stats_gauge("matchmaker_thread_cache", "Thread lookup cache hits, misses and size.", thread_cache_stats)
+
+
 async def schedule_thread_cleanup(
     bot: discord.Client,
     thread: discord.Thread,
     delete_after: Optional[int] = None,
     warn_before: Optional[int] = None,
 ):
+    global _CLEANUP_BOT
+    _CLEANUP_BOT = bot
     delete_after = max(0, delete_after if delete_after is not None else MATCH_DELETE_AFTER_SEC)
     warn_before = max(0, warn_before if warn_before is not None else MATCH_WARN_BEFORE_SEC)
     warn_before = min(warn_before, delete_after)
-    warn_delay = max(delete_after - warn_before, 0)
     thread_id = thread.id
-    parent_channel = thread.parent if isinstance(thread, discord.Thread) else None
-
-    async def _runner():
-        try:
-            if warn_delay > 0:
-                await asyncio.sleep(warn_delay)
-            target = await fetch_thread(bot, thread_id)
-            if target and warn_before:
-                await _unarchive_thread(target, "Thread cleanup warning")
-                minutes = max(int(round(warn_before / 60)), 1)
-                msg = f"[!] This thread will be deleted in {minutes} minute(s). Please wrap up."
-                try:
-                    await target.send(msg)
-                except discord.Forbidden:
-                    if parent_channel:
-                        try:
-                            await parent_channel.send(f"{target.mention}: {msg}")
-                        except Exception:
-                            pass
-                except Exception as exc:
-                    log.debug("thread_warn_fail", extra={"thread_id": target.id, "err": repr(exc)})
-
-            if warn_before > 0:
-                await asyncio.sleep(warn_before)
-            elif delete_after > 0 and warn_delay == 0:
-                await asyncio.sleep(delete_after)
-
-            target = await fetch_thread(bot, thread_id)
-            if target:
-                await _unarchive_thread(target, "Thread cleanup")
-                try:
-                    await target.send("Thread is being deleted automatically.")
-                except Exception:
-                    pass
-                try:
-                    await target.delete(reason="Auto-cleanup after match.")
-                    log.info("thread_deleted_auto", extra={"thread_id": target.id})
-                except discord.Forbidden as exc:
-                    log.warning("thread_delete_forbidden", extra={"thread_id": target.id, "err": repr(exc)})
-                except Exception as exc:
-                    log.warning("thread_delete_error", extra={"thread_id": target.id, "err": repr(exc)})
-                try:
-                    await mark_thread_deleted(thread_id)
-                except Exception as exc:
-                    log.warning("mark_thread_deleted_fail", extra={"thread_id": thread_id, "err": repr(exc)})
-        finally:
-            THREAD_TASKS.pop(thread_id, None)
 
     cancel_thread_cleanup(thread_id)
-    THREAD_TASKS[thread_id] = asyncio.create_task(_runner())
+    delete_at = time.time() + delete_after
+    stage, due_at = ("warn", delete_at - warn_before) if warn_before else ("delete", delete_at)
+    CLEANUPS.schedule(thread_id, due_at, (stage, delete_at))
+    await persist_thread_cleanup(thread_id, stage, due_at, delete_at)
 
 
-async def add_members_to_thread(
+async def resume_thread_cleanups(bot: discord.Client) -> int:
+    """Re-arm cleanup deadlines persisted by a previous run."""
+    global _CLEANUP_BOT
+    _CLEANUP_BOT = bot
+    resumed = 0
+    for doc in await load_thread_cleanups():
+        thread_id = int(doc["_id"])
+        if thread_id in CLEANUPS or thread_id in THREAD_TASKS:
+            continue
+        stage = doc.get("stage", "delete")
+        delete_at = float(doc.get("deleteAt", 0.0))
+        due_at = float(doc.get("dueAt", delete_at))
+        CLEANUPS.schedule(thread_id, due_at, (stage, delete_at))
+        resumed += 1
+    if resumed:
+        log.info("thread_cleanups_resumed", extra={"count": resumed})
+    return resumed
+
+
+# Thread-member routes are bucketed per thread; overlapping bulk calls on the
+# same thread share one gate (with a refcount so idle gates are dropped).
+_MEMBER_GATES: dict[int, list] = {}
+_MEMBER_GLOBAL_GATE: Optional[asyncio.Semaphore] = None
+MEMBERSHIP_STATS: dict[str, float] = {
+    "batches": 0,
+    "calls": 0,
+    "skipped": 0,
+    "failed": 0,
+    "last_batch_sec": 0.0,
+    "max_batch_sec": 0.0,
+}
+stats_gauge("matchmaker_thread_membership", "Thread add/remove-member batch counters.", lambda: MEMBERSHIP_STATS)
+
+
+def _global_member_gate() -> asyncio.Semaphore:
+    global _MEMBER_GLOBAL_GATE
+    if _MEMBER_GLOBAL_GATE is None:
+        _MEMBER_GLOBAL_GATE = asyncio.Semaphore(max(THREAD_MEMBER_GLOBAL_CONCURRENCY, 1))
+    return _MEMBER_GLOBAL_GATE
+
+
+def _acquire_member_gate(thread_id: int) -> asyncio.Semaphore:
+    entry = _MEMBER_GATES.get(thread_id)
+    if entry is None:
+        entry = _MEMBER_GATES[thread_id] = [asyncio.Semaphore(max(THREAD_MEMBER_CONCURRENCY, 1)), 0]
+    entry[1] += 1
+    return entry[0]
+
+
+def _release_member_gate(thread_id: int):
+    entry = _MEMBER_GATES.get(thread_id)
+    if entry is not None:
+        entry[1] -= 1
+        if entry[1] <= 0:
+            _MEMBER_GATES.pop(thread_id, None)
+
+
+async def _bulk_membership(
     thread: discord.Thread,
     guild: discord.Guild,
     user_ids: Sequence[int],
-):
+    adding: bool,
+) -> dict[int, str]:
+    """Run add_user/remove_user for many users with bounded concurrency.
+
+    Returns an outcome per user: ``added``/``removed``, ``already_member``,
+    ``forbidden`` or ``error``.
+    """
     if thread.type is not discord.ChannelType.private_thread:
-        return
-    for uid in user_ids:
-        member = guild.get_member(uid)
-        if not member:
-            continue
-        try:
-            await thread.add_user(member)
-        except discord.Forbidden as exc:
-            log.debug("thread_add_user_forbidden", extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)})
-        except discord.HTTPException as exc:
-            if getattr(exc, "code", None) == 50013:  # Missing permissions
-                log.debug("thread_add_user_http_forbidden", extra={"thread_id": thread.id, "user_id": uid})
-            else:
-                log.debug("thread_add_user_http", extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)})
-        except Exception as exc:
-            log.debug("thread_add_user_fail", extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)})
+        return {}
+    prefix = "thread_add_user" if adding else "thread_remove_user"
+    # Adds are part of forming a lobby; removals are tidy-up.
+    priority = Priority.MATCH if adding else Priority.CLEANUP
+    method, call = ("PUT", thread.add_user) if adding else ("DELETE", thread.remove_user)
+    known = {m.id for m in thread.members} if adding else set()
+    outcomes: dict[int, str] = {}
+    global_gate = _global_member_gate()
+    gate = _acquire_member_gate(thread.id)
+    started = time.perf_counter()
+    # Per-user debug records are built only when they would be emitted.
+    debug = log.isEnabledFor(logging.DEBUG)
+
+    async def _one(uid: int):
+        if uid in known:
+            outcomes[uid] = "already_member"
+            MEMBERSHIP_STATS["skipped"] += 1
+            return
+        target = guild.get_member(uid) or discord.Object(id=uid)
+        async with gate, global_gate:
+            MEMBERSHIP_STATS["calls"] += 1
+            try:
+                await REST.call(
+                    priority, route_key(method, f"/channels/{thread.id}/thread-members/{uid}"), prefix, call, target
+                )
+                outcomes[uid] = "added" if adding else "removed"
+                return
+            except discord.Forbidden as exc:
+                outcomes[uid] = "forbidden"
+                if debug:
+                    log.debug(f"{prefix}_forbidden", extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)})
+            except discord.HTTPException as exc:
+                if getattr(exc, "code", None) == 50013:  # Missing permissions
+                    outcomes[uid] = "forbidden"
+                    if debug:
+                        log.debug(f"{prefix}_http_forbidden", extra={"thread_id": thread.id, "user_id": uid})
+                else:
+                    outcomes[uid] = "error"
+                    if debug:
+                        log.debug(f"{prefix}_http", extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)})
+            except Exception as exc:
+                outcomes[uid] = "error"
+                if debug:
+                    log.debug(f"{prefix}_fail", extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)})
+            MEMBERSHIP_STATS["failed"] += 1
+
+    try:
+        await asyncio.gather(*(_one(uid) for uid in dict.fromkeys(user_ids)))
+    finally:
+        _release_member_gate(thread.id)
+    elapsed = time.perf_counter() - started
+    MEMBERSHIP_STATS["batches"] += 1
+    MEMBERSHIP_STATS["last_batch_sec"] = elapsed
+    MEMBERSHIP_STATS["max_batch_sec"] = max(MEMBERSHIP_STATS["max_batch_sec"], elapsed)
+    if debug:
+        log.debug(
+            f"{prefix}_batch",
+            extra={"thread_id": thread.id, "users": len(outcomes), "elapsed": round(elapsed, 4)},
+        )
+    return outcomes
+
+
+async def add_members_to_thread(
+    thread: discord.Thread,
+    guild: discord.Guild,
+    user_ids: Sequence[int],
+) -> dict[int, str]:
+    return await _bulk_membership(thread, guild, user_ids, adding=True)
 
 
 async def remove_members_from_thread(
     thread: discord.Thread,
     guild: discord.Guild,
     user_ids: Sequence[int],
-):
-    if thread.type is not discord.ChannelType.private_thread:
-        return
-    for uid in user_ids:
-        member = guild.get_member(uid)
-        if not member:
-            continue
+) -> dict[int, str]:
+    return await _bulk_membership(thread, guild, user_ids, adding=False)
+
+
+# Spare queue threads per channel (THREAD_POOL_SIZE), created in the background or
+# recycled from finished lobbies. Spares sit archived as "queue-spare" with an idle
+# cleanup deadline, so ones orphaned by a restart are still deleted eventually.
+_SPARE_NAME = "queue-spare"
+_POOL: dict[int, deque[discord.Thread]] = {}
+_POOLED: dict[int, int] = {}  # spare thread_id -> channel_id
+_REFILLS: dict[int, asyncio.Task] = {}
+# Smoothing for the create/take latency averages.
+_POOL_EWMA = 0.2
+THREAD_POOL_STATS: dict[str, float] = {
+    "hits": 0,
+    "misses": 0,
+    "stale": 0,
+    "created": 0,
+    "recycled": 0,
+    "recycle_failed": 0,
+    "expired": 0,
+    "create_ms": 0.0,
+    "take_ms": 0.0,
+    "saved_ms": 0.0,
+}
+
+
+def _observe_pool_ms(key: str, elapsed: float):
+    ms = elapsed * 1000
+    prev = THREAD_POOL_STATS[key]
+    THREAD_POOL_STATS[key] = ms if not prev else prev + _POOL_EWMA * (ms - prev)
+
+
+def thread_pool_stats() -> dict[str, float]:
+    stats: dict[str, float] = dict(THREAD_POOL_STATS)
+    takes = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / takes, 4) if takes else 0.0
+    stats["spares"] = len(_POOLED)
+    stats["refilling"] = len(_REFILLS)
+    return stats
+
+
+stats_gauge("matchmaker_thread_pool", "Queue thread pool hits, refills, recycling and latency saved.",
+            thread_pool_stats)
+
+
+def _unpool(thread_id: int) -> bool:
+    channel_id = _POOLED.pop(thread_id, None)
+    if channel_id is None:
+        return False
+    spares = _POOL.get(channel_id)
+    if spares is not None:
+        for thread in spares:
+            if thread.id == thread_id:
+                spares.remove(thread)
+                break
+        if not spares:
+            _POOL.pop(channel_id, None)
+    return True
+
+
+async def _park(channel_id: int, thread: discord.Thread) -> bool:
+    """Archive a clean thread as a spare; False if the pool is full or the edit failed."""
+    spares = _POOL.get(channel_id)
+    if thread.id in _POOLED or (spares is not None and len(spares) >= THREAD_POOL_SIZE):
+        return False
+    try:
+        edited = await REST.call(
+            Priority.CLEANUP, route_key("PATCH", f"/channels/{thread.id}"), "thread_edit",
+            thread.edit, name=_SPARE_NAME, archived=True, reason="Matchmaking queue spare",
+        )
+    except Exception as exc:
+        log.warning("thread_pool_park_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+        return False
+    if isinstance(edited, discord.Thread):
+        thread = edited
+    remember_thread(thread)
+    _POOL.setdefault(channel_id, deque()).append(thread)
+    _POOLED[thread.id] = channel_id
+    delete_at = time.time() + THREAD_POOL_IDLE_SEC
+    CLEANUPS.schedule(thread.id, delete_at, ("delete", delete_at))
+    try:
+        await persist_thread_cleanup(thread.id, "delete", delete_at, delete_at)
+    except Exception as exc:
+        log.debug("thread_pool_persist_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+    return True
+
+
+async def _take_pooled_thread(bot: discord.Client, channel: discord.TextChannel) -> Optional[discord.Thread]:
+    """Rename and reopen a spare for a new lobby; None when the pool is empty."""
+    spares = _POOL.get(channel.id)
+    while spares:
+        thread = spares.popleft()
+        _unpool(thread.id)
+        cancel_thread_cleanup(thread.id)
+        started = time.perf_counter()
         try:
-            await thread.remove_user(member)
-        except discord.Forbidden as exc:
-            log.debug(
-                "thread_remove_user_forbidden",
-                extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)},
+            edited = await REST.call(
+                Priority.MATCH, route_key("PATCH", f"/channels/{thread.id}"), "thread_edit",
+                thread.edit, name=_queue_thread_name(), archived=False, reason="Matchmaking queue started",
             )
+        except discord.NotFound:
+            THREAD_POOL_STATS["stale"] += 1
+            forget_thread(thread.id)
+            continue
         except Exception as exc:
-            log.debug("thread_remove_user_fail", extra={"thread_id": thread.id, "user_id": uid, "err": repr(exc)})
+            THREAD_POOL_STATS["stale"] += 1
+            log.warning("thread_pool_take_fail", extra={"thread_id": thread.id, "err": repr(exc)})
+            await schedule_thread_cleanup(bot, thread, delete_after=0, warn_before=0)
+            continue
+        took = time.perf_counter() - started
+        _observe_pool_ms("take_ms", took)
+        THREAD_POOL_STATS["hits"] += 1
+        THREAD_POOL_STATS["saved_ms"] += max(THREAD_POOL_STATS["create_ms"] - took * 1000, 0.0)
+        if isinstance(edited, discord.Thread):
+            thread = edited
+        remember_thread(thread)
+        await _post_intro(thread)
+        return thread
+    return None
+
+
+async def _refill(bot: discord.Client, channel: discord.TextChannel):
+    global _CLEANUP_BOT
+    _CLEANUP_BOT = bot
+    try:
+        while len(_POOL.get(channel.id, ())) < THREAD_POOL_SIZE:
+            await ADMISSION.wait_calm("thread_pool")
+            thread = await _open_thread(channel, _SPARE_NAME, "Matchmaking queue spare", Priority.CLEANUP)
+            if thread is None:
+                return
+            THREAD_POOL_STATS["created"] += 1
+            if not await _park(channel.id, thread):
+                await delete_thread(thread, "Matchmaking queue spare not needed")
+                return
+    finally:
+        _REFILLS.pop(channel.id, None)
+
+
+def fill_thread_pool(bot: discord.Client, channel: discord.TextChannel):
+    """Top up the channel's spare threads in the background."""
+    if THREAD_POOL_SIZE <= 0:
+        return
+    task = _REFILLS.get(channel.id)
+    if task is None or task.done():
+        _REFILLS[channel.id] = asyncio.create_task(_refill(bot, channel), name=f"thread-pool-{channel.id}")
+
+
+async def recycle_thread(bot: discord.Client, thread: discord.Thread) -> bool:
+    """Empty a finished lobby or match thread and keep it as a spare instead of deleting it.
+
+    Only private threads are recycled: members of a public thread can't be
+    removed. Everyone but the bot is removed and its messages purged first;
+    False (the caller deletes the thread) when the pool is full or anything is
+    left behind.
+    """
+    global _CLEANUP_BOT
+    parent = thread.parent
+    if THREAD_POOL_SIZE <= 0 or parent is None or thread.type is not discord.ChannelType.private_thread:
+        return False
+    spares = _POOL.get(parent.id)
+    if spares is not None and len(spares) >= THREAD_POOL_SIZE:
+        return False
+    _CLEANUP_BOT = bot
+    CLEANUPS.cancel(thread.id)
+    try:
+        await _unarchive_thread(thread, "Recycling queue thread")
+        members = await REST.call(
+            Priority.CLEANUP, route_key("GET", f"/channels/{thread.id}/thread-members"), "thread_members",
+            thread.fetch_members,
+        )
+        me = thread.guild.me
+        others = [m.id for m in members if me is None or m.id != me.id]
+        if others:
+            outcomes = await remove_members_from_thread(thread, thread.guild, others)
+            if len(outcomes) < len(set(others)) or any(outcome != "removed" for outcome in outcomes.values()):
+                raise RuntimeError("members left in thread")
+        purged = await REST.call(
+            Priority.CLEANUP, route_key("POST", f"/channels/{thread.id}/messages/bulk-delete"), "thread_purge",
+            thread.purge, limit=THREAD_POOL_PURGE_LIMIT,
+        )
+        if len(purged) >= THREAD_POOL_PURGE_LIMIT:
+            raise RuntimeError("too many messages to purge")
+    except Exception as exc:
+        THREAD_POOL_STATS["recycle_failed"] += 1
+        log.info("thread_recycle_skipped", extra={"thread_id": thread.id, "err": repr(exc)})
+        return False
+    if not await _park(parent.id, thread):
+        return False
+    THREAD_POOL_STATS["recycled"] += 1
+    log.info("thread_recycled", extra={"thread_id": thread.id, "channel_id": parent.id})
+    return True
@@ -0,0 +1,119 @@
+"""Opt-in JSONL trace of queue commands, for replay with ``python -m bench.replay``.
+
+With TRACE_PATH set, every /join, /leave, /setup and /cancel appends one line:
+
+    {"t": 1700000000.123, "g": 1, "c": 2, "u": 3, "cmd": "join", "out": "joined", "ms": 12.3}
+
+``out`` is what the command noted with ``note_outcome`` (an engine status,
+"busy", "unavailable", "rate_limited", ...), "ok" if it noted nothing, or
+"error:<Type>" if it raised. Lines are buffered and appended off the event
+loop about once a second and on shutdown.
+"""
+import asyncio
+import functools
+import json
+import time
+from typing import Dict, List, Optional
+
+from logging import getLogger
+
+from config import TRACE_FLUSH_SEC, TRACE_PATH
+from core.metrics import stats_gauge
+
+log = getLogger("bot")
+
+# Flush early once this many lines are buffered.
+_MAX_BUFFER = 1000
+
+
+def note_outcome(interaction, outcome: str):
+    """Record how a command ended, for the trace (``interaction.extras``)."""
+    extras = getattr(interaction, "extras", None)
+    if extras is not None:
+        extras["outcome"] = outcome
+
+
+def _append(path: str, lines: List[str]):
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+class TraceRecorder:
+    def __init__(self, path: Optional[str], flush_interval: float):
+        self.path = path or None
+        self.flush_interval = max(flush_interval, 0.0)
+        self._buffer: List[str] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, int] = {"recorded": 0, "written": 0, "dropped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def record(self, entry: dict):
+        self._buffer.append(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.stats["recorded"] += 1
+        if self._flusher is None or self._flusher.done():
+            delay = 0.0 if len(self._buffer) >= _MAX_BUFFER else self.flush_interval
+            self._flusher = asyncio.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:  # keep appends in order
+            lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            try:
+                await asyncio.to_thread(_append, self.path, lines)
+            except OSError as exc:
+                self.stats["dropped"] += len(lines)
+                log.warning("trace_write_fail", extra={"path": self.path, "err": repr(exc)})
+            else:
+                self.stats["written"] += len(lines)
+
+    async def close(self):
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        if self.enabled:
+            await self.flush()
+
+
+TRACE = TraceRecorder(TRACE_PATH, TRACE_FLUSH_SEC)
+stats_gauge("matchmaker_trace", "Command trace lines recorded, written and dropped.", lambda: TRACE.stats)
+
+
+def traced(fn):
+    """Wrap a slash-command callback (above ``admission_control``) to append it to the trace."""
+    command = fn.__name__.removesuffix("_cmd")
+
+    @functools.wraps(fn)
+    async def wrapper(interaction, *args, **kwargs):
+        if not TRACE.enabled:
+            return await fn(interaction, *args, **kwargs)
+        at = time.time()
+        started = time.perf_counter()
+        outcome = None
+        try:
+            return await fn(interaction, *args, **kwargs)
+        except Exception as exc:
+            outcome = f"error:{type(exc).__name__}"
+            raise
+        finally:
+            extras = getattr(interaction, "extras", None) or {}
+            TRACE.record({
+                "t": round(at, 3),
+                "g": interaction.guild_id,
+                "c": interaction.channel_id,
+                "u": interaction.user.id,
+                "cmd": command,
+                "out": outcome or extras.get("outcome", "ok"),
+                "ms": round((time.perf_counter() - started) * 1000, 3),
+            })
+
+    return wrapper
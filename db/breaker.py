@@ -0,0 +1,223 @@
+"""Circuit breaker and degraded mode around Mongo calls.
+
+After ``failure_threshold`` consecutive transient failures the breaker opens:
+reads fail fast with ``MongoUnavailable`` and replayable writes are queued in
+memory instead of awaited. After ``reset_timeout`` one probe call is let
+through (half-open); success closes the breaker and the queued writes are
+replayed in order. The replay queue is bounded; the oldest writes are shed
+(and counted) if an outage outlasts it.
+
+``hold()`` puts the breaker in the same degraded mode before the client has
+connected at all (warm start); ``release()`` lifts it and starts the replay.
+"""
+import asyncio
+import functools
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from logging import getLogger
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+
+log = getLogger("bot")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Errors that say "the database is unreachable or slow", as opposed to a bad query.
+TRANSIENT_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError, asyncio.TimeoutError)
+
+
+class MongoUnavailable(Exception):
+    """Raised instead of calling Mongo while the breaker is open."""
+
+
+# Catch these where a command should answer "try again" rather than fail.
+UNAVAILABLE = (MongoUnavailable, *TRANSIENT_ERRORS)
+
+
+_Write = Tuple[str, Callable[..., Awaitable[Any]], tuple, dict]
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, max_replay: int):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = max(reset_timeout, 0.1)
+        self.max_replay = max(max_replay, 0)
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._held = False
+        self._replay: Deque[_Write] = deque()
+        self._replayer: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {
+            "opened": 0,
+            "fast_failed": 0,
+            "failures": 0,
+            "queued": 0,
+            "replayed": 0,
+            "replay_failed": 0,
+            "shed": 0,
+        }
+
+    @property
+    def degraded(self) -> bool:
+        return self._held or self.state != CLOSED or bool(self._replay)
+
+    def hold(self):
+        """Fail reads and queue writes until ``release()``, e.g. while still connecting."""
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            if self._replay:
+                self._start_replayer()
+
+    def allow(self) -> bool:
+        """Whether a call may go to Mongo now (claims the half-open probe if due)."""
+        if self._held:
+            return False
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self._failures = 0
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self._probing = False
+            log.info("mongo_breaker_closed", extra={"breaker": self.name, "backlog": len(self._replay)})
+        if self._replay:
+            self._start_replayer()
+
+    def failure(self, exc: BaseException):
+        self.stats["failures"] += 1
+        self._failures += 1
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.stats["opened"] += 1
+                log.warning("mongo_breaker_open", extra={"breaker": self.name, "err": repr(exc)})
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs):
+        if not self.allow():
+            self.stats["fast_failed"] += 1
+            raise MongoUnavailable(f"{self.name} circuit open")
+        try:
+            result = await fn(*args, **kwargs)
+        except TRANSIENT_ERRORS as exc:
+            self.failure(exc)
+            raise
+        except asyncio.CancelledError:
+            if self.state == HALF_OPEN:
+                self._probing = False  # let the next call probe instead
+            raise
+        except Exception:
+            # Not an availability problem (e.g. duplicate key): the server answered.
+            self._release_probe()
+            raise
+        self.success()
+        return result
+
+    def _release_probe(self):
+        if self.state == HALF_OPEN:
+            self.success()
+
+    def defer(self, op: str, fn: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict):
+        """Queue a write for replay once Mongo is reachable again."""
+        if self.max_replay == 0:
+            self.stats["shed"] += 1
+            return
+        if len(self._replay) >= self.max_replay:
+            self._replay.popleft()
+            self.stats["shed"] += 1
+        self._replay.append((op, fn, args, kwargs))
+        self.stats["queued"] += 1
+        self._start_replayer()
+
+    def _start_replayer(self):
+        if self._replayer is None or self._replayer.done():
+            try:
+                self._replayer = asyncio.get_running_loop().create_task(self._replay_loop())
+            except RuntimeError:
+                pass  # no running loop (shutdown); the next call restarts it
+
+    async def _replay_loop(self):
+        while self._replay:
+            if self._held:
+                return  # release() restarts the replay
+            if self.state == OPEN:
+                await asyncio.sleep(max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.05))
+            entry = self._replay[0]
+            op, fn, args, kwargs = entry
+            try:
+                await self.call(fn, *args, **kwargs)
+            except UNAVAILABLE:
+                await asyncio.sleep(0.05)
+                continue
+            except Exception as exc:
+                self.stats["replay_failed"] += 1
+                log.warning("mongo_replay_fail", extra={"op": op, "err": repr(exc)})
+            else:
+                self.stats["replayed"] += 1
+            if self._replay and self._replay[0] is entry:
+                self._replay.popleft()
+        log.info("mongo_replay_done", extra={"breaker": self.name, "replayed": self.stats["replayed"]})
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats["state"] = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[self.state]
+        stats["backlog"] = len(self._replay)
+        stats["degraded"] = int(self.degraded)
+        stats["held"] = int(self._held)
+        return stats
+
+
+def guarded(breaker: CircuitBreaker):
+    """Route an async Mongo function through ``breaker``; fails fast while open."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await breaker.call(fn, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def replayable(breaker: CircuitBreaker):
+    """Like ``guarded``, but a write that can't reach Mongo is queued for replay.
+
+    The wrapped function returns None when deferred, so callers must not rely
+    on its result.
+    """
+
+    def decorator(fn):
+        op = fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if breaker._replay:
+                # Keep writes in order behind the backlog.
+                breaker.defer(op, fn, args, kwargs)
+                return None
+            try:
+                return await breaker.call(fn, *args, **kwargs)
+            except UNAVAILABLE:
+                breaker.defer(op, fn, args, kwargs)
+                return None
+
+        return wrapper
+
+    return decorator
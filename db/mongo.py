@@ -1,7 +1,36 @@
 import datetime as dt
-from typing import List, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_URI, MONGO_DB, MATCH_TTL_DAYS
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from config import (
+    MONGO_URI,
+    MONGO_DB,
+    MATCH_TTL_DAYS,
+    PERSIST_FLUSH_INTERVAL_SEC,
+    PERSIST_MAX_STALENESS_SEC,
+    PERSIST_MAX_BATCH,
+    STATS_CACHE_SIZE,
+    STATS_CACHE_TTL_SEC,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_COMPRESSORS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_TIMEOUT_MS,
+    MONGO_RETRY_WRITES,
+    MONGO_BREAKER_FAILURES,
+    MONGO_BREAKER_RESET_SEC,
+    MONGO_REPLAY_MAX,
+)
+from core.metrics import MONGO_LATENCY, stats_gauge, timed
+from core.queue import ChannelState
+from db.breaker import CircuitBreaker, guarded, replayable
+from db.write_behind import WriteBehind
 from logging import getLogger
 import certifi
 
@@ -11,85 +40,383 @@ client: AsyncIOMotorClient | None = None
 db = None
 queues_col = None
 matches_col = None
+cleanups_col = None
+meta_col = None
+members_col = None
+stats_col = None
+
+# Bump when indexes change; init_mongo only (re)creates indexes on a version change.
+SCHEMA_VERSION = 3
+# Shared by every call below: reads fail fast while it is open, writes queue for replay.
+MONGO_BREAKER = CircuitBreaker(
+    "mongo",
+    failure_threshold=MONGO_BREAKER_FAILURES,
+    reset_timeout=MONGO_BREAKER_RESET_SEC,
+    max_replay=MONGO_REPLAY_MAX,
+)
+# Queue documents are written behind the command path and flushed in batches.
+QUEUE_WRITES = WriteBehind(
+    "queues",
+    flush_interval=PERSIST_FLUSH_INTERVAL_SEC,
+    max_staleness=PERSIST_MAX_STALENESS_SEC,
+    max_batch=PERSIST_MAX_BATCH,
+    breaker=MONGO_BREAKER,
+)
+# Pending thread-cleanup deadlines, so they survive a restart.
+CLEANUP_WRITES = WriteBehind(
+    "thread_cleanups",
+    flush_interval=PERSIST_FLUSH_INTERVAL_SEC,
+    max_staleness=PERSIST_MAX_STALENESS_SEC,
+    max_batch=PERSIST_MAX_BATCH,
+    breaker=MONGO_BREAKER,
+)
+
+def client_options() -> dict:
+    """Driver options from config: pool, compression, timeouts and TLS."""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "retryWrites": MONGO_RETRY_WRITES,
+        "retryReads": True,
+        "tls": True,
+        "tlsAllowInvalidCertificates": False,
+        "tlsCAFile": certifi.where(),
+    }
+    if MONGO_TIMEOUT_MS > 0:
+        options["timeoutMS"] = MONGO_TIMEOUT_MS
+    compressors = [c.strip() for c in MONGO_COMPRESSORS.split(",") if c.strip()]
+    if compressors:
+        options["compressors"] = compressors
+    return options
 
 async def init_mongo():
-    global client, db, queues_col, matches_col
+    """Connect once per process; later calls (e.g. after a reconnect) are no-ops."""
+    global client, db, queues_col, matches_col, cleanups_col, meta_col, members_col, stats_col
+    if client is not None:
+        return
     if not MONGO_URI:
         raise RuntimeError("Missing MONGO_URI in environment.")
-    client = AsyncIOMotorClient(
-        MONGO_URI,
-        serverSelectionTimeoutMS=20000,  # give it time
-        tls=True,                        # be explicit
-        tlsAllowInvalidCertificates=False,
-        tlsCAFile=certifi.where(),       # <- trust store
-    )
+    client = AsyncIOMotorClient(MONGO_URI, **client_options())
     db = client[MONGO_DB]
     queues_col = db["queues"]
     matches_col = db["matches"]
-    # indexes
+    cleanups_col = db["thread_cleanups"]
+    meta_col = db["meta"]
+    members_col = db["queue_members"]
+    stats_col = db["match_stats"]
+    try:
+        await ensure_indexes()
+    except BaseException:
+        client = None  # server selection failed; let the next call retry from scratch
+        raise
+    QUEUE_WRITES.start(queues_col)
+    CLEANUP_WRITES.start(cleanups_col)
+
+@timed(MONGO_LATENCY)
+async def ensure_indexes() -> bool:
+    """Create indexes if the stored schema version differs. Returns True if it ran."""
+    stored = await meta_col.find_one({"_id": "schema"})
+    if stored and stored.get("version") == SCHEMA_VERSION:
+        return False
     await queues_col.create_index([("updatedAt", -1)], name="updatedAt_desc")
     await matches_col.create_index(
         [("createdAt", 1)],
         name="ttl_createdAt",
         expireAfterSeconds=MATCH_TTL_DAYS * 24 * 3600,
     )
-    await matches_col.create_index([("guildId", 1), ("createdAt", -1)], name="guild_createdAt")
+    await matches_col.create_index([("guildId", 1), ("createdAt", -1), ("_id", -1)], name="guild_createdAt_id")
+    try:
+        # Superseded by guild_createdAt_id in schema 3; every insert would maintain both.
+        await matches_col.drop_index("guild_createdAt")
+    except OperationFailure as exc:
+        if exc.code != 27:  # IndexNotFound: the database was created at schema 3 or later
+            raise
     await matches_col.create_index([("threadId", 1)], name="threadId")
+    await members_col.create_index([("claimedAt", 1)], name="claimedAt")
+    await meta_col.update_one(
+        {"_id": "schema"},
+        {"$set": {"version": SCHEMA_VERSION, "updatedAt": dt.datetime.now(dt.timezone.utc)}},
+        upsert=True,
+    )
+    log.info("mongo_indexes_created", extra={"schema_version": SCHEMA_VERSION})
+    return True
+
+@timed(MONGO_LATENCY)
+@guarded(MONGO_BREAKER)
+async def get_meta(key: str) -> Optional[dict]:
+    return await meta_col.find_one({"_id": key})
+
+@timed(MONGO_LATENCY)
+@replayable(MONGO_BREAKER)
+async def set_meta(key: str, fields: dict):
+    fields = dict(fields, updatedAt=dt.datetime.now(dt.timezone.utc))
+    await meta_col.update_one({"_id": key}, {"$set": fields}, upsert=True)
+
+@timed(MONGO_LATENCY)
+@guarded(MONGO_BREAKER)
+async def load_queues_from_db(STATE, GLOBAL_Q_MEMBERS, limit: int = 0, owns_guild=None):
+    """Prefetch channels with waiting players, most recently updated first.
+
+    Channels with empty queues are hydrated lazily by ``load_queue_doc``.
+    ``owns_guild`` skips channels served by another shard process.
+    """
+    cursor = queues_col.find({"queue.0": {"$exists": True}}).sort("updatedAt", -1)
+    if limit > 0:
+        cursor = cursor.limit(limit)
+    async for doc in cursor:
+        data = ChannelState.from_doc(doc)
+        if owns_guild is not None and not owns_guild(data.guild_id):
+            continue
+        if data.channel_id in STATE:
+            continue  # keep live state (and its lock) on a repeated load
+        STATE[data.channel_id] = data
+        for uid in data.queue:
+            GLOBAL_Q_MEMBERS.setdefault(uid, data.channel_id)
 
-async def load_queues_from_db(STATE, GLOBAL_Q_MEMBERS):
-    async for doc in queues_col.find({}):
-        ch_id = int(doc.get("_id", doc.get("channelId")))
-        q = [int(u) for u in doc.get("queue", [])]
-        embed_id = doc.get("embedMsgId")
-        thread_id = doc.get("queueThreadId")
-        import asyncio
-        STATE[ch_id] = {
-            "queue": q,
-            "embed_msg_id": embed_id,
-            "lock": asyncio.Lock(),
-            "queue_thread_id": int(thread_id) if thread_id else None,
-        }
-        for uid in q:
-            GLOBAL_Q_MEMBERS[uid] = ch_id
+async def _find_queue_doc(channel_id: int) -> Optional[dict]:
+    return await queues_col.find_one({"_id": channel_id})
 
+@timed(MONGO_LATENCY)
+async def load_queue_doc(channel_id: int) -> Optional[dict]:
+    """Fetch one channel's queue document, preferring a not-yet-flushed write."""
+    if QUEUE_WRITES.is_dirty(channel_id):
+        return QUEUE_WRITES.pending(channel_id)
+    return await MONGO_BREAKER.call(_find_queue_doc, channel_id)
+
+@timed(MONGO_LATENCY)
+@guarded(MONGO_BREAKER)
+async def load_queue_docs(channel_ids: List[int]) -> Dict[int, dict]:
+    """Stored queue documents for ``channel_ids`` (missing ones are absent), one query."""
+    docs = {}
+    async for doc in queues_col.find({"_id": {"$in": list(channel_ids)}}):
+        docs[doc["_id"]] = doc
+    return docs
+
+def mark_queue_doc(data: ChannelState, guild_id: Optional[int] = None):
+    """Queue ``data``'s document for the write-behind flusher, stamping updatedAt."""
+    now = dt.datetime.now(dt.timezone.utc)
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # what Mongo stores
+    fields = data.to_doc()
+    if guild_id is not None:
+        fields["guildId"] = guild_id
+    fields["updatedAt"] = now
+    data.updated_at = now.timestamp()
+    QUEUE_WRITES.mark(data.channel_id, fields)
+
+@timed(MONGO_LATENCY)
 async def persist_queue_doc(channel, STATE):
-    data = STATE[channel.id]
-    queue = data["queue"]
-    embed_id = data["embed_msg_id"]
-    queue_thread_id = data.get("queue_thread_id")
-    await queues_col.update_one(
-        {"_id": channel.id},
-        {
-            "$set": {
-                "_id": channel.id,
-                "channelId": channel.id,
-                "guildId": channel.guild.id,
-                "queue": queue,
-                "embedMsgId": embed_id,
-                "queueThreadId": queue_thread_id,
-                "updatedAt": dt.datetime.now(dt.timezone.utc),
+    """Mark the channel's queue document dirty; the write-behind flusher upserts it."""
+    mark_queue_doc(STATE[channel.id], channel.guild.id)
+
+@timed(MONGO_LATENCY)
+async def remove_queue_doc(channel_id: int):
+    QUEUE_WRITES.mark_delete(channel_id)
+
+@timed(MONGO_LATENCY)
+@replayable(MONGO_BREAKER)
+async def remove_guild_queue_docs(guild_id: int):
+    """Delete every stored queue for a guild the bot has left (resident or not)."""
+    await queues_col.delete_many({"guildId": guild_id})
+
+@timed(MONGO_LATENCY)
+async def flush_queue_docs():
+    """Durably write pending queue and cleanup documents (used on shutdown)."""
+    await QUEUE_WRITES.close()
+    await CLEANUP_WRITES.close()
+
+def persistence_stats() -> dict:
+    return QUEUE_WRITES.snapshot_stats()
+
+stats_gauge("matchmaker_queue_writes", "Queue document write-behind counters.", persistence_stats)
+stats_gauge("matchmaker_cleanup_writes", "Thread cleanup write-behind counters.", CLEANUP_WRITES.snapshot_stats)
+stats_gauge("matchmaker_mongo_breaker", "Mongo circuit breaker (state 0=closed 1=half-open 2=open) and replay counters.",
+            MONGO_BREAKER.snapshot_stats)
+
+def breaker_stats() -> dict:
+    return MONGO_BREAKER.snapshot_stats()
+
+def player_stats_key(guild_id: int, user_id: int) -> str:
+    return f"p:{guild_id}:{user_id}"
+
+def guild_stats_key(guild_id: int) -> str:
+    return f"g:{guild_id}"
+
+# Small read-through cache for match_stats documents: key -> (expires_at, doc or None).
+_STATS_CACHE: "OrderedDict[str, Tuple[float, Optional[dict]]]" = OrderedDict()
+STATS_CACHE_STATS = {"hits": 0, "misses": 0}
+
+# Match ids remembered per counters document to make replayed counter updates idempotent.
+_COUNTED_MATCH_IDS = 16
+
+@timed(MONGO_LATENCY)
+async def record_match(
+    guild_id: int,
+    channel_id: int,
+    player_ids: List[int],
+    thread_id: Optional[int],
+    teams: Optional[List[List[int]]] = None,
+    ratings: Optional[List[float]] = None,
+):
+    """Store a match; ``teams`` and ``ratings`` (aligned with ``player_ids``) come from rating matchmaking."""
+    extra: dict = {}
+    if teams:
+        extra["teams"] = [list(team) for team in teams]
+    if ratings:
+        extra["ratings"] = list(ratings)
+    # Id and timestamp are fixed here so a replayed write records the original match once.
+    await _write_match(
+        ObjectId(), dt.datetime.now(dt.timezone.utc), guild_id, channel_id, list(player_ids), thread_id, extra
+    )
+
+@replayable(MONGO_BREAKER)
+async def _write_match(
+    match_id: ObjectId,
+    now: dt.datetime,
+    guild_id: int,
+    channel_id: int,
+    player_ids: List[int],
+    thread_id: Optional[int],
+    extra: Optional[dict] = None,
+):
+    try:
+        await matches_col.insert_one(
+            {
+                "_id": match_id,
+                "guildId": guild_id,
+                "channelId": channel_id,
+                "players": player_ids,
+                "threadId": thread_id,
+                "createdAt": now,
+                **(extra or {}),
             }
-        },
-        upsert=True,
+        )
+    except DuplicateKeyError:
+        pass  # inserted by an earlier attempt whose counter update failed
+    # Precomputed counters so /stats is one indexed read regardless of history size.
+    # Each counters document keeps the ids of the last few matches it counted and the
+    # filter skips those, so replaying after a lost bulk_write response can't count twice.
+    unseen = {"recentMatchIds": {"$ne": match_id}}
+    push = {"$push": {"recentMatchIds": {"$each": [match_id], "$slice": -_COUNTED_MATCH_IDS}}}
+    writes = [
+        (
+            {"_id": guild_stats_key(guild_id), **unseen},
+            {"$inc": {"matches": 1}, "$set": {"guildId": guild_id, "lastMatchAt": now}, **push},
+        )
+    ]
+    for uid in player_ids:
+        writes.append(
+            (
+                {"_id": player_stats_key(guild_id, uid), **unseen},
+                {"$inc": {"games": 1}, "$set": {"guildId": guild_id, "userId": uid, "lastPlayedAt": now}, **push},
+            )
+        )
+    try:
+        await stats_col.bulk_write([UpdateOne(f, u, upsert=True) for f, u in writes], ordered=False)
+    except BulkWriteError as exc:
+        # An upsert collides on _id when the document exists but its filter missed: either
+        # this match is already counted there, or another match created it concurrently.
+        # Retry those without upsert; the id guard makes the retry a no-op in the first case.
+        errors = exc.details.get("writeErrors", [])
+        if exc.details.get("writeConcernErrors") or any(e.get("code") != 11000 for e in errors):
+            raise
+        await stats_col.bulk_write([UpdateOne(*writes[e["index"]]) for e in errors], ordered=False)
+    _STATS_CACHE.pop(guild_stats_key(guild_id), None)
+    for uid in player_ids:
+        _STATS_CACHE.pop(player_stats_key(guild_id, uid), None)
+
+@timed(MONGO_LATENCY)
+@guarded(MONGO_BREAKER)
+async def load_ratings(guild_id: int, user_ids: List[int]) -> Dict[int, float]:
+    """Ratings stored on the players' counters documents; players without one are omitted."""
+    keys = [player_stats_key(guild_id, uid) for uid in user_ids]
+    found: Dict[int, float] = {}
+    async for doc in stats_col.find({"_id": {"$in": keys}, "rating": {"$exists": True}}, {"userId": 1, "rating": 1}):
+        found[int(doc["userId"])] = float(doc["rating"])
+    return found
+
+@timed(MONGO_LATENCY)
+@guarded(MONGO_BREAKER)
+async def set_rating(guild_id: int, user_id: int, value: float):
+    """Store a player's matchmaking rating on their counters document (/setrating)."""
+    key = player_stats_key(guild_id, user_id)
+    await stats_col.update_one(
+        {"_id": key}, {"$set": {"guildId": guild_id, "userId": user_id, "rating": float(value)}}, upsert=True
     )
+    _STATS_CACHE.pop(key, None)
 
-async def remove_queue_doc(channel_id: int):
-    await queues_col.delete_one({"_id": channel_id})
-
-async def record_match(guild_id: int, channel_id: int, player_ids: List[int], thread_id: Optional[int]):
-    await matches_col.insert_one(
-        {
-            "guildId": guild_id,
-            "channelId": channel_id,
-            "players": player_ids,
-            "threadId": thread_id,
-            "createdAt": dt.datetime.now(dt.timezone.utc),
-        }
+@timed(MONGO_LATENCY)
+async def get_match_stats(key: str) -> Optional[dict]:
+    """Read one counters document through the in-process cache."""
+    cached = _STATS_CACHE.get(key)
+    now = time.monotonic()
+    if cached is not None and cached[0] > now:
+        _STATS_CACHE.move_to_end(key)
+        STATS_CACHE_STATS["hits"] += 1
+        return cached[1]
+    STATS_CACHE_STATS["misses"] += 1
+    doc = await MONGO_BREAKER.call(stats_col.find_one, {"_id": key})
+    _STATS_CACHE[key] = (now + STATS_CACHE_TTL_SEC, doc)
+    _STATS_CACHE.move_to_end(key)
+    while len(_STATS_CACHE) > STATS_CACHE_SIZE:
+        _STATS_CACHE.popitem(last=False)
+    return doc
+
+@timed(MONGO_LATENCY)
+@guarded(MONGO_BREAKER)
+async def fetch_match_history(
+    guild_id: int,
+    channel_id: Optional[int] = None,
+    before: Optional[Tuple[dt.datetime, Optional[ObjectId]]] = None,
+    limit: int = 10,
+) -> List[dict]:
+    """Newest-first page of matches served from the guild_createdAt_id index.
+
+    Pass the last row's ``(createdAt, _id)`` as ``before`` to get the next page;
+    the id orders matches recorded in the same millisecond.
+    """
+    query: dict = {"guildId": guild_id}
+    if channel_id is not None:
+        query["channelId"] = channel_id
+    if before is not None:
+        created_at, last_id = before
+        if last_id is None:
+            query["createdAt"] = {"$lt": created_at}
+        else:
+            query["$or"] = [
+                {"createdAt": {"$lt": created_at}},
+                {"createdAt": created_at, "_id": {"$lt": last_id}},
+            ]
+    cursor = (
+        matches_col.find(query, {"_id": 1, "channelId": 1, "players": 1, "threadId": 1, "createdAt": 1})
+        .sort([("createdAt", -1), ("_id", -1)])
+        .hint("guild_createdAt_id")
+        .limit(limit)
     )
+    return [doc async for doc in cursor]
 
+@timed(MONGO_LATENCY)
+@replayable(MONGO_BREAKER)
 async def mark_thread_deleted(thread_id: int):
     await matches_col.update_one(
         {"threadId": thread_id},
         {"$set": {"deletedAt": dt.datetime.now(dt.timezone.utc)}},
         upsert=False,
     )
+
+@timed(MONGO_LATENCY)
+async def persist_thread_cleanup(thread_id: int, stage: str, due_at: float, delete_at: float):
+    CLEANUP_WRITES.mark(
+        thread_id,
+        {"_id": thread_id, "stage": stage, "dueAt": due_at, "deleteAt": delete_at},
+    )
+
+def discard_thread_cleanup(thread_id: int):
+    CLEANUP_WRITES.mark_delete(thread_id)
+
+@timed(MONGO_LATENCY)
+@guarded(MONGO_BREAKER)
+async def load_thread_cleanups() -> List[dict]:
+    return [doc async for doc in cleanups_col.find({})]
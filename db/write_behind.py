@@ -0,0 +1,192 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+from logging import getLogger
+from pymongo import DeleteOne, UpdateOne
+
+from core.metrics import MONGO_LATENCY
+from db.breaker import CircuitBreaker, MongoUnavailable
+
+log = getLogger("bot")
+
+_DELETE = object()
+
+
+class WriteBehind:
+    """Buffers per-_id upserts and flushes them to a collection as bulk_write batches.
+
+    Repeated writes to the same _id are merged (last write wins). A batch is
+    flushed once writes have been quiet for ``flush_interval`` seconds, once the
+    oldest pending write reaches ``max_staleness`` seconds, or as soon as
+    ``max_batch`` distinct ids are dirty.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_interval: float,
+        max_staleness: float,
+        max_batch: int,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.breaker = breaker
+        self.flush_interval = max(flush_interval, 0.0)
+        self.max_staleness = max(max_staleness, self.flush_interval)
+        self.max_batch = max(max_batch, 1)
+        self.collection = None
+        self._pending: Dict[Any, Any] = {}
+        self._first_dirty_at: Optional[float] = None
+        self._last_mark_at: float = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, float] = {
+            "marks": 0,
+            "merged": 0,
+            "flushes": 0,
+            "docs_written": 0,
+            "errors": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_flush_lag": 0.0,
+            "max_flush_lag": 0.0,
+        }
+
+    def start(self, collection):
+        self.collection = collection
+        if self._wake is None:
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self._pending:
+            self._wake.set()
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _mark(self, key: Any, value: Any):
+        now = self._now()
+        self.stats["marks"] += 1
+        if key in self._pending:
+            self.stats["merged"] += 1
+        if not self._pending:
+            self._first_dirty_at = now
+        self._pending[key] = value
+        self._last_mark_at = now
+        if self._wake and (len(self._pending) == 1 or len(self._pending) >= self.max_batch):
+            self._wake.set()
+
+    def mark(self, key: Any, fields: Dict[str, Any]):
+        """Queue a ``$set`` upsert for ``key``, replacing any pending write for it."""
+        self._mark(key, fields)
+
+    def mark_delete(self, key: Any):
+        self._mark(key, _DELETE)
+
+    def pending(self, key: Any) -> Optional[Dict[str, Any]]:
+        """Return the not-yet-flushed fields for ``key`` (None if clean or deleted)."""
+        value = self._pending.get(key)
+        return None if value is _DELETE else value
+
+    def is_dirty(self, key: Any) -> bool:
+        return key in self._pending
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wake.clear()
+                await self._wake.wait()
+            while self._pending:
+                now = self._now()
+                deadline = min(
+                    self._last_mark_at + self.flush_interval,
+                    (self._first_dirty_at or now) + self.max_staleness,
+                )
+                if len(self._pending) >= self.max_batch or now >= deadline:
+                    break
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), deadline - now)
+                except asyncio.TimeoutError:
+                    pass
+            if self._pending and not await self.flush():
+                await asyncio.sleep(max(self.flush_interval, 1.0))
+
+    async def flush(self) -> bool:
+        """Write everything pending now. Failed writes are kept for the next attempt."""
+        if self.collection is None or self._flush_lock is None:
+            return False
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            batch = self._pending
+            first_dirty_at = self._first_dirty_at
+            self._pending = {}
+            self._first_dirty_at = None
+
+            ops = []
+            for key, value in batch.items():
+                if value is _DELETE:
+                    ops.append(DeleteOne({"_id": key}))
+                else:
+                    ops.append(UpdateOne({"_id": key}, {"$set": value}, upsert=True))
+            try:
+                async with MONGO_LATENCY.time(f"flush_{self.name}"):
+                    if self.breaker is not None:
+                        await self.breaker.call(self.collection.bulk_write, ops, ordered=False)
+                    else:
+                        await self.collection.bulk_write(ops, ordered=False)
+            except Exception as exc:
+                self.stats["errors"] += 1
+                if isinstance(exc, MongoUnavailable):
+                    # Breaker open: the batch just stays buffered (degraded mode).
+                    log.debug("write_behind_flush_deferred", extra={"store": self.name, "batch": len(ops)})
+                else:
+                    log.warning(
+                        "write_behind_flush_fail",
+                        extra={"store": self.name, "batch": len(ops), "err": repr(exc)},
+                    )
+                # Newer marks made during the failed write win over the stale batch.
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                if first_dirty_at is not None:
+                    self._first_dirty_at = min(first_dirty_at, self._first_dirty_at or first_dirty_at)
+                return False
+
+            lag = self._now() - first_dirty_at if first_dirty_at is not None else 0.0
+            self.stats["flushes"] += 1
+            self.stats["docs_written"] += len(ops)
+            self.stats["last_batch_size"] = len(ops)
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(ops))
+            self.stats["last_flush_lag"] = lag
+            self.stats["max_flush_lag"] = max(self.stats["max_flush_lag"], lag)
+            log.debug("write_behind_flush", extra={"store": self.name, "batch": len(ops), "lag": round(lag, 4)})
+            return True
+
+    async def close(self, attempts: int = 3):
+        """Stop the flush loop and durably write whatever is still pending."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        for _ in range(max(attempts, 1)):
+            if not self._pending or await self.flush():
+                break
+        if self._pending:
+            log.error("write_behind_unflushed", extra={"store": self.name, "pending": len(self._pending)})
+
+    def snapshot_stats(self) -> Dict[str, float]:
+        stats = dict(self.stats)
+        stats["pending"] = len(self._pending)
+        stats["oldest_pending_age"] = (
+            self._now() - self._first_dirty_at if self._first_dirty_at is not None else 0.0
+        )
+        return stats
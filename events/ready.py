@@ -1,20 +1,146 @@
+import asyncio
+import hashlib
+import json
+import time
 import discord
 from logging import getLogger
-from db.mongo import init_mongo, load_queues_from_db
-from core.state import STATE, GLOBAL_Q_MEMBERS
+from db.mongo import MONGO_BREAKER, init_mongo, load_queues_from_db, get_meta, set_meta
+from config import LOOP_LAG_PROBE_SEC, METRICS_HOST, METRICS_PORT, MONGO_BREAKER_RESET_SEC, STATE_PREFETCH_LIMIT
+from core.metrics import start_lag_probe, start_metrics_server
+from core.membership import owns_guild
+from core.reconcile import start_reconciler
+from core.snapshot import load_snapshot, reconcile as reconcile_snapshot, start_snapshotter
+from core.state import STATE, GLOBAL_Q_MEMBERS, start_state_evictor
+from core.threads import resume_thread_cleanups
 
 log = getLogger("bot")
 
-async def on_ready(bot: discord.Client, guild_id: int | None):
-    log.info("bot_ready", extra={"user": str(bot.user), "id": getattr(bot.user, 'id', None)})
+PROCESS_STARTED = time.perf_counter()
+_BOOTSTRAPPED = False
+_CONNECTING: asyncio.Task | None = None
+_READY_COUNT = 0
+_FIRST_COMMAND_AT: float | None = None
+
+
+def command_tree_hash(bot: discord.Client, guild: discord.abc.Snowflake | None) -> str:
+    commands = sorted(
+        (cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands(guild=guild)),
+        key=lambda c: c.get("name", ""),
+    )
+    return hashlib.sha256(json.dumps(commands, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def sync_commands(bot: discord.Client, guild_id: int | None) -> bool:
+    """Sync the command tree only if it differs from what was last synced."""
+    guild = discord.Object(id=guild_id) if guild_id else None
+    if guild:
+        bot.tree.copy_global_to(guild=guild)
+    key = f"command_hash:{guild_id or 'global'}:{getattr(bot, 'application_id', None)}"
+    digest = command_tree_hash(bot, guild)
+    try:
+        stored = await get_meta(key)
+    except Exception as exc:
+        log.warning("command_hash_read_fail", extra={"err": repr(exc)})
+        stored = None
+    if stored and stored.get("hash") == digest:
+        log.info("command_sync_skipped", extra={"hash": digest[:12]})
+        return False
+    await bot.tree.sync(guild=guild)
+    try:
+        await set_meta(key, {"hash": digest})
+    except Exception as exc:
+        log.warning("command_hash_write_fail", extra={"err": repr(exc)})
+    log.info("command_sync_done", extra={"hash": digest[:12]})
+    return True
+
+
+async def connect(bot: discord.Client, guild_id: int | None, warm: bool):
+    """Connect to Mongo and load queue state, then resume cleanups and sync commands."""
+    started = time.perf_counter()
     await init_mongo()
-    await load_queues_from_db(STATE, GLOBAL_Q_MEMBERS)
+    MONGO_BREAKER.release()
+    outcome = await reconcile_snapshot() if warm else {}
+    await load_queues_from_db(STATE, GLOBAL_Q_MEMBERS, limit=STATE_PREFETCH_LIMIT, owns_guild=owns_guild)
     try:
-        if guild_id:
-            guild = discord.Object(id=guild_id)
-            bot.tree.copy_global_to(guild=guild)
-            await bot.tree.sync(guild=guild)
-        else:
-            await bot.tree.sync()
+        await resume_thread_cleanups(bot)
+    except Exception as exc:
+        log.warning("thread_cleanup_resume_fail", extra={"err": repr(exc)})
+    try:
+        await sync_commands(bot, guild_id)
     except Exception as e:
-        log.warning("command_sync_error", extra={"err": repr(e)})
\ No newline at end of file
+        log.warning("command_sync_error", extra={"err": repr(e)})
+    log.info(
+        "mongo_ready",
+        extra={"warm": warm, "channels": len(STATE), "elapsed": round(time.perf_counter() - started, 3), **outcome},
+    )
+
+
+async def _connect_in_background(bot: discord.Client, guild_id: int | None):
+    delay = MONGO_BREAKER_RESET_SEC
+    while True:
+        try:
+            await connect(bot, guild_id, warm=True)
+            return
+        except Exception as exc:
+            log.warning("warm_start_connect_fail", extra={"err": repr(exc), "retry_in": delay})
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+async def bootstrap(bot: discord.Client, guild_id: int | None):
+    """One-time startup, run from setup_hook before the gateway connects.
+
+    With a recent snapshot the bot serves it straight away: Mongo reads fail
+    fast ("try again") and writes queue until ``connect`` finishes in the
+    background. Otherwise startup waits for Mongo as before.
+    """
+    global _BOOTSTRAPPED, _CONNECTING
+    if _BOOTSTRAPPED:
+        return
+    started = time.perf_counter()
+    start_lag_probe(LOOP_LAG_PROBE_SEC)
+    try:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    except OSError as exc:
+        log.warning("metrics_server_fail", extra={"port": METRICS_PORT, "err": repr(exc)})
+    warm = load_snapshot(owns_guild=owns_guild) > 0
+    if warm:
+        MONGO_BREAKER.hold()
+        _CONNECTING = asyncio.create_task(_connect_in_background(bot, guild_id))
+    else:
+        await connect(bot, guild_id, warm=False)
+    start_state_evictor()
+    start_reconciler(bot)
+    start_snapshotter()
+    _BOOTSTRAPPED = True
+    log.info(
+        "bootstrap_done",
+        extra={"warm": warm, "channels": len(STATE), "elapsed": round(time.perf_counter() - started, 3)},
+    )
+
+
+async def on_ready(bot: discord.Client, guild_id: int | None):
+    """Fires on the first connect and again after gateway reconnects; keep it cheap."""
+    global _READY_COUNT
+    _READY_COUNT += 1
+    log.info(
+        "bot_ready",
+        extra={
+            "user": str(bot.user),
+            "id": getattr(bot.user, 'id', None),
+            "ready_count": _READY_COUNT,
+            "since_start": round(time.perf_counter() - PROCESS_STARTED, 3),
+        },
+    )
+    if not _BOOTSTRAPPED:
+        # setup_hook failed part-way (e.g. Mongo was down); retry the remaining steps.
+        await bootstrap(bot, guild_id)
+
+
+def note_interaction():
+    """Record time-to-first-command once per process."""
+    global _FIRST_COMMAND_AT
+    if _FIRST_COMMAND_AT is not None:
+        return
+    _FIRST_COMMAND_AT = time.perf_counter()
+    log.info("first_command", extra={"since_start": round(_FIRST_COMMAND_AT - PROCESS_STARTED, 3)})
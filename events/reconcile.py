@@ -0,0 +1,24 @@
+import discord
+
+from core import reconcile
+
+
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    await reconcile.embeds_deleted(payload.channel_id, (payload.message_id,))
+
+
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    await reconcile.embeds_deleted(payload.channel_id, payload.message_ids)
+
+
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    if isinstance(channel, discord.TextChannel):
+        await reconcile.channel_deleted(channel.id)
+
+
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    await reconcile.member_removed(payload.guild_id, payload.user.id)
+
+
+async def on_guild_remove(guild: discord.Guild):
+    await reconcile.guild_removed(guild.id, (c.id for c in guild.text_channels))
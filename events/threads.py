@@ -0,0 +1,12 @@
+import discord
+
+from core.threads import forget_thread, remember_thread
+
+
+async def on_thread_update(before: discord.Thread, after: discord.Thread):
+    remember_thread(after)
+
+
+async def on_raw_thread_delete(payload: discord.RawThreadDeleteEvent):
+    # Fires for every deletion, cached or not; on_thread_delete would count cached ones twice.
+    forget_thread(payload.thread_id)
@@ -1,24 +1,78 @@
 import discord
 from discord.ext import commands
-from config import DISCORD_TOKEN, GUILD_ID, LOG_LEVEL, LOG_FILE
-from logging_setup import setup_logging
-from commands.admin import setup_cmd, cancel_cmd
-from commands.user import join_cmd, leave_cmd
-from events.ready import on_ready as bootstrap_on_ready
+from config import (
+    DISCORD_TOKEN,
+    GUILD_ID,
+    LOG_ASYNC,
+    LOG_FILE,
+    LOG_JSON,
+    LOG_LEVEL,
+    LOG_SAMPLE_PER_SEC,
+    LOG_SAMPLE_PREFIXES,
+    SHARD_COUNT,
+    SHARD_IDS,
+)
+from logging_setup import setup_logging, stop_logging
+from commands.admin import setup_cmd, cancel_cmd, setrating_cmd, profile_cmd
+from commands.user import join_cmd, leave_cmd, history_cmd, stats_cmd
+from events.ready import bootstrap, note_interaction, on_ready as bootstrap_on_ready
+from events import reconcile as reconcile_events, threads as thread_events
+from core.dispatch import REST
+from core.metrics import stop_metrics_server
+from core.snapshot import write_snapshot
+from core.trace import TRACE
+from db.mongo import flush_queue_docs
 
-log = setup_logging(level=LOG_LEVEL, json_console=False, logfile=LOG_FILE)
+log = setup_logging(
+    level=LOG_LEVEL,
+    json_console=LOG_JSON,
+    logfile=LOG_FILE,
+    async_mode=LOG_ASYNC,
+    sample_prefixes=LOG_SAMPLE_PREFIXES,
+    sample_per_sec=LOG_SAMPLE_PER_SEC,
+)
 
 INTENTS = discord.Intents.default()
 INTENTS.guilds = True
 INTENTS.members = True
 
-bot = commands.Bot(command_prefix="!", intents=INTENTS)
+
+# With SHARD_COUNT set, each process runs the shards in SHARD_IDS (all of them if unset).
+_BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+
+
+class MatchmakerBot(_BotBase):
+    async def setup_hook(self):
+        try:
+            await bootstrap(self, GUILD_ID)
+        except Exception as exc:
+            # on_ready retries whatever did not complete.
+            log.warning("bootstrap_fail", extra={"err": repr(exc)})
+
+    async def close(self):
+        await super().close()
+        # Queue documents are written behind; make sure the last state reaches Mongo.
+        await flush_queue_docs()
+        # Written after the flush so the next start reconciles against what Mongo has.
+        await write_snapshot()
+        await TRACE.close()
+        await stop_metrics_server()
+        stop_logging()
+
+
+_shard_kwargs = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARD_COUNT else {}
+# The trace feeds Discord's rate-limit headers to the outbound REST dispatcher.
+bot = MatchmakerBot(command_prefix="!", intents=INTENTS, http_trace=REST.trace_config(), **_shard_kwargs)
 
 # Register commands on the bot tree
 bot.tree.add_command(setup_cmd)
 bot.tree.add_command(cancel_cmd)
+bot.tree.add_command(setrating_cmd)
+bot.tree.add_command(profile_cmd)
 bot.tree.add_command(join_cmd)
 bot.tree.add_command(leave_cmd)
+bot.tree.add_command(history_cmd)
+bot.tree.add_command(stats_cmd)
 
 @bot.event
 async def on_ready_event():
@@ -30,6 +84,20 @@ async def on_ready_event():
 async def on_ready():
     await on_ready_event()
 
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    note_interaction()
+
+# Keep the thread lookup cache in step with the gateway.
+bot.add_listener(thread_events.on_thread_update)
+bot.add_listener(thread_events.on_raw_thread_delete)
+# Apply deletions and departures as they happen instead of re-fetching on use.
+bot.add_listener(reconcile_events.on_raw_message_delete)
+bot.add_listener(reconcile_events.on_raw_bulk_message_delete)
+bot.add_listener(reconcile_events.on_guild_channel_delete)
+bot.add_listener(reconcile_events.on_raw_member_remove)
+bot.add_listener(reconcile_events.on_guild_remove)
+
 if __name__ == "__main__":
     if not DISCORD_TOKEN:
         raise RuntimeError("Missing DISCORD_TOKEN in environment.")
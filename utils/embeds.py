@@ -1,21 +1,136 @@
+import datetime as dt
+import hashlib
+from collections import OrderedDict
 import discord
-from typing import List
+from bson import ObjectId
+from bson.errors import InvalidId
+from typing import List, Optional, Tuple
 from config import QUEUE_SIZE
 
-def format_queue_lines(user_ids: List[int], guild: discord.Guild) -> list[str]:
-    lines: list[str] = []
-    for idx, uid in enumerate(user_ids, start=1):
-        m = guild.get_member(uid)
-        lines.append(f"{idx}. {m.mention if m else f'<@{uid}>'}")
+# Discord rejects descriptions over 4096 characters.
+EMBED_DESCRIPTION_LIMIT = 4096
+_MENTION_CACHE_SIZE = 50_000
+_MENTIONS: "OrderedDict[int, str]" = OrderedDict()
+
+def mention(uid: int) -> str:
+    """``<@uid>``, interned so hot queues don't re-format the same ids."""
+    text = _MENTIONS.get(uid)
+    if text is None:
+        text = _MENTIONS[uid] = f"<@{uid}>"
+        if len(_MENTIONS) > _MENTION_CACHE_SIZE:
+            _MENTIONS.popitem(last=False)
+    return text
+
+def format_queue_lines(user_ids: List[int], guild: Optional[discord.Guild] = None) -> list[str]:
+    # Member.mention is always "<@id>", so no member lookup is needed.
+    lines = [f"{idx}. {mention(uid)}" for idx, uid in enumerate(user_ids, start=1)]
     return lines or ["(empty)"]
 
-def build_queue_embed(channel: discord.TextChannel, user_ids: List[int]) -> discord.Embed:
-    filled = len(user_ids)
+def _more_line(remaining: int) -> str:
+    return f"... and {remaining} more"
+
+def _fit_lines(lines: List[str], total: int, limit: int) -> str:
+    """Join ``lines`` within ``limit`` chars, ending with "... and N more" when cut.
+
+    ``total`` is the full number of entries; ``lines`` may hold only a prefix.
+    """
+    used = 0
+    keep = 0
+    for line in lines:
+        with_line = used + len(line) + (1 if keep else 0)
+        remaining = total - keep - 1
+        if with_line + (1 + len(_more_line(remaining)) if remaining else 0) > limit:
+            break
+        used = with_line
+        keep += 1
+    if keep == total:
+        return "\n".join(lines)
+    return "\n".join(lines[:keep] + [_more_line(total - keep)])
+
+class QueueEmbedCache:
+    """Per-channel render cache for the queue embed.
+
+    Mentions are cached per user id and numbered lines per position. Appends
+    and removals are applied as diffs: lines before the first change are kept,
+    and only lines that are actually visible (within Discord's description
+    limit) are ever formatted. ``signature`` hashes what the embed would show, so callers
+    can skip no-op edits without building an Embed at all.
+    """
+
+    __slots__ = ("_ids", "_lines", "_description", "_signature", "stats")
+
+    def __init__(self):
+        self._ids: List[int] = []
+        self._lines: List[str] = []
+        self._description: Optional[str] = None
+        self._signature: Optional[tuple] = None
+        self.stats = {"appends": 0, "diffs": 0, "unchanged": 0, "lines_formatted": 0}
+
+    def update(self, user_ids: List[int]) -> bool:
+        """Sync to ``user_ids``; returns True if the visible list changed."""
+        old = self._ids
+        n_old = len(old)
+        if len(user_ids) == n_old and user_ids == old:
+            self.stats["unchanged"] += 1
+            return False
+        if len(user_ids) > n_old and user_ids[:n_old] == old:
+            start = n_old
+            self.stats["appends"] += 1
+        else:
+            start = 0
+            for start, (a, b) in enumerate(zip(old, user_ids)):
+                if a != b:
+                    break
+            else:
+                start = min(n_old, len(user_ids))
+            self.stats["diffs"] += 1
+        # Lines before the first change keep their text and numbering.
+        del self._lines[start:]
+        self._ids = list(user_ids)
+        self._description = None
+        self._signature = None
+        return True
+
+    @property
+    def size(self) -> int:
+        return len(self._ids)
+
+    def description(self) -> str:
+        if self._description is None:
+            ids, lines = self._ids, self._lines
+            used = sum(map(len, lines)) + len(lines)
+            # Format further lines only while they can still be shown.
+            while len(lines) < len(ids) and used <= EMBED_DESCRIPTION_LIMIT:
+                line = f"{len(lines) + 1}. {mention(ids[len(lines)])}"
+                lines.append(line)
+                used += len(line) + 1
+                self.stats["lines_formatted"] += 1
+            if not ids:
+                self._description = "(empty)"
+            elif len(lines) == len(ids) and used - 1 <= EMBED_DESCRIPTION_LIMIT:
+                self._description = "\n".join(lines)
+            else:
+                self._description = _fit_lines(lines, len(ids), EMBED_DESCRIPTION_LIMIT)
+        return self._description
+
+    def signature(self, channel: discord.TextChannel) -> str:
+        """Content hash of the embed for ``channel`` (ignores the timestamp)."""
+        icon = channel.guild.icon
+        context = (channel.name, icon.key if icon else None)
+        if self._signature is None or self._signature[0] != context:
+            key = f"{self.description()}\0{QUEUE_SIZE}\0{context[0]}\0{context[1]}"
+            self._signature = (context, hashlib.blake2b(key.encode(), digest_size=16).hexdigest())
+        return self._signature[1]
+
+    def build(self, channel: discord.TextChannel) -> discord.Embed:
+        return _queue_embed(channel, self.size, self.description())
+
+def _queue_embed(channel: discord.TextChannel, filled: int, description: str) -> discord.Embed:
     left = max(QUEUE_SIZE - filled, 0)
     color = 0x2ECC71 if filled == 0 else (0xF1C40F if filled < QUEUE_SIZE else 0xE74C3C)
     emb = discord.Embed(
         title=f"Matchmaking Queue — {filled}/{QUEUE_SIZE}",
-        description="\n".join(format_queue_lines(user_ids, channel.guild)),
+        description=description,
         color=color,
         timestamp=discord.utils.utcnow(),
     )
@@ -23,8 +138,74 @@ def build_queue_embed(channel: discord.TextChannel, user_ids: List[int]) -> disc
     emb.add_field(name="Channel", value=f"#{channel.name}", inline=True)
     emb.set_footer(text="Use /join or /leave")
     if channel.guild.icon:
-        emb.set_thumbnail(url=channel.guild.icon.url)
-        emb.set_author(name="Queue", icon_url=channel.guild.icon.url)
+        icon_url = channel.guild.icon.url
+        emb.set_thumbnail(url=icon_url)
+        emb.set_author(name="Queue", icon_url=icon_url)
     else:
         emb.set_author(name="Queue")
-    return emb
\ No newline at end of file
+    return emb
+
+def build_queue_embed(channel: discord.TextChannel, user_ids: List[int]) -> discord.Embed:
+    description = _fit_lines(format_queue_lines(user_ids), len(user_ids), EMBED_DESCRIPTION_LIMIT) if user_ids else "(empty)"
+    return _queue_embed(channel, len(user_ids), description)
+
+
+def history_cursor(created_at: dt.datetime, match_id: ObjectId) -> str:
+    """Opaque /history page cursor: the row's createdAt in epoch milliseconds and its _id."""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=dt.timezone.utc)
+    return f"{int(created_at.timestamp() * 1000)}-{match_id}"
+
+
+def parse_history_cursor(cursor: Optional[str]) -> Optional[Tuple[dt.datetime, Optional[ObjectId]]]:
+    """``(createdAt, _id)`` from a cursor; a bare millisecond cursor from older builds has no _id."""
+    if not cursor:
+        return None
+    millis, _, match_id = cursor.partition("-")
+    try:
+        created_at = dt.datetime.fromtimestamp(int(millis) / 1000, tz=dt.timezone.utc)
+        return created_at, ObjectId(match_id) if match_id else None
+    except (TypeError, ValueError, OverflowError, InvalidId):
+        return None
+
+
+def build_history_embed(guild: discord.Guild, matches: List[dict], page_size: int) -> discord.Embed:
+    emb = discord.Embed(title="Recent matches", color=0x3498DB)
+    lines: list[str] = []
+    size = 0
+    for match in matches:
+        created = match["createdAt"]
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=dt.timezone.utc)
+        players = match.get("players", [])
+        mentions = " ".join(f"<@{uid}>" for uid in players[:QUEUE_SIZE])
+        line = f"<t:{int(created.timestamp())}:R> in <#{match.get('channelId')}> ({len(players)}): {mentions}"
+        # Whole rows only; the cursor below resumes after the last row shown.
+        if lines and size + 1 + len(line) > 4000:
+            break
+        lines.append(line)
+        size += len(line) + (1 if size else 0)
+    emb.description = "\n".join(lines) or "(no matches yet)"
+    if lines and (len(matches) >= page_size or len(lines) < len(matches)):
+        last = matches[len(lines) - 1]
+        emb.set_footer(text=f"Older: /history before:{history_cursor(last['createdAt'], last['_id'])}")
+    if guild.icon:
+        emb.set_author(name=guild.name, icon_url=guild.icon.url)
+    else:
+        emb.set_author(name=guild.name)
+    return emb
+
+
+def build_stats_embed(member: discord.abc.User, player: Optional[dict], guild_totals: Optional[dict]) -> discord.Embed:
+    emb = discord.Embed(title=f"Stats — {member.display_name}", color=0x9B59B6)
+    games = (player or {}).get("games", 0)
+    emb.add_field(name="Games played", value=str(games), inline=True)
+    last = (player or {}).get("lastPlayedAt")
+    if last is not None:
+        if last.tzinfo is None:
+            last = last.replace(tzinfo=dt.timezone.utc)
+        emb.add_field(name="Last played", value=f"<t:{int(last.timestamp())}:R>", inline=True)
+    else:
+        emb.add_field(name="Last played", value="never", inline=True)
+    emb.add_field(name="Server matches", value=str((guild_totals or {}).get("matches", 0)), inline=True)
+    return emb